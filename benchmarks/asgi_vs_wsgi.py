@@ -0,0 +1,148 @@
+"""Compare requests/sec of gunicorn sync workers against uvicorn workers.
+
+Both servers are started against an offline Stripe stub that adds a fixed
+latency to every API call, so the numbers show how many payment calls a worker
+can keep in flight. The database from the usual env vars must already contain
+the item/order used in ``--path``.
+
+    python benchmarks/asgi_vs_wsgi.py --path /intent/item/1/ --concurrency 100
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from myapp.stripe_stub import StripeStubServer  # noqa: E402
+
+SERVERS = {
+    "wsgi": ["src.wsgi:application"],
+    "asgi": ["src.asgi:application", "-k", "uvicorn_worker.UvicornWorker"],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+async def run_load(url, concurrency, duration):
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+
+        async def worker():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+    return latencies, errors, elapsed
+
+
+def benchmark(mode, args, stub_url):
+    port = free_port()
+    env = {
+        **os.environ,
+        "SERVER_MODE": mode,
+        # gunicorn.conf.py would otherwise turn the WSGI side into gthread workers.
+        "GUNICORN_WORKER_CLASS": "sync",
+        "STRIPE_API_BASE": stub_url,
+        "STRIPE_SECRET_KEY_USD": "sk_test_stub",
+        "STRIPE_PUBLIC_KEY_USD": "pk_test_stub",
+        "STRIPE_SECRET_KEY_RUB": "sk_test_stub",
+        "STRIPE_PUBLIC_KEY_RUB": "pk_test_stub",
+    }
+    command = [
+        sys.executable,
+        "-m",
+        "gunicorn",
+        *SERVERS[mode],
+        "--workers",
+        str(args.workers),
+        "--bind",
+        f"127.0.0.1:{port}",
+        "--log-level",
+        "warning",
+    ]
+    server = subprocess.Popen(command, cwd=BASE_DIR, env=env)
+    try:
+        wait_for_port(port)
+        latencies, errors, elapsed = asyncio.run(
+            run_load(f"http://127.0.0.1:{port}{args.path}", args.concurrency, args.duration)
+        )
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) * 1000 if latencies else 0,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", default="/intent/item/1/")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--stripe-latency", type=float, default=0.3)
+    parser.add_argument("--modes", nargs="+", default=list(SERVERS), choices=list(SERVERS))
+    args = parser.parse_args()
+
+    with StripeStubServer(latency=args.stripe_latency) as stub:
+        results = [benchmark(mode, args, stub.url) for mode in args.modes]
+
+    print(f"{'mode':<6} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for result in results:
+        print(
+            f"{result['mode']:<6} {result['requests']:>9} {result['errors']:>7} "
+            f"{result['rps']:>9.1f} {result['p50']:>9.1f} {result['p95']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Measure rows/sec and peak memory of the import_catalog/export_catalog commands.
+
+Generates ``--rows`` items and as many orders (three lines each), imports them
+and exports them again, running every step in a fresh process so its peak RSS
+can be reported. Use a scratch database from the usual env vars; item and
+order ids 1..rows are created on the first run and updated on later runs.
+
+    python benchmarks/catalog_io.py --rows 100000 --format jsonl
+"""
+
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+STEP = """
+import resource, sys
+import django
+django.setup()
+from django.core.management import call_command
+call_command(*sys.argv[1:])
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, file=sys.stderr)
+"""
+
+
+def write_items(path, fmt, rows):
+    fields = ["id", "name", "description", "price", "currency"]
+    with open(path, "w", newline="") as stream:
+        writer = csv.DictWriter(stream, fieldnames=fields) if fmt == "csv" else None
+        if writer:
+            writer.writeheader()
+        for pk in range(1, rows + 1):
+            row = {
+                "id": pk,
+                "name": f"Item {pk}",
+                "description": "",
+                "price": f"{pk % 500 + 1}.99",
+                "currency": "USD",
+            }
+            if writer:
+                writer.writerow(row)
+            else:
+                stream.write(json.dumps(row) + "\n")
+
+
+def write_orders(path, fmt, rows):
+    fields = ["id", "currency", "discount", "tax", "lines"]
+    with open(path, "w", newline="") as stream:
+        writer = csv.DictWriter(stream, fieldnames=fields) if fmt == "csv" else None
+        if writer:
+            writer.writeheader()
+        for pk in range(1, rows + 1):
+            lines = [
+                {"item": (pk + offset) % rows + 1, "quantity": offset + 1} for offset in range(3)
+            ]
+            row = {"id": pk, "currency": "USD", "discount": None, "tax": None, "lines": lines}
+            if writer:
+                writer.writerow({**row, "discount": "", "tax": "", "lines": json.dumps(lines)})
+            else:
+                stream.write(json.dumps(row) + "\n")
+
+
+def run_step(*command_args):
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", STEP, *command_args],
+        cwd=BASE_DIR,
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - started
+    if result.returncode:
+        raise SystemExit(result.stderr)
+    peak_kb = int(result.stderr.strip().splitlines()[-1])
+    return elapsed, peak_kb
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "src.settings")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        items = f"{tmpdir}/items.{args.format}"
+        orders = f"{tmpdir}/orders.{args.format}"
+        write_items(items, args.format, args.rows)
+        write_orders(orders, args.format, args.rows)
+
+        batch = ["--batch-size", str(args.batch_size)]
+        steps = [
+            ("import item", ["import_catalog", "item", items, *batch]),
+            ("import order", ["import_catalog", "order", orders, *batch]),
+            (
+                "export item",
+                ["export_catalog", "item", f"{tmpdir}/out-items.{args.format}", *batch],
+            ),
+            (
+                "export order",
+                ["export_catalog", "order", f"{tmpdir}/out-orders.{args.format}", *batch],
+            ),
+        ]
+
+        print(f"{'step':<13} {'rows':>9} {'seconds':>9} {'rows/s':>10} {'peak MB':>9}")
+        for name, command_args in steps:
+            elapsed, peak_kb = run_step(*command_args)
+            print(
+                f"{name:<13} {args.rows:>9} {elapsed:>9.2f} "
+                f"{args.rows / elapsed:>10.0f} {peak_kb / 1024:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Measure connection-setup cost on the item_detail/order_detail request paths.
+
+Each ``POSTGRES_CONNECTIONS`` mode (``off``, ``persistent``, ``pool``) runs in
+its own process against the database from the usual env vars. The process drives
+the WSGI handler from several threads like gunicorn does, and reports how
+often and how long Django spent opening (or borrowing) a connection per
+request. The database needs at least one item and one order, e.g. from
+``python manage.py loadtest --seed-data --duration 0``.
+
+    docker compose -f docker-compose-services.yml up -d postgresql
+    python benchmarks/db_connections.py --concurrency 8 --duration 10
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+MODES = ("off", "persistent", "pool")
+
+STEP = """
+import json, sys, threading, time
+import django
+django.setup()
+from django.db import connection, connections
+from django.urls import reverse
+from myapp import loadtest
+from myapp.models import Item, Order
+
+concurrency, duration = int(sys.argv[1]), float(sys.argv[2])
+item, order = Item.objects.first(), Order.objects.first()
+if item is None or order is None:
+    sys.exit("The database needs at least one item and one order.")
+specs = [
+    {"method": "GET", "path": reverse("item_detail", args=[item.pk])},
+    {"method": "GET", "path": reverse("order_detail", args=[order.pk])},
+]
+connection.close()
+
+lock = threading.Lock()
+connects = [0, 0.0]
+wrapper = type(connections["default"])
+get_new_connection = wrapper.get_new_connection
+
+def timed_get_new_connection(self, params):
+    started = time.perf_counter()
+    try:
+        return get_new_connection(self, params)
+    finally:
+        with lock:
+            connects[0] += 1
+            connects[1] += time.perf_counter() - started
+
+wrapper.get_new_connection = timed_get_new_connection
+loadtest.run_step("wsgi", specs, concurrency, min(duration, 2.0))
+connects[:] = [0, 0.0]
+step = loadtest.run_step("wsgi", specs, concurrency, duration)
+step["connects"], step["connect_seconds"] = connects
+print(json.dumps(step))
+"""
+
+
+def run_mode(mode, concurrency, duration):
+    env = {**os.environ, "POSTGRES_CONNECTIONS": mode}
+    env.setdefault("DJANGO_SETTINGS_MODULE", "src.settings")
+    result = subprocess.run(
+        [sys.executable, "-c", STEP, str(concurrency), str(duration)],
+        cwd=BASE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise SystemExit(result.stderr)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    print(
+        f"{'mode':<11} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+        f"{'connects/req':>13} {'connect ms/req':>15}"
+    )
+    for mode in args.modes.split(","):
+        step = run_mode(mode, args.concurrency, args.duration)
+        requests = step["requests"] or 1
+        print(
+            f"{mode:<11} {step['requests']:>9} {step['rps']:>8.1f} {step['p50_ms']:>8.1f} "
+            f"{step['p95_ms']:>8.1f} {step['connects'] / requests:>13.2f} "
+            f"{step['connect_seconds'] * 1000 / requests:>15.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
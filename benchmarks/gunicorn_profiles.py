@@ -0,0 +1,103 @@
+"""Compare requests/sec of the old single sync worker with the gunicorn.conf.py profiles.
+
+Every profile starts gunicorn with ``gunicorn.conf.py`` and differs only in the
+``GUNICORN_*``/``SERVER_MODE`` env vars. ``default`` reproduces the old bare
+``gunicorn src.wsgi:application``: one sync worker, no preload, no recycling.
+Each profile is loaded on every path in ``--paths`` against an offline Stripe
+stub. The client keeps connections alive, as nginx now does upstream. The
+database from the usual env vars must already contain the item and order in
+``--paths``.
+
+    python benchmarks/gunicorn_profiles.py --paths /item/1/,/order/1/ --concurrency 64
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+
+from asgi_vs_wsgi import BASE_DIR, free_port, run_load, wait_for_port
+from myapp.stripe_stub import StripeStubServer
+
+PROFILES = {
+    "default": {
+        "GUNICORN_WORKER_CLASS": "sync",
+        "GUNICORN_WORKERS": "1",
+        "GUNICORN_PRELOAD": "0",
+        "GUNICORN_MAX_REQUESTS": "0",
+    },
+    "sync": {"GUNICORN_WORKER_CLASS": "sync"},
+    "gthread": {"GUNICORN_WORKER_CLASS": "gthread"},
+    "uvicorn": {"SERVER_MODE": "asgi"},
+}
+
+
+def benchmark(profile, args, stub_url):
+    port = free_port()
+    env = {
+        **os.environ,
+        "SERVER_MODE": "wsgi",
+        **PROFILES[profile],
+        "GUNICORN_BIND": f"127.0.0.1:{port}",
+        "GUNICORN_LOG_LEVEL": "warning",
+        "STRIPE_API_BASE": stub_url,
+        "STRIPE_SECRET_KEY_USD": "sk_test_stub",
+        "STRIPE_PUBLIC_KEY_USD": "pk_test_stub",
+        "STRIPE_SECRET_KEY_RUB": "sk_test_stub",
+        "STRIPE_PUBLIC_KEY_RUB": "pk_test_stub",
+    }
+    command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"]
+    server = subprocess.Popen(command, cwd=BASE_DIR, env=env)
+    results = []
+    try:
+        wait_for_port(port)
+        for path in args.paths.split(","):
+            latencies, errors, elapsed = asyncio.run(
+                run_load(f"http://127.0.0.1:{port}{path}", args.concurrency, args.duration)
+            )
+            latencies.sort()
+            results.append(
+                {
+                    "profile": profile,
+                    "path": path,
+                    "requests": len(latencies),
+                    "errors": errors,
+                    "rps": len(latencies) / elapsed,
+                    "p50": statistics.median(latencies) * 1000 if latencies else 0,
+                    "p95": latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0,
+                }
+            )
+    finally:
+        server.terminate()
+        server.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paths", default="/item/1/,/order/1/")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--stripe-latency", type=float, default=0.3)
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    args = parser.parse_args()
+
+    with StripeStubServer(latency=args.stripe_latency) as stub:
+        results = [row for profile in args.profiles for row in benchmark(profile, args, stub.url)]
+
+    print(
+        f"{'profile':<8} {'path':<14} {'requests':>9} {'errors':>7} "
+        f"{'req/s':>9} {'p50 ms':>9} {'p95 ms':>9}"
+    )
+    for result in results:
+        print(
+            f"{result['profile']:<8} {result['path']:<14} {result['requests']:>9} "
+            f"{result['errors']:>7} {result['rps']:>9.1f} {result['p50']:>9.1f} "
+            f"{result['p95']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
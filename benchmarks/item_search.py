@@ -0,0 +1,113 @@
+"""Compare item search via the tsvector/GIN index with the old admin ILIKE search.
+
+Fills the database from the usual env vars up to ``--rows`` items of random
+words, then runs each query ``--repeat`` times three ways: the stock admin
+``search_fields`` lookup (``ILIKE '%word%'`` on name and description), the
+admin search through ``myapp.search``, and the ranked top 50 that
+``/api/items/search/`` returns. Each way reads the first changelist/API page,
+as the views do. On SQLite both sides run the LIKE fallback, so the comparison
+only means something on Postgres. ``--explain`` prints the query plans.
+
+    python benchmarks/item_search.py --rows 200000 --queries "red cap,cotton,blue mug"
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+WORDS = (
+    "red blue green black white cotton linen wool leather canvas cap shirt mug bag "
+    "scarf sock jacket bottle notebook poster sticker large small classic slim "
+    "organic vintage sport travel winter summer"
+).split()
+PAGE = 50
+
+
+def seed(rows, rng):
+    from myapp.models import Item
+
+    missing = rows - Item.objects.count()
+    batch = []
+    for _ in range(max(missing, 0)):
+        batch.append(
+            Item(
+                name=" ".join(rng.choices(WORDS, k=3)).capitalize(),
+                description=" ".join(rng.choices(WORDS, k=20)),
+                price=rng.randint(100, 50000) / 100,
+                currency=rng.choice(["USD", "RUB"]),
+            )
+        )
+        if len(batch) == 5000:
+            Item.objects.bulk_create(batch)
+            batch = []
+    Item.objects.bulk_create(batch)
+    return max(missing, 0)
+
+
+def timed(query, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = list(query())
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000, len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--queries", default="red cap,cotton shirt,vintage,leath")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--explain", action="store_true")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "src.settings")
+    import django
+
+    django.setup()
+    from django.contrib import admin
+    from django.db import connection
+    from django.test import RequestFactory
+    from myapp import search
+    from myapp.models import Item
+
+    created = seed(args.rows, random.Random(args.seed))
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE myapp_item")
+    print(f"{connection.vendor}: {Item.objects.count()} items ({created} created)")
+
+    item_admin = admin.site._registry[Item]
+    request = RequestFactory().get("/admin/myapp/item/")
+    items = Item.objects.order_by("-created_at", "-id")
+
+    def ilike(term):
+        queryset, _ = admin.ModelAdmin.get_search_results(item_admin, request, items, term)
+        return queryset[:PAGE]
+
+    def admin_search(term):
+        return item_admin.get_search_results(request, items, term)[0][:PAGE]
+
+    def ranked(term):
+        return search.search_items(Item.objects.all(), term)[:PAGE]
+
+    ways = [("ILIKE (old admin)", ilike), ("tsvector admin", admin_search), ("ranked API", ranked)]
+    print(f"{'query':<16} {'way':<18} {'rows':>5} {'p50 ms':>9}")
+    for term in args.queries.split(","):
+        for name, build in ways:
+            p50, count = timed(lambda: build(term), args.repeat)
+            print(f"{term:<16} {name:<18} {count:>5} {p50:>9.2f}")
+            if args.explain:
+                print(build(term).explain(), end="\n\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Micro-benchmark for pricing ``--orders`` orders with ``myapp.pricing``.
+
+Without ``--db`` it prices random line sums in memory: the integer minor-unit
+engine against the previous Decimal arithmetic. With ``--db`` it also prices
+the first ``--orders`` orders of the database from the usual env vars, once
+with batched aggregate queries (``price_orders``) and once with one query per
+order.
+
+    python benchmarks/pricing.py --orders 10000 --db
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from decimal import ROUND_HALF_UP, Decimal
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+
+def decimal_total(items_total, discount_percent, tax_percent):
+    subtotal = items_total - items_total * discount_percent / Decimal("100")
+    total = subtotal + subtotal * tax_percent / Decimal("100")
+    return total.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def bench_memory(count, seed):
+    from myapp import pricing
+
+    rng = random.Random(seed)
+    rows = [
+        (
+            Decimal(rng.randint(0, 10**8)) / 100,
+            Decimal(rng.randint(0, 5000)) / 100,
+            Decimal(rng.randint(0, 3000)) / 100,
+        )
+        for _ in range(count)
+    ]
+
+    def minor_units():
+        return [pricing.breakdown(pricing.to_minor(total), d, t) for total, d, t in rows]
+
+    def decimals():
+        return [decimal_total(total, d, t) for total, d, t in rows]
+
+    minor_seconds, priced = timed(minor_units)
+    decimal_seconds, expected = timed(decimals)
+    mismatches = sum(
+        pricing.from_minor(prices["total_amount"]) != total
+        for prices, total in zip(priced, expected)
+    )
+    return [
+        ("in-memory minor units", minor_seconds, count),
+        ("in-memory Decimal", decimal_seconds, count),
+    ], mismatches
+
+
+def bench_db(count):
+    import django
+
+    django.setup()
+    from myapp import pricing
+    from myapp.models import Order
+    from myapp.order_totals import BATCH_SIZE, chunked
+
+    order_ids = list(Order.objects.order_by("pk").values_list("pk", flat=True)[:count])
+
+    def batched():
+        prices = {}
+        for chunk in chunked(order_ids, BATCH_SIZE):
+            prices.update(pricing.price_orders(Order.objects.filter(pk__in=chunk)))
+        return prices
+
+    def per_order():
+        return {pk: pricing.price_orders(Order.objects.filter(pk=pk))[pk] for pk in order_ids}
+
+    batched_seconds, batched_prices = timed(batched)
+    per_order_seconds, per_order_prices = timed(per_order)
+    if batched_prices != per_order_prices:
+        raise SystemExit("Batched and per-order prices differ")
+    return [
+        (f"db, batches of {BATCH_SIZE}", batched_seconds, len(order_ids)),
+        ("db, query per order", per_order_seconds, len(order_ids)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", action="store_true", help="Also price orders from the DB.")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "src.settings")
+    results, mismatches = bench_memory(args.orders, args.seed)
+    if args.db:
+        results += bench_db(args.orders)
+
+    print(f"{'step':<26} {'orders':>8} {'seconds':>9} {'orders/s':>11}")
+    for name, seconds, count in results:
+        rate = count / seconds if seconds else 0
+        print(f"{name:<26} {count:>8} {seconds:>9.3f} {rate:>11.0f}")
+    print(f"Totals differing from Decimal arithmetic: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
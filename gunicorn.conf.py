@@ -0,0 +1,93 @@
+"""Gunicorn settings for production, sized from the CPU count and env vars.
+
+    gunicorn -c gunicorn.conf.py
+
+SERVER_MODE=asgi serves ``src.asgi`` with uvicorn workers; otherwise
+``GUNICORN_WORKER_CLASS`` picks ``gthread`` (default) or ``sync`` for
+``src.wsgi``. gthread workers keep nginx's upstream connections alive and let
+one process wait on several Stripe calls. The app is preloaded in the master,
+so workers share its imported code copy-on-write. Each worker is recycled
+after about ``GUNICORN_MAX_REQUESTS`` requests; the jitter keeps them from
+restarting all at once. With ``PROMETHEUS_MULTIPROC_DIR`` set, the workers'
+/metrics histograms are summed from files in that directory (myapp.perf).
+"""
+
+import os
+import shutil
+
+
+def _cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _env_int(name, default):
+    return int(os.getenv(name) or default)
+
+
+cpus = _cpu_count()
+asgi = os.getenv("SERVER_MODE", "wsgi") == "asgi"
+worker_kind = "uvicorn" if asgi else os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+
+if worker_kind == "uvicorn":
+    wsgi_app = "src.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+    default_workers = cpus
+elif worker_kind == "gthread":
+    wsgi_app = "src.wsgi:application"
+    worker_class = "gthread"
+    default_workers = cpus + 1
+elif worker_kind == "sync":
+    wsgi_app = "src.wsgi:application"
+    worker_class = "sync"
+    default_workers = 2 * cpus + 1
+else:
+    raise RuntimeError(f"Unknown GUNICORN_WORKER_CLASS: {worker_kind}")
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = _env_int("GUNICORN_WORKERS", default_workers)
+threads = _env_int("GUNICORN_THREADS", 4 if worker_kind == "gthread" else 1)
+# Backlog of accepted connections per worker for the async/threaded workers.
+worker_connections = _env_int("GUNICORN_WORKER_CONNECTIONS", 1000)
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+max_requests = _env_int("GUNICORN_MAX_REQUESTS", 2000)
+max_requests_jitter = _env_int("GUNICORN_MAX_REQUESTS_JITTER", max_requests // 10)
+
+# Above STRIPE_REQUEST_BUDGET, so a slow Stripe gets a 503 before the worker is killed.
+timeout = _env_int("GUNICORN_TIMEOUT", 30)
+graceful_timeout = _env_int("GUNICORN_GRACEFUL_TIMEOUT", 30)
+# Longer than nginx's upstream keepalive_timeout, so nginx closes idle connections first.
+keepalive = _env_int("GUNICORN_KEEPALIVE", 75)
+
+# Heartbeat files on tmpfs; a disk-backed /tmp in Docker can stall workers.
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+accesslog = "-" if os.getenv("GUNICORN_ACCESS_LOG") == "1" else None
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+def post_fork(server, worker):
+    # The master imported the app but made no requests. Give each worker its own
+    # Stripe HTTP pools instead of sharing the master's across the fork. Django
+    # connects to the database (and opens its pool) lazily, so that already
+    # happens in the worker.
+    from myapp import stripe_clients
+
+    stripe_clients.build_clients()
+
+
+def on_starting(server):
+    # Files left by the previous run would be summed into this run's histograms.
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
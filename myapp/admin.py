@@ -1,7 +1,8 @@
 from django.contrib import admin
 
-from .forms import OrderForm
-from .models import Discount, Item, Order, Tax
+from . import pricing, search, stripe_objects
+from .forms import OrderForm, OrderLineFormSet
+from .models import Discount, Item, Order, OrderLine, PaymentIntentRecord, StripeEvent, Tax
 
 
 @admin.register(Item)
@@ -9,7 +10,15 @@ class ItemAdmin(admin.ModelAdmin):
     list_display = ("id", "name", "description", "price", "currency")
     list_filter = ("currency",)
     search_fields = ("name", "description")
-    ordering = ("-created_at",)
+    readonly_fields = ("stripe_product_id", "stripe_price_id", "stripe_synced_at")
+    ordering = ("-created_at", "-id")
+
+    def get_search_results(self, request, queryset, search_term):
+        # Also used by the item autocomplete on orders. search_fields stays set so
+        # the changelist shows a search box.
+        if not search_term.strip():
+            return queryset, False
+        return search.search_items(queryset, search_term, ranked=False), False
 
 
 @admin.register(Tax)
@@ -18,6 +27,11 @@ class TaxAdmin(admin.ModelAdmin):
     search_fields = ("name",)
     ordering = ("name",)
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and "percent" in form.changed_data:
+            stripe_objects.invalidate_tax(obj.id)
+
 
 @admin.register(Discount)
 class DiscountAdmin(admin.ModelAdmin):
@@ -25,20 +39,99 @@ class DiscountAdmin(admin.ModelAdmin):
     search_fields = ("name",)
     ordering = ("name",)
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and "percent" in form.changed_data:
+            stripe_objects.invalidate_discount(obj.id)
+
+
+def _total_buckets(currency, bounds):
+    edges = (None, *bounds, None)
+    for low, high in zip(edges, edges[1:]):
+        if low is None:
+            value, label = f"lt{high}", f"under {high}"
+        elif high is None:
+            value, label = f"gte{low}", f"{low} and over"
+        else:
+            value, label = f"{low}-{high}", f"{low} to {high}"
+        yield f"{currency}:{value}", f"{currency} {label}", (currency, low, high)
+
+
+class TotalAmountFilter(admin.SimpleListFilter):
+    title = "total price"
+    parameter_name = "total"
+
+    # Totals are only comparable within a currency, so every bucket belongs to one,
+    # with bounds in that currency's units.
+    bounds = {
+        "USD": (100, 500, 1000),
+        "RUB": (10000, 50000, 100000),
+    }
+    buckets = [
+        bucket
+        for currency, currency_bounds in bounds.items()
+        for bucket in _total_buckets(currency, currency_bounds)
+    ]
+    ranges = {value: bucket_range for value, _, bucket_range in buckets}
+
+    def lookups(self, request, model_admin):
+        return [(value, label) for value, label, _ in self.buckets]
+
+    def queryset(self, request, queryset):
+        if self.value() not in self.ranges:
+            return queryset
+        currency, low, high = self.ranges[self.value()]
+        queryset = queryset.filter(currency=currency)
+        if low is not None:
+            queryset = queryset.filter(total_amount__gte=low)
+        if high is not None:
+            queryset = queryset.filter(total_amount__lt=high)
+        return queryset
+
+
+class OrderLineInline(admin.TabularInline):
+    model = OrderLine
+    formset = OrderLineFormSet
+    fields = ("item", "quantity", "unit_price")
+    readonly_fields = ("unit_price",)
+    autocomplete_fields = ("item",)
+    extra = 1
+
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     form = OrderForm
 
-    list_display = ("id", "currency", "total_price_display", "discount_display", "tax_display")
-    list_filter = ("currency",)
-    ordering = ("-created_at",)
-    filter_horizontal = ("items",)
+    list_display = (
+        "id",
+        "currency",
+        "total_price_display",
+        "discount_display",
+        "tax_display",
+        "payment_status",
+    )
+    list_filter = ("currency", "payment_status", TotalAmountFilter)
+    list_select_related = ("discount", "tax")
+    readonly_fields = ("payment_status", "price_breakdown")
+    ordering = ("-created_at", "-id")
+    inlines = (OrderLineInline,)
 
     def total_price_display(self, obj):
-        return f"{obj.total_price()} {obj.currency}"
+        return f"{obj.total_amount} {obj.currency}"
 
     total_price_display.short_description = "Total Price"
+    total_price_display.admin_order_field = "total_amount"
+
+    def price_breakdown(self, obj):
+        if obj.pk is None:
+            return "-"
+        prices = pricing.order_breakdown(obj)
+        return (
+            f"{prices['items_total']} - {prices['discount_amount']} "
+            f"+ {prices['tax_amount']} = {prices['total_amount']} {obj.currency}"
+        )
+
+    price_breakdown.short_description = "Price breakdown"
 
     def discount_display(self, obj):
         if obj.discount:
@@ -53,3 +146,19 @@ class OrderAdmin(admin.ModelAdmin):
         return "-"
 
     tax_display.short_description = "Tax"
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "event_id", "type", "status", "attempts", "created_at", "processed_at")
+    list_filter = ("status", "type")
+    search_fields = ("event_id",)
+    readonly_fields = ("event_id", "type", "payload", "attempts", "last_error", "processed_at")
+
+
+@admin.register(PaymentIntentRecord)
+class PaymentIntentRecordAdmin(admin.ModelAdmin):
+    list_display = ("id", "stripe_id", "kind", "object_id", "amount", "currency", "status")
+    list_filter = ("status", "kind", "currency")
+    search_fields = ("stripe_id", "session_key")
+    readonly_fields = ("session_key", "fingerprint", "stripe_id", "client_secret")
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class MyappConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "myapp"
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import perf, signals, stripe_clients  # noqa: F401
+
+        stripe_clients.build_clients()
+        connection_created.connect(perf.trace_queries)
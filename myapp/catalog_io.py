@@ -0,0 +1,199 @@
+"""Streaming JSONL/CSV import and export for catalog and order data.
+
+Rows are read and written one at a time and applied in fixed-size batches, so
+memory use does not depend on the file size. Each exported row carries every
+column of its model; order rows embed their lines as
+``[{"item": id, "quantity": n, "unit_price": "9.99"}, ...]`` (a JSON string in
+the ``lines`` column for CSV).
+"""
+
+import csv
+import json
+
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import stripe_objects
+from .models import Discount, Item, Order, OrderLine, Tax
+from .order_totals import chunked, refresh_order_totals, snapshot_unit_prices
+
+BATCH_SIZE = 1000
+
+MODELS = {
+    "item": Item,
+    "discount": Discount,
+    "tax": Tax,
+    "order": Order,
+}
+
+FIELDS = {
+    "item": ["id", "name", "description", "price", "currency"],
+    "discount": ["id", "name", "percent"],
+    "tax": ["id", "name", "percent"],
+    "order": ["id", "currency", "discount", "tax", "lines"],
+}
+
+FORMATS = ("jsonl", "csv")
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return "csv" if str(path).lower().endswith(".csv") else "jsonl"
+
+
+def read_rows(stream, fmt):
+    if fmt == "csv":
+        for row in csv.DictReader(stream):
+            if "lines" in row:
+                row["lines"] = json.loads(row["lines"] or "[]")
+            yield row
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_rows(stream, fmt, kind, rows):
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(stream, fieldnames=FIELDS[kind])
+        writer.writeheader()
+        for row in rows:
+            if "lines" in row:
+                row["lines"] = json.dumps(row["lines"], cls=DjangoJSONEncoder)
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            stream.write(json.dumps(row, cls=DjangoJSONEncoder) + "\n")
+            count += 1
+    return count
+
+
+def export_rows(kind, batch_size=BATCH_SIZE):
+    if kind != "order":
+        rows = MODELS[kind].objects.order_by("pk").values(*FIELDS[kind])
+        yield from rows.iterator(chunk_size=batch_size)
+        return
+
+    orders = Order.objects.order_by("pk").prefetch_related("lines")
+    for order in orders.iterator(chunk_size=batch_size):
+        yield {
+            "id": order.pk,
+            "currency": order.currency,
+            "discount": order.discount_id,
+            "tax": order.tax_id,
+            "lines": [
+                {"item": line.item_id, "quantity": line.quantity, "unit_price": line.unit_price}
+                for line in order.lines.all()
+            ],
+        }
+
+
+def _build(kind, row):
+    model = MODELS[kind]
+    values = {}
+    for name in FIELDS[kind]:
+        if name == "lines" or name not in row:
+            continue
+        field = model._meta.get_field(name)
+        value = row[name]
+        if value == "" and (field.null or field.primary_key):
+            value = None
+        values[field.attname] = None if value is None else field.to_python(value)
+    return model(**values)
+
+
+def _build_lines(order, lines):
+    return [
+        OrderLine(
+            order_id=order.pk,
+            item_id=int(line["item"]),
+            quantity=int(line.get("quantity") or 1),
+            unit_price=OrderLine._meta.get_field("unit_price").to_python(
+                line.get("unit_price") or None
+            ),
+        )
+        for line in lines
+    ]
+
+
+def _import_batch(kind, rows):
+    model = MODELS[kind]
+    objs = [_build(kind, row) for row in rows]
+
+    ids = [obj.pk for obj in objs if obj.pk is not None]
+    if kind in ("discount", "tax"):
+        existing = dict(model.objects.filter(pk__in=ids).values_list("pk", "percent"))
+    else:
+        existing = dict.fromkeys(model.objects.filter(pk__in=ids).values_list("pk", flat=True))
+
+    to_create = [obj for obj in objs if obj.pk not in existing]
+    to_update = [obj for obj in objs if obj.pk in existing]
+
+    update_fields = [name for name in FIELDS[kind] if name not in ("id", "lines")]
+    if hasattr(model, "updated_at"):
+        now = timezone.now()
+        for obj in to_update:
+            obj.updated_at = now
+        update_fields.append("updated_at")
+    if hasattr(model, "stripe_dirty"):
+        # bulk_update skips Item.save(); the built objects carry stripe_dirty=True.
+        update_fields.append("stripe_dirty")
+
+    model.objects.bulk_create(to_create)
+    if to_update:
+        model.objects.bulk_update(to_update, update_fields)
+
+    if kind == "order":
+        OrderLine.objects.filter(order_id__in=[obj.pk for obj in to_update]).delete()
+        lines = []
+        for obj, row in zip(objs, rows):
+            lines.extend(_build_lines(obj, row.get("lines") or []))
+        OrderLine.objects.bulk_create(lines)
+        order_ids = [obj.pk for obj in objs]
+        snapshot_unit_prices(order_id__in=order_ids)
+        refresh_order_totals(order_ids)
+    elif kind in ("discount", "tax"):
+        changed = [obj.pk for obj in to_update if obj.percent != existing[obj.pk]]
+        invalidate = (
+            stripe_objects.invalidate_discount
+            if kind == "discount"
+            else stripe_objects.invalidate_tax
+        )
+        for pk in changed:
+            invalidate(pk)
+        refresh_order_totals(
+            Order.objects.filter(**{f"{kind}_id__in": changed}).values_list("pk", flat=True)
+        )
+
+    return len(to_create), len(to_update)
+
+
+def reset_sequences(*models):
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def import_rows(kind, rows, batch_size=BATCH_SIZE):
+    """Insert or update ``rows`` in batches; each batch is its own transaction.
+
+    Rows whose ``id`` already exists are updated, the rest are inserted.
+    Returns ``(created, updated)``.
+    """
+    created = updated = 0
+    for batch in chunked(rows, batch_size):
+        with transaction.atomic():
+            batch_created, batch_updated = _import_batch(kind, batch)
+        created += batch_created
+        updated += batch_updated
+
+    models = [MODELS[kind], OrderLine] if kind == "order" else [MODELS[kind]]
+    reset_sequences(*models)
+    return created, updated
@@ -0,0 +1,198 @@
+"""Incremental sync of ``Item`` rows to Stripe Products and Prices.
+
+An item is synced while its ``stripe_dirty`` flag is set. New, saved and
+imported items get the flag, and each run first flags the items synced to
+another Stripe account than the currency's current one. Batches are read
+through a partial index on the flag, so a run over an up-to-date catalog
+touches no other rows. Stripe calls run on a thread pool; the DB is read and
+written from the calling thread, one batch at a time. A 429 from Stripe pauses
+every worker, not just the one that hit it.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import stripe
+from django.db.models import F, Q
+
+from . import pricing, stripe_clients
+from .models import Item
+
+BATCH_SIZE = 100
+WORKERS = 4
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+SYNC_FIELDS = [
+    "stripe_product_id",
+    "stripe_price_id",
+    "stripe_unit_amount",
+    "stripe_account",
+    "stripe_synced_at",
+]
+
+
+class Backoff:
+    """Pause shared by all workers while Stripe is rate limiting us."""
+
+    def __init__(self, base=BACKOFF_BASE, maximum=BACKOFF_MAX, sleep=time.sleep):
+        self.base = base
+        self.maximum = maximum
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+        self._failures = 0
+
+    def wait(self):
+        with self._lock:
+            delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            self.sleep(delay)
+
+    def rate_limited(self):
+        with self._lock:
+            self._failures += 1
+            delay = min(self.maximum, self.base * 2 ** (self._failures - 1))
+            delay *= random.uniform(0.5, 1.0)
+            self._resume_at = max(self._resume_at, time.monotonic() + delay)
+
+    def succeeded(self):
+        with self._lock:
+            self._failures = 0
+
+    def call(self, func, *args, max_retries=MAX_RETRIES):
+        for attempt in range(max_retries + 1):
+            self.wait()
+            try:
+                result = func(*args)
+            except stripe.RateLimitError:
+                if attempt == max_retries:
+                    raise
+                self.rate_limited()
+            else:
+                self.succeeded()
+                return result
+
+
+def unsynced_items(currency):
+    return Item.objects.filter(currency=currency, stripe_dirty=True)
+
+
+def flag_moved_items(currency, account):
+    """Flag the items last synced to an account other than ``account``."""
+    # Two ranges instead of "<>", so item_currency_account_idx can serve it.
+    moved = Q(stripe_account__lt=account) | Q(stripe_account__gt=account)
+    return Item.objects.filter(moved, currency=currency, stripe_dirty=False).update(
+        stripe_dirty=True
+    )
+
+
+def _idempotency_key(kind, item, account, unit_amount):
+    return f"catalog-{kind}-{item.pk}-{account}-{unit_amount}-{item.updated_at.timestamp()}"
+
+
+def sync_item(client, account, item, backoff, max_retries=MAX_RETRIES):
+    """Create or update the Product/Price for ``item``; returns the synced fields."""
+    unit_amount = pricing.to_minor(item.price)
+    product_data = {"name": item.name, "metadata": {"item_id": str(item.pk)}}
+    if item.description:
+        product_data["description"] = item.description
+    price_data = {"currency": item.currency.lower(), "unit_amount": unit_amount}
+
+    def request(method, *args):
+        return backoff.call(method, *args, max_retries=max_retries)
+
+    product_id = item.stripe_product_id if item.stripe_account == account else ""
+    price_id = item.stripe_price_id if product_id else ""
+
+    if not product_id:
+        product = request(
+            client.products.create,
+            {**product_data, "default_price_data": price_data},
+            {"idempotency_key": _idempotency_key("product", item, account, unit_amount)},
+        )
+        product_id, price_id = product.id, product.default_price
+    else:
+        old_price_id = ""
+        if item.stripe_unit_amount != unit_amount:
+            # Prices are immutable; point the product at a new one.
+            price = request(
+                client.prices.create,
+                {**price_data, "product": product_id},
+                {"idempotency_key": _idempotency_key("price", item, account, unit_amount)},
+            )
+            old_price_id, price_id = price_id, price.id
+            product_data["default_price"] = price_id
+        request(client.products.update, product_id, product_data)
+        if old_price_id:
+            # A product's default price cannot be archived, so this follows the update.
+            request(client.prices.update, old_price_id, {"active": False})
+
+    return {
+        "stripe_product_id": product_id,
+        "stripe_price_id": price_id,
+        "stripe_unit_amount": unit_amount,
+        "stripe_account": account,
+        "stripe_synced_at": item.updated_at,
+    }
+
+
+def sync_catalog(
+    batch_size=BATCH_SIZE, workers=WORKERS, max_retries=MAX_RETRIES, backoff=None, log=None
+):
+    """Sync every stale item of every configured account.
+
+    Returns ``(synced, failed)``. Failed items keep their old state and are
+    retried on the next run.
+    """
+    backoff = backoff or Backoff()
+    synced = failed = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        currencies = Item.objects.order_by("currency").values_list("currency", flat=True)
+        for currency in currencies.distinct():
+            client = stripe_clients.get_client(currency)
+            if client is None:
+                if log:
+                    log(f"Skipping {currency}: no Stripe key configured.")
+                continue
+            account = stripe_clients.get_account(currency)
+            flag_moved_items(currency, account)
+
+            last_pk = 0
+            while True:
+                stale = unsynced_items(currency).filter(pk__gt=last_pk)
+                batch = list(stale.order_by("pk")[:batch_size])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+
+                futures = [
+                    (item, executor.submit(sync_item, client, account, item, backoff, max_retries))
+                    for item in batch
+                ]
+                changed = []
+                for item, future in futures:
+                    try:
+                        fields = future.result()
+                    except stripe.StripeError as e:
+                        failed += 1
+                        if log:
+                            log(f"Item {item.pk}: {e}")
+                        continue
+                    for name, value in fields.items():
+                        setattr(item, name, value)
+                    changed.append(item)
+
+                # bulk_update leaves updated_at alone. Items edited since they were
+                # read no longer match stripe_synced_at and stay flagged.
+                Item.objects.bulk_update(changed, SYNC_FIELDS)
+                Item.objects.filter(
+                    pk__in=[item.pk for item in changed], updated_at=F("stripe_synced_at")
+                ).update(stripe_dirty=False)
+                synced += len(changed)
+
+    return synced, failed
@@ -0,0 +1,100 @@
+from . import checkout_cache, pricing, stripe_clients
+
+
+def synced_price_id(item, unit_price):
+    """Stripe Price id for ``item`` if sync_stripe_catalog made one for this exact price."""
+    if not item.stripe_price_id or item.stripe_synced_at is None:
+        return None
+    if item.updated_at > item.stripe_synced_at:
+        return None
+    if item.stripe_account != stripe_clients.get_account(item.currency):
+        return None
+    if item.stripe_unit_amount != pricing.to_minor(unit_price):
+        return None
+    return item.stripe_price_id
+
+
+def line_item(item, unit_price, quantity):
+    price_id = synced_price_id(item, unit_price)
+    if price_id:
+        return {"price": price_id, "quantity": quantity}
+    return {
+        "price_data": {
+            "currency": item.currency.lower(),
+            "product_data": {"name": item.name},
+            "unit_amount": pricing.to_minor(unit_price),
+        },
+        "quantity": quantity,
+    }
+
+
+def item_session_params(request, item):
+    return {
+        "payment_method_types": ["card"],
+        "line_items": [line_item(item, item.price, 1)],
+        "mode": "payment",
+        "metadata": {"item_id": str(item.id)},
+        "success_url": request.build_absolute_uri(f"/success/item/{item.id}/"),
+        "cancel_url": request.build_absolute_uri(f"/item/{item.id}/"),
+    }
+
+
+def item_fingerprint(item, params):
+    return checkout_cache.content_fingerprint(
+        item.currency,
+        stripe_clients.get_account(item.currency),
+        {"params": params, "generation": item.checkout_generation},
+    )
+
+
+def order_session_params(request, order):
+    line_items = [
+        line_item(line.item, line.unit_price, line.quantity) for line in order.lines.all()
+    ]
+
+    return {
+        "payment_method_types": ["card"],
+        "line_items": line_items,
+        "discounts": [],
+        "mode": "payment",
+        "client_reference_id": str(order.id),
+        "metadata": {"order_id": str(order.id)},
+        "success_url": request.build_absolute_uri(f"/success/order/{order.id}/"),
+        "cancel_url": request.build_absolute_uri(f"/order/{order.id}"),
+    }
+
+
+def order_fingerprint(order, params):
+    return checkout_cache.content_fingerprint(
+        order.currency,
+        stripe_clients.get_account(order.currency),
+        {
+            "params": params,
+            "discount": (
+                [order.discount.id, order.discount.name, order.discount.percent]
+                if order.discount
+                else None
+            ),
+            "tax": [order.tax.id, order.tax.name, order.tax.percent] if order.tax else None,
+            "generation": order.checkout_generation,
+        },
+    )
+
+
+def apply_order_adjustments(params, coupon_id, tax_rate_id):
+    if coupon_id:
+        params["discounts"] = [{"coupon": coupon_id}]
+    if tax_rate_id:
+        for line_item in params["line_items"]:
+            line_item["tax_rates"] = [tax_rate_id]
+    return params
+
+
+def order_intent_content(order):
+    return {
+        "lines": [
+            [line.item_id, line.quantity, str(line.unit_price)] for line in order.lines.all()
+        ],
+        "discount": str(order.discount.percent) if order.discount else None,
+        "tax": str(order.tax.percent) if order.tax else None,
+    }
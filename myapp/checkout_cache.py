@@ -0,0 +1,145 @@
+"""Reuse of open Checkout Sessions per buyer and content.
+
+Entries and idempotency keys are scoped to the buyer's Django session key, so
+two buyers never share a session. The fingerprint covers the object's
+``checkout_generation``, which ``invalidate`` bumps in the database once a
+payment completes: cached entries stop matching and the next idempotency key
+differs, so Stripe cannot replay the session that was just paid.
+"""
+
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+
+from .models import Item, Order
+
+CACHE_KEY_PREFIX = "checkout-session"
+
+MODELS = {"item": Item, "order": Order}
+
+
+def _cache():
+    return caches[settings.CHECKOUT_SESSION_CACHE_ALIAS]
+
+
+def _cache_key(kind, object_id, buyer):
+    return f"{CACHE_KEY_PREFIX}:{kind}:{object_id}:{buyer}"
+
+
+def content_fingerprint(currency, account, content):
+    payload = json.dumps(
+        {"currency": currency, "account": account, "content": content},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def expiry_window(now=None):
+    """Return ``(window_start, expires_at)`` for the current reuse window.
+
+    Every request inside one window sends the same ``expires_at`` and
+    idempotency key, so concurrent cache misses collapse into one session.
+    """
+    now = int(now if now is not None else time.time())
+    window_start = now - now % settings.CHECKOUT_SESSION_REUSE_WINDOW
+    return window_start, window_start + settings.CHECKOUT_SESSION_TTL
+
+
+def idempotency_key(purpose, fingerprint, window_start):
+    return f"{purpose}-{fingerprint}-{window_start}"
+
+
+def _session_id_from_entry(entry, fingerprint, now):
+    if not entry or entry["fingerprint"] != fingerprint:
+        return None
+    if entry["expires_at"] - settings.CHECKOUT_SESSION_EXPIRY_MARGIN <= now:
+        return None
+    return entry["session_id"]
+
+
+def _entry_timeout(expires_at, now):
+    return int(expires_at - settings.CHECKOUT_SESSION_EXPIRY_MARGIN - now)
+
+
+def get_cached_session_id(kind, object_id, buyer, fingerprint, now=None):
+    now = now if now is not None else time.time()
+    entry = _cache().get(_cache_key(kind, object_id, buyer))
+    return _session_id_from_entry(entry, fingerprint, now)
+
+
+async def aget_cached_session_id(kind, object_id, buyer, fingerprint, now=None):
+    now = now if now is not None else time.time()
+    entry = await _cache().aget(_cache_key(kind, object_id, buyer))
+    return _session_id_from_entry(entry, fingerprint, now)
+
+
+def store_session_id(kind, object_id, buyer, fingerprint, session_id, expires_at, now=None):
+    now = now if now is not None else time.time()
+    timeout = _entry_timeout(expires_at, now)
+    if timeout <= 0:
+        return
+    _cache().set(
+        _cache_key(kind, object_id, buyer),
+        {"fingerprint": fingerprint, "session_id": session_id, "expires_at": expires_at},
+        timeout=timeout,
+    )
+
+
+async def astore_session_id(kind, object_id, buyer, fingerprint, session_id, expires_at, now=None):
+    now = now if now is not None else time.time()
+    timeout = _entry_timeout(expires_at, now)
+    if timeout <= 0:
+        return
+    await _cache().aset(
+        _cache_key(kind, object_id, buyer),
+        {"fingerprint": fingerprint, "session_id": session_id, "expires_at": expires_at},
+        timeout=timeout,
+    )
+
+
+def get_or_create_session_id(kind, object_id, buyer, fingerprint, create):
+    """Return ``buyer``'s open Checkout Session id for this content, creating one on a miss.
+
+    ``create`` is called as ``create(idempotency_key=..., expires_at=...)`` and
+    must return the created Stripe session.
+    """
+    now = time.time()
+    session_id = get_cached_session_id(kind, object_id, buyer, fingerprint, now=now)
+    if session_id:
+        return session_id
+
+    window_start, expires_at = expiry_window(now)
+    session = create(
+        idempotency_key=idempotency_key(f"checkout-{kind}-{buyer}", fingerprint, window_start),
+        expires_at=expires_at,
+    )
+    store_session_id(kind, object_id, buyer, fingerprint, session.id, expires_at, now=now)
+    return session.id
+
+
+async def aget_or_create_session_id(kind, object_id, buyer, fingerprint, create):
+    """Async variant of ``get_or_create_session_id``; ``create`` must be a coroutine function."""
+    now = time.time()
+    session_id = await aget_cached_session_id(kind, object_id, buyer, fingerprint, now=now)
+    if session_id:
+        return session_id
+
+    window_start, expires_at = expiry_window(now)
+    session = await create(
+        idempotency_key=idempotency_key(f"checkout-{kind}-{buyer}", fingerprint, window_start),
+        expires_at=expires_at,
+    )
+    await astore_session_id(kind, object_id, buyer, fingerprint, session.id, expires_at, now=now)
+    return session.id
+
+
+def invalidate(kind, object_id):
+    """Retire every buyer's session for the object by bumping its ``checkout_generation``."""
+    MODELS[kind].objects.filter(pk=object_id).update(
+        checkout_generation=F("checkout_generation") + 1
+    )
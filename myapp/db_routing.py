@@ -0,0 +1,83 @@
+"""Send reads of read-only pages to replicas, everything else to the primary.
+
+``ReplicaRoutingMiddleware`` opens a routing state for each request and lets
+reads use a replica only for the views in ``REPLICA_VIEWS`` (and admin
+changelists). The first write of a request pins the rest of it to the
+primary, and the response then sets a cookie that keeps the browser on the
+primary for ``REPLICA_PIN_SECONDS``. That way a page shown right after
+checkout never reads from a replica that has not caught up yet.
+Outside a request (commands, workers, shell) every query goes to the primary.
+"""
+
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PRIMARY = "default"
+
+# Sessions, users and admin log entries are written on login and on every
+# admin action; reading them back from a lagging replica logs people out.
+PRIMARY_APPS = {"sessions", "auth", "admin", "contenttypes"}
+
+_state = ContextVar("db_routing_state", default=None)
+
+
+def start():
+    """Open the routing state for the current request; returns a reset token."""
+    return _state.set({"use_replicas": False, "wrote": False})
+
+
+def allow_replicas():
+    state = _state.get()
+    if state is not None:
+        state["use_replicas"] = True
+
+
+def finish(token):
+    state = _state.get()
+    _state.reset(token)
+    return state
+
+
+def pin_primary():
+    """Send every further query of the current request to the primary."""
+    state = _state.get()
+    if state is not None:
+        state["wrote"] = True
+
+
+def replica_view(request):
+    match = request.resolver_match
+    if match is None or request.method not in ("GET", "HEAD"):
+        return False
+    if match.url_name in settings.REPLICA_VIEWS:
+        return True
+    return match.app_name == "admin" and match.url_name.endswith("_changelist")
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (
+            state is None
+            or not state["use_replicas"]
+            or state["wrote"]
+            or not settings.REPLICA_DATABASES
+            or model._meta.app_label in PRIMARY_APPS
+        ):
+            return PRIMARY
+        return random.choice(settings.REPLICA_DATABASES)
+
+    def db_for_write(self, model, **hints):
+        pin_primary()
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.REPLICA_DATABASES
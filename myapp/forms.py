@@ -7,18 +7,19 @@ from .models import Order
 class OrderForm(forms.ModelForm):
     class Meta:
         model = Order
-        fields = "__all__"
+        fields = ("discount", "tax", "currency")
 
-    def clean(self):
-        cleaned_data = super().clean()
-        currency = cleaned_data.get("currency")
-        items = cleaned_data.get("items")
 
-        if currency and items:
-            for item in items:
-                if item.currency != currency:
-                    raise ValidationError(
-                        f"Валюта товара '{item.name}' ({item.currency}) не совпадает с валютой заказа ({currency})."
-                    )
+class OrderLineFormSet(forms.BaseInlineFormSet):
+    def clean(self):
+        super().clean()
+        currency = self.instance.currency
 
-        return cleaned_data
+        for form in self.forms:
+            if not hasattr(form, "cleaned_data") or form.cleaned_data.get("DELETE"):
+                continue
+            item = form.cleaned_data.get("item")
+            if currency and item and item.currency != currency:
+                raise ValidationError(
+                    f"Валюта товара '{item.name}' ({item.currency}) не совпадает с валютой заказа ({currency})."
+                )
@@ -0,0 +1,337 @@
+"""Offline load testing for the ``loadtest`` management command.
+
+A workload is a list of request specs ``{"method", "path", "body",
+"content_type"}``. It is either read from a JSONL trace (recorded by
+``TraceRecordMiddleware`` or written with ``--save-trace``) or generated from
+the items and orders in the database. Requests go straight into Django's WSGI
+or ASGI handler in this process, or over HTTP to ``--base-url``. Per-request DB
+query counts are only available in-process.
+"""
+
+import asyncio
+import io
+import itertools
+import json
+import math
+import random
+import sys
+import threading
+import time
+from contextvars import ContextVar
+
+import httpx
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.urls import Resolver404, resolve, reverse
+
+from .models import Item, Order
+
+HOST = "localhost"
+
+_query_counter = ContextVar("loadtest_query_counter", default=None)
+
+
+def load_trace(path):
+    with open(path, encoding="utf-8") as stream:
+        specs = [json.loads(line) for line in stream if line.strip()]
+    for spec in specs:
+        spec.setdefault("method", "GET")
+    return specs
+
+
+def save_trace(path, specs):
+    with open(path, "w", encoding="utf-8") as stream:
+        for spec in specs:
+            stream.write(json.dumps(spec) + "\n")
+
+
+def generate_workload(count, seed=0):
+    """Build ``count`` GET requests across the shop routes for existing rows."""
+    item_ids = list(Item.objects.values_list("pk", flat=True)[:1000])
+    order_ids = list(Order.objects.values_list("pk", flat=True)[:1000])
+    if not item_ids:
+        return []
+
+    routes = [
+        ("index", None, 1),
+        ("item_detail", item_ids, 4),
+        ("buy_item", item_ids, 2),
+        ("item_detail_intent", item_ids, 1),
+        ("item_intent_secret", item_ids, 1),
+    ]
+    if order_ids:
+        routes += [
+            ("order_detail", order_ids, 3),
+            ("buy_order", order_ids, 2),
+            ("order_detail_intent", order_ids, 1),
+            ("order_intent_secret", order_ids, 1),
+        ]
+
+    rng = random.Random(seed)
+    weights = [weight for _, _, weight in routes]
+    specs = []
+    for name, ids, _ in rng.choices(routes, weights=weights, k=count):
+        args = [rng.choice(ids)] if ids else []
+        specs.append({"method": "GET", "path": reverse(name, args=args)})
+    return specs
+
+
+def route_name(path):
+    try:
+        match = resolve(path.partition("?")[0])
+    except Resolver404:
+        return "<unresolved>"
+    return match.url_name or match.view_name
+
+
+def _count_query(execute, sql, params, many, context):
+    counter = _query_counter.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _install_query_counter(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def start_query_counting():
+    connection_created.connect(_install_query_counter)
+    for connection in connections.all(initialized_only=True):
+        _install_query_counter(connection)
+
+
+def stop_query_counting():
+    connection_created.disconnect(_install_query_counter)
+    for connection in connections.all(initialized_only=True):
+        if _count_query in connection.execute_wrappers:
+            connection.execute_wrappers.remove(_count_query)
+
+
+def _split(spec):
+    path, _, query = spec["path"].partition("?")
+    body = (spec.get("body") or "").encode()
+    return path, query, body
+
+
+def call_wsgi(handler, spec):
+    path, query, body = _split(spec)
+    environ = {
+        "REQUEST_METHOD": spec["method"],
+        "PATH_INFO": path,
+        "QUERY_STRING": query,
+        "SCRIPT_NAME": "",
+        "SERVER_NAME": HOST,
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "HTTP_HOST": HOST,
+        "REMOTE_ADDR": "127.0.0.1",
+        "CONTENT_TYPE": spec.get("content_type", ""),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    statuses = []
+
+    def start_response(status, headers, exc_info=None):
+        statuses.append(int(status.split()[0]))
+
+    response = handler(environ, start_response)
+    try:
+        for _ in response:
+            pass
+    finally:
+        response.close()
+    return statuses[0]
+
+
+async def call_asgi(handler, spec):
+    path, query, body = _split(spec)
+    headers = [(b"host", HOST.encode())]
+    if spec.get("content_type"):
+        headers.append((b"content-type", spec["content_type"].encode()))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": spec["method"],
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": headers,
+        "client": ("127.0.0.1", 0),
+        "server": (HOST, 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    statuses = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # Never disconnect; Django stops listening once the response is sent.
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    await handler(scope, receive, send)
+    return statuses[0]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def add(self, route, status, seconds, queries):
+        with self._lock:
+            self.samples.append((route, status, seconds, queries))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(samples, elapsed):
+    routes = {}
+    for route, status, seconds, queries in samples:
+        routes.setdefault(route, []).append((status, seconds, queries))
+
+    summary = {}
+    for route, rows in sorted(routes.items()):
+        latencies = [seconds * 1000 for _, seconds, _ in rows]
+        queries = [count for _, _, count in rows if count is not None]
+        summary[route] = {
+            "requests": len(rows),
+            "errors": sum(1 for status, _, _ in rows if not status or status >= 400),
+            "rps": len(rows) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "queries": sum(queries) / len(queries) if queries else None,
+        }
+    return summary
+
+
+def _next_spec(specs):
+    cycle = itertools.cycle(specs)
+    lock = threading.Lock()
+
+    def take():
+        with lock:
+            return next(cycle)
+
+    return take
+
+
+def run_wsgi(specs, concurrency, duration, recorder):
+    handler = WSGIHandler()
+    take = _next_spec(specs)
+    deadline = time.monotonic() + duration
+
+    def worker():
+        while time.monotonic() < deadline:
+            spec = take()
+            counter = [0]
+            token = _query_counter.set(counter)
+            started = time.perf_counter()
+            try:
+                status = call_wsgi(handler, spec)
+            except Exception:
+                status = 0
+            finally:
+                _query_counter.reset(token)
+            recorder.add(
+                route_name(spec["path"]), status, time.perf_counter() - started, counter[0]
+            )
+        connections.close_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+async def _run_async(specs, concurrency, duration, recorder, call, count_queries=True):
+    take = _next_spec(specs)
+    deadline = time.monotonic() + duration
+
+    async def worker():
+        while time.monotonic() < deadline:
+            spec = take()
+            counter = [0] if count_queries else None
+            _query_counter.set(counter)
+            started = time.perf_counter()
+            try:
+                status = await call(spec)
+            except Exception:
+                status = 0
+            queries = counter[0] if counter else None
+            recorder.add(route_name(spec["path"]), status, time.perf_counter() - started, queries)
+
+    await asyncio.gather(*(asyncio.create_task(worker()) for _ in range(concurrency)))
+
+
+def run_asgi(specs, concurrency, duration, recorder):
+    handler = ASGIHandler()
+    asyncio.run(
+        _run_async(specs, concurrency, duration, recorder, lambda spec: call_asgi(handler, spec))
+    )
+
+
+def run_http(base_url, specs, concurrency, duration, recorder):
+    async def main():
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+
+            async def call(spec):
+                headers = {"Content-Type": spec["content_type"]} if spec.get("content_type") else {}
+                response = await client.request(
+                    spec["method"], spec["path"], content=spec.get("body"), headers=headers
+                )
+                return response.status_code
+
+            await _run_async(specs, concurrency, duration, recorder, call, count_queries=False)
+
+    asyncio.run(main())
+
+
+RUNNERS = {"wsgi": run_wsgi, "asgi": run_asgi}
+
+
+def run_step(server, specs, concurrency, duration, base_url=None):
+    recorder = Recorder()
+    started = time.monotonic()
+    if base_url:
+        run_http(base_url, specs, concurrency, duration, recorder)
+    else:
+        RUNNERS[server](specs, concurrency, duration, recorder)
+    elapsed = time.monotonic() - started
+
+    latencies = [seconds * 1000 for _, _, seconds, _ in recorder.samples]
+    return {
+        "concurrency": concurrency,
+        "requests": len(recorder.samples),
+        "errors": sum(1 for _, status, _, _ in recorder.samples if not status or status >= 400),
+        "rps": len(recorder.samples) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "routes": summarize(recorder.samples, elapsed),
+    }
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from myapp.catalog_io import BATCH_SIZE, FORMATS, MODELS, detect_format, export_rows, write_rows
+
+
+class Command(BaseCommand):
+    help = "Stream items, discounts, taxes or orders (with lines) to a JSONL or CSV file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", choices=sorted(MODELS))
+        parser.add_argument("path", nargs="?", default="-", help="Output file, '-' for stdout.")
+        parser.add_argument("--format", choices=FORMATS, help="Defaults to the file extension.")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, model, path, format, batch_size, **options):
+        fmt = detect_format(path, format)
+        rows = export_rows(model, batch_size)
+
+        if path == "-":
+            count = write_rows(self.stdout, fmt, model, rows)
+        else:
+            with open(path, "w", newline="", encoding="utf-8") as stream:
+                count = write_rows(stream, fmt, model, rows)
+
+        self.stderr.write(self.style.SUCCESS(f"Exported {count} {model} rows."))
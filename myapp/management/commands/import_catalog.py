@@ -0,0 +1,36 @@
+import sys
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from myapp.catalog_io import BATCH_SIZE, FORMATS, MODELS, detect_format, import_rows, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream items, discounts, taxes or orders (with lines) from a JSONL or CSV file. "
+        "Rows with an existing id are updated; each batch is committed separately."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", choices=sorted(MODELS))
+        parser.add_argument("path", help="Input file, '-' for stdin.")
+        parser.add_argument("--format", choices=FORMATS, help="Defaults to the file extension.")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, model, path, format, batch_size, **options):
+        fmt = detect_format(path, format)
+
+        try:
+            if path == "-":
+                created, updated = import_rows(model, read_rows(sys.stdin, fmt), batch_size)
+            else:
+                with open(path, newline="", encoding="utf-8") as stream:
+                    created, updated = import_rows(model, read_rows(stream, fmt), batch_size)
+        except (ValueError, KeyError, ValidationError, DatabaseError) as e:
+            raise CommandError(f"Import of {model} rows failed: {e}") from e
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Imported {model} rows: {created} created, {updated} updated.")
+        )
@@ -0,0 +1,146 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from myapp import loadtest, stripe_clients
+from myapp.models import Discount, Item, Order, Tax
+from myapp.stripe_stub import StripeStubServer
+
+
+def concurrency_steps(value):
+    try:
+        steps = [int(step) for step in value.split(",")]
+    except ValueError:
+        steps = []
+    if not steps or min(steps) < 1:
+        raise CommandError("--concurrency must be a comma-separated list of positive integers.")
+    return steps
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a JSONL request trace (or a generated workload) against the app with an "
+        "offline Stripe stub, ramping concurrency and reporting latency percentiles, "
+        "throughput and DB queries per route."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--trace", help="JSONL trace to replay instead of a generated workload."
+        )
+        parser.add_argument("--save-trace", help="Write the workload to this JSONL file.")
+        parser.add_argument("--requests", type=int, default=1000, help="Generated workload size.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for the workload.")
+        parser.add_argument(
+            "--seed-data",
+            action="store_true",
+            help="Create a small catalog with orders first if the database has no items.",
+        )
+        parser.add_argument(
+            "--server",
+            choices=sorted(loadtest.RUNNERS),
+            default=settings.SERVER_MODE,
+            help="In-process handler to drive (defaults to SERVER_MODE).",
+        )
+        parser.add_argument(
+            "--base-url",
+            help="Send requests over HTTP to a running server instead of in-process. "
+            "That server must point STRIPE_API_BASE at its own stub.",
+        )
+        parser.add_argument("--concurrency", type=concurrency_steps, default=[1, 8, 32])
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds per step.")
+        parser.add_argument("--stripe-latency", type=float, default=0.05)
+        parser.add_argument("--json", dest="json_path", help="Also write results to this file.")
+
+    def handle(self, *args, **options):
+        if options["seed_data"] and not Item.objects.exists():
+            self.seed_data()
+
+        if options["trace"]:
+            specs = loadtest.load_trace(options["trace"])
+        else:
+            specs = loadtest.generate_workload(options["requests"], options["seed"])
+        if not specs:
+            raise CommandError("Empty workload: pass --trace or add items (see --seed-data).")
+        if options["save_trace"]:
+            loadtest.save_trace(options["save_trace"], specs)
+
+        if options["base_url"]:
+            steps = [
+                loadtest.run_step(None, specs, c, options["duration"], options["base_url"])
+                for c in options["concurrency"]
+            ]
+            target = options["base_url"]
+        else:
+            if options["server"] == "asgi" and not settings.ASYNC_VIEWS:
+                self.stderr.write("Note: SERVER_MODE is not 'asgi', so sync views are served.")
+            steps = self.run_in_process(specs, options)
+            target = f"in-process {options['server']}"
+
+        self.report(target, steps)
+        if options["json_path"]:
+            with open(options["json_path"], "w", encoding="utf-8") as stream:
+                json.dump({"target": target, "steps": steps}, stream, indent=2)
+
+    def run_in_process(self, specs, options):
+        with StripeStubServer(latency=options["stripe_latency"]) as stub:
+            stripe_keys = {
+                currency: {**keys, "secret": keys.get("secret") or "sk_test_stub"}
+                for currency, keys in settings.STRIPE_KEYS.items()
+            }
+            # One process, so a local breaker is enough; trips against the stub must not
+            # reach the shared Redis breaker of a real deployment.
+            caches_setting = {
+                **settings.CACHES,
+                settings.STRIPE_BREAKER_CACHE_ALIAS: {
+                    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                    "LOCATION": "loadtest-stripe-breaker",
+                },
+            }
+            with override_settings(
+                STRIPE_API_BASE=stub.url, STRIPE_KEYS=stripe_keys, CACHES=caches_setting
+            ):
+                stripe_clients.build_clients()
+                loadtest.start_query_counting()
+                try:
+                    return [
+                        loadtest.run_step(options["server"], specs, c, options["duration"])
+                        for c in options["concurrency"]
+                    ]
+                finally:
+                    loadtest.stop_query_counting()
+                    stripe_clients.build_clients()
+
+    def seed_data(self):
+        tax = Tax.objects.create(name="VAT", percent=20)
+        discount = Discount.objects.create(name="Load test", percent=10)
+        items = [
+            Item.objects.create(name=f"Load test item {i}", price=10 + i, currency="USD")
+            for i in range(20)
+        ]
+        for i in range(5):
+            order = Order.objects.create(currency="USD", tax=tax, discount=discount)
+            order.items.add(*items[i * 3 : i * 3 + 3], through_defaults={"quantity": i + 1})
+        self.stderr.write("Seeded 20 items and 5 orders.")
+
+    def report(self, target, steps):
+        self.stdout.write(f"Target: {target}")
+        for step in steps:
+            self.stdout.write(
+                f"\nconcurrency={step['concurrency']} requests={step['requests']} "
+                f"errors={step['errors']} rps={step['rps']:.1f} p50={step['p50_ms']:.1f}ms "
+                f"p95={step['p95_ms']:.1f}ms p99={step['p99_ms']:.1f}ms"
+            )
+            self.stdout.write(
+                f"  {'route':<28} {'reqs':>6} {'errs':>5} {'req/s':>8} "
+                f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}"
+            )
+            for route, row in step["routes"].items():
+                queries = "-" if row["queries"] is None else f"{row['queries']:.1f}"
+                self.stdout.write(
+                    f"  {route:<28} {row['requests']:>6} {row['errors']:>5} {row['rps']:>8.1f} "
+                    f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} "
+                    f"{queries:>8}"
+                )
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.stripe_events import BATCH_SIZE, process_batch
+
+
+class Command(BaseCommand):
+    help = "Drain the Stripe webhook event queue and update order payment status."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            "--interval", type=float, default=1.0, help="Seconds to wait when the queue is empty."
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit once the queue is empty instead of polling."
+        )
+
+    def handle(self, *args, batch_size, interval, once, **options):
+        processed = 0
+        try:
+            while True:
+                count = process_batch(batch_size)
+                processed += count
+                if count >= batch_size:
+                    continue
+                if once:
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} events."))
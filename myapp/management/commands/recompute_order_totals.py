@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.models import Order
+from myapp.order_totals import BATCH_SIZE, chunked, stale_orders
+
+
+class Command(BaseCommand):
+    help = "Backfill or verify the stored items_total/total_amount columns on Order."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only report orders with stale totals; exit with an error if any are found.",
+        )
+
+    def handle(self, *args, batch_size, verify, **options):
+        order_ids = Order.objects.order_by("pk").values_list("pk", flat=True)
+
+        checked = 0
+        stale_count = 0
+        for chunk in chunked(order_ids.iterator(chunk_size=batch_size), batch_size):
+            stale = stale_orders(chunk)
+            checked += len(chunk)
+            stale_count += len(stale)
+            if verify:
+                for order in stale:
+                    self.stdout.write(
+                        f"Order {order.id}: expected items_total={order.items_total} "
+                        f"total_amount={order.total_amount}"
+                    )
+            elif stale:
+                Order.objects.bulk_update(stale, ["items_total", "total_amount"])
+
+        if verify and stale_count:
+            raise CommandError(f"{stale_count} of {checked} orders have stale totals.")
+
+        action = "Verified" if verify else "Recomputed"
+        self.stdout.write(
+            self.style.SUCCESS(f"{action} {checked} orders, {stale_count} were stale.")
+        )
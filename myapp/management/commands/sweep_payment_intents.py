@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from myapp.payment_intents import SWEEP_BATCH_SIZE, sweep_stale
+
+
+class Command(BaseCommand):
+    help = "Cancel open PaymentIntents that have not been reused for a while."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age",
+            type=int,
+            default=settings.PAYMENT_INTENT_MAX_AGE,
+            help="Seconds since an intent was last created or updated.",
+        )
+        parser.add_argument("--batch-size", type=int, default=SWEEP_BATCH_SIZE)
+
+    def handle(self, *args, max_age, batch_size, **options):
+        canceled, closed = sweep_stale(max_age, batch_size)
+        self.stdout.write(
+            self.style.SUCCESS(f"Canceled {canceled} intents, closed {closed} already finished.")
+        )
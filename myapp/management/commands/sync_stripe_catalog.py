@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from myapp.catalog_sync import BATCH_SIZE, MAX_RETRIES, WORKERS, sync_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Upsert items as Stripe Products/Prices so Checkout can send price ids. Only items "
+        "changed since their last sync are sent."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            "--workers", type=int, default=WORKERS, help="Concurrent Stripe requests."
+        )
+        parser.add_argument(
+            "--max-retries",
+            type=int,
+            default=MAX_RETRIES,
+            help="Retries per request after a 429 from Stripe.",
+        )
+
+    def handle(self, *args, batch_size, workers, max_retries, **options):
+        synced, failed = sync_catalog(
+            batch_size=batch_size,
+            workers=workers,
+            max_retries=max_retries,
+            log=self.stderr.write,
+        )
+        message = f"Synced {synced} items, {failed} failed."
+        self.stdout.write(self.style.ERROR(message) if failed else self.style.SUCCESS(message))
@@ -0,0 +1,164 @@
+import json
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import reverse
+
+from . import db_routing, perf
+
+FORM_CONTENT_TYPES = ("application/x-www-form-urlencoded", "multipart/form-data")
+
+
+class TraceRecordMiddleware:
+    """Append every request to ``LOADTEST_TRACE_FILE`` as a JSONL trace line.
+
+    The file can be replayed with ``manage.py loadtest --trace``. Admin
+    requests are not recorded, and password and CSRF token fields of other
+    forms are redacted. The middleware removes itself when the setting is empty.
+    """
+
+    REDACTED = "redacted"
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.LOADTEST_TRACE_FILE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.path = settings.LOADTEST_TRACE_FILE
+        self.admin_prefix = reverse("admin:index")
+        self._lock = threading.Lock()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def body(self, request):
+        """Return (body, content type); forms are re-encoded with secrets redacted."""
+        if request.content_type not in FORM_CONTENT_TYPES:
+            return request.body.decode("utf-8", errors="replace"), request.content_type
+        # Uploaded files are dropped from multipart forms; the fields still replay.
+        form = request.POST.copy()
+        for name in form:
+            if name == "csrfmiddlewaretoken" or "password" in name:
+                form.setlist(name, [self.REDACTED] * len(form.getlist(name)))
+        return form.urlencode(), "application/x-www-form-urlencoded"
+
+    def record(self, request):
+        if request.path.startswith(self.admin_prefix):
+            return
+        spec = {"method": request.method, "path": request.get_full_path()}
+        if request.body:
+            spec["body"], spec["content_type"] = self.body(request)
+        with self._lock, open(self.path, "a", encoding="utf-8") as stream:
+            stream.write(json.dumps(spec) + "\n")
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self.record(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self.record(request)
+        return await self.get_response(request)
+
+
+class ReplicaRoutingMiddleware:
+    """Scope ``db_routing`` state to each request and keep the primary pin cookie.
+
+    Removes itself when ``REPLICA_DATABASES`` is empty.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REPLICA_DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        pinned = settings.REPLICA_PIN_COOKIE in request.COOKIES
+        if not pinned and db_routing.replica_view(request):
+            db_routing.allow_replicas()
+
+    def finish(self, request, token, response):
+        state = db_routing.finish(token)
+        match = request.resolver_match
+        if state["wrote"] or (match and match.url_name in settings.REPLICA_PIN_VIEWS):
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE,
+                "1",
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = db_routing.start()
+        return self.finish(request, token, self.get_response(request))
+
+    async def __acall__(self, request):
+        token = db_routing.start()
+        return self.finish(request, token, await self.get_response(request))
+
+
+class PerfMiddleware:
+    """Feed ``perf`` histograms and add ``Server-Timing`` to sampled responses.
+
+    Goes first in ``MIDDLEWARE`` so the other middleware is timed too. Removes
+    itself when ``PERF_METRICS`` is off.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PERF_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.rate = settings.PERF_SAMPLE_RATE
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def finish(self, request, response, started, sample=None):
+        seconds = time.perf_counter() - started
+        match = request.resolver_match
+        perf.record(match.view_name if match else "<unresolved>", seconds, sample)
+        if sample is not None:
+            response.headers["Server-Timing"] = perf.server_timing(seconds, sample)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        if not perf.sampled(self.rate):
+            return self.finish(request, self.get_response(request), started)
+
+        sample, token = perf.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            perf.finish(token)
+        return self.finish(request, response, started, sample)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        if not perf.sampled(self.rate):
+            return self.finish(request, await self.get_response(request), started)
+
+        sample, token = perf.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            perf.finish(token)
+        return self.finish(request, response, started, sample)
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.2 on 2026-10-18 10:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("myapp", "0002_alter_discount_percent_alter_order_currency_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StripeCoupon",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("percent", models.DecimalField(decimal_places=2, max_digits=5)),
+                ("account", models.CharField(max_length=16)),
+                ("stripe_id", models.CharField(max_length=255)),
+                (
+                    "discount",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stripe_coupons",
+                        to="myapp.discount",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("discount", "percent", "account"), name="unique_stripe_coupon"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="StripeTaxRate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("percent", models.DecimalField(decimal_places=2, max_digits=5)),
+                ("account", models.CharField(max_length=16)),
+                ("country", models.CharField(max_length=2)),
+                ("stripe_id", models.CharField(max_length=255)),
+                (
+                    "tax",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stripe_tax_rates",
+                        to="myapp.tax",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("tax", "percent", "account", "country"),
+                        name="unique_stripe_tax_rate",
+                    )
+                ],
+            },
+        ),
+    ]
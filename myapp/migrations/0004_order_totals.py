@@ -0,0 +1,51 @@
+# Generated by Django 5.2.2 on 2026-10-18 10:30
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+
+
+def backfill_order_totals(apps, schema_editor):
+    Order = apps.get_model("myapp", "Order")
+
+    batch = []
+    for order in (
+        Order.objects.select_related("discount", "tax")
+        .prefetch_related("items")
+        .iterator(chunk_size=500)
+    ):
+        items_total = sum((item.price for item in order.items.all()), Decimal("0"))
+        discount_percent = order.discount.percent if order.discount else Decimal("0")
+        subtotal = items_total - items_total * discount_percent / Decimal("100")
+        tax_percent = order.tax.percent if order.tax else Decimal("0")
+        total = subtotal + subtotal * tax_percent / Decimal("100")
+
+        order.items_total = items_total
+        order.total_amount = total.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        batch.append(order)
+        if len(batch) >= 500:
+            Order.objects.bulk_update(batch, ["items_total", "total_amount"])
+            batch = []
+
+    if batch:
+        Order.objects.bulk_update(batch, ["items_total", "total_amount"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("myapp", "0003_stripe_coupon_tax_rate"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="items_total",
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="total_amount",
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.RunPython(backfill_order_totals, migrations.RunPython.noop),
+    ]
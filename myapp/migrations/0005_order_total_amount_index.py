@@ -0,0 +1,19 @@
+# Generated by Django 5.2.2 on 2026-10-18 10:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("myapp", "0004_order_totals"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="order",
+            name="total_amount",
+            field=models.DecimalField(
+                db_index=True, decimal_places=2, default=0, editable=False, max_digits=12
+            ),
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.2 on 2026-10-18 10:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_items_to_lines(apps, schema_editor):
+    Order = apps.get_model("myapp", "Order")
+    OrderLine = apps.get_model("myapp", "OrderLine")
+    OrderItem = Order.items.through
+
+    batch = []
+    for order_id, item_id, price in OrderItem.objects.values_list(
+        "order_id", "item_id", "item__price"
+    ).iterator(chunk_size=500):
+        batch.append(OrderLine(order_id=order_id, item_id=item_id, quantity=1, unit_price=price))
+        if len(batch) >= 500:
+            OrderLine.objects.bulk_create(batch)
+            batch = []
+
+    if batch:
+        OrderLine.objects.bulk_create(batch)
+
+
+def copy_lines_to_items(apps, schema_editor):
+    Order = apps.get_model("myapp", "Order")
+    OrderLine = apps.get_model("myapp", "OrderLine")
+    OrderItem = Order.items.through
+
+    batch = []
+    for order_id, item_id in OrderLine.objects.values_list("order_id", "item_id").iterator(
+        chunk_size=500
+    ):
+        batch.append(OrderItem(order_id=order_id, item_id=item_id))
+        if len(batch) >= 500:
+            OrderItem.objects.bulk_create(batch)
+            batch = []
+
+    if batch:
+        OrderItem.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("myapp", "0005_order_total_amount_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderLine",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("quantity", models.PositiveIntegerField(default=1)),
+                (
+                    "unit_price",
+                    models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+                ),
+                (
+                    "item",
+                    models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="myapp.item"),
+                ),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="lines",
+                        to="myapp.order",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["id"],
+                "constraints": [
+                    models.UniqueConstraint(fields=("order", "item"), name="unique_order_line_item")
+                ],
+            },
+        ),
+        migrations.RunPython(copy_items_to_lines, copy_lines_to_items),
+        migrations.RemoveField(
+            model_name="order",
+            name="items",
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="items",
+            field=models.ManyToManyField(through="myapp.OrderLine", to="myapp.item"),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.2 on 2026-10-18 10:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("myapp", "0007_stripe_events_payment_status"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentIntentRecord",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("session_key", models.CharField(max_length=40)),
+                ("kind", models.CharField(max_length=16)),
+                ("object_id", models.PositiveBigIntegerField()),
+                (
+                    "currency",
+                    models.CharField(
+                        choices=[("USD", "US Dollar"), ("RUB", "Russian Ruble")], max_length=3
+                    ),
+                ),
+                ("account", models.CharField(max_length=16)),
+                ("fingerprint", models.CharField(max_length=64)),
+                ("amount", models.PositiveBigIntegerField()),
+                ("stripe_id", models.CharField(max_length=255, unique=True)),
+                ("client_secret", models.CharField(max_length=255)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("open", "Open"),
+                            ("succeeded", "Succeeded"),
+                            ("canceled", "Canceled"),
+                            ("closed", "Closed"),
+                        ],
+                        default="open",
+                        max_length=16,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["status", "updated_at"], name="payment_intent_sweep_idx")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("session_key", "kind", "object_id", "account"),
+                        name="unique_payment_intent_per_session",
+                    )
+                ],
+            },
+        ),
+    ]
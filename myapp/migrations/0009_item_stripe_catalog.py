@@ -0,0 +1,37 @@
+# Generated by Django 5.2.2 on 2026-10-18 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("myapp", "0008_payment_intent_record"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="item",
+            name="stripe_account",
+            field=models.CharField(blank=True, editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name="item",
+            name="stripe_price_id",
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="item",
+            name="stripe_product_id",
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="item",
+            name="stripe_synced_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="item",
+            name="stripe_unit_amount",
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
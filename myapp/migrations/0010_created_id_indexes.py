@@ -0,0 +1,42 @@
+# Generated by Django 5.2.2 on 2026-10-18 10:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("myapp", "0009_item_stripe_catalog"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="item",
+            options={
+                "ordering": ["-created_at", "-id"],
+                "verbose_name": "Item",
+                "verbose_name_plural": "Items",
+            },
+        ),
+        migrations.AlterModelOptions(
+            name="order",
+            options={
+                "ordering": ["-created_at", "-id"],
+                "verbose_name": "Order",
+                "verbose_name_plural": "Orders",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="item",
+            index=models.Index(fields=["-created_at", "-id"], name="item_created_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="item",
+            index=models.Index(
+                fields=["currency", "-created_at", "-id"], name="item_currency_created_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["-created_at", "-id"], name="order_created_id_idx"),
+        ),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 5.2.2 on 2026-10-18 11:01
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Non-atomic, so nothing here holds a lock on myapp_item for the whole migration:
+# the trigger goes in first, existing rows are backfilled in short batches (each
+# commits on its own) and the GIN index is built CONCURRENTLY, which cannot run in
+# a transaction anyway. Rows written meanwhile are covered by the trigger.
+
+# The trigger fires on every write that sets name, description or search_vector;
+# Model.save() always sets all three, bulk_update() only when it touches them.
+# The text search config has to match myapp.search.SEARCH_CONFIG.
+CREATE_TRIGGER = [
+    """
+CREATE OR REPLACE FUNCTION myapp_item_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+""",
+    "DROP TRIGGER IF EXISTS myapp_item_search_vector ON myapp_item",
+    """
+CREATE TRIGGER myapp_item_search_vector
+    BEFORE INSERT OR UPDATE OF name, description, search_vector ON myapp_item
+    FOR EACH ROW EXECUTE FUNCTION myapp_item_search_vector()
+""",
+]
+
+DROP_TRIGGER = [
+    "DROP TRIGGER IF EXISTS myapp_item_search_vector ON myapp_item",
+    "DROP FUNCTION IF EXISTS myapp_item_search_vector()",
+]
+
+# IF NOT EXISTS lets a rerun pick up after an interrupted build; an interrupted
+# CONCURRENTLY build leaves an INVALID index that has to be dropped by hand first.
+CREATE_INDEX = (
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS item_search_vector_idx "
+    "ON myapp_item USING gin (search_vector)"
+)
+DROP_INDEX = "DROP INDEX CONCURRENTLY IF EXISTS item_search_vector_idx"
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def postgresql_only(sql):
+    # SQLite (tests, local runs) has no tsvector; myapp.search falls back to LIKE there.
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == "postgresql":
+            for statement in [sql] if isinstance(sql, str) else sql:
+                schema_editor.execute(statement)
+
+    return run
+
+
+def backfill_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    Item = apps.get_model("myapp", "Item")
+    items = Item.objects.using(schema_editor.connection.alias)
+    last_pk = 0
+    while True:
+        ids = list(
+            items.filter(pk__gt=last_pk, search_vector__isnull=True)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:BACKFILL_BATCH_SIZE]
+        )
+        if not ids:
+            break
+        # Setting the column fires the trigger, which computes the real value.
+        items.filter(pk__in=ids).update(search_vector=None)
+        last_pk = ids[-1]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("myapp", "0010_created_id_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="item",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(postgresql_only(CREATE_TRIGGER), postgresql_only(DROP_TRIGGER)),
+        migrations.RunPython(backfill_search_vectors, migrations.RunPython.noop),
+        migrations.RunPython(postgresql_only(CREATE_INDEX), postgresql_only(DROP_INDEX)),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.2 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("myapp", "0011_item_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="item",
+            name="checkout_generation",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="checkout_generation",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
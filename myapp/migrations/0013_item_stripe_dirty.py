@@ -0,0 +1,38 @@
+# Generated by Django 5.2.2 on 2026-10-18 11:36
+
+from django.db import migrations, models
+
+
+def clear_synced_items(apps, schema_editor):
+    # Items unchanged since their last sync start clean; the rest are synced next run.
+    Item = apps.get_model("myapp", "Item")
+    Item.objects.filter(updated_at=models.F("stripe_synced_at")).update(stripe_dirty=False)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("myapp", "0012_checkout_generation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="item",
+            name="stripe_dirty",
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.RunPython(clear_synced_items, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="item",
+            index=models.Index(
+                condition=models.Q(("stripe_dirty", True)),
+                fields=["currency", "id"],
+                name="item_stripe_dirty_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="item",
+            index=models.Index(
+                fields=["currency", "stripe_account"], name="item_currency_account_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.2 on 2026-10-18 12:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("myapp", "0013_item_stripe_dirty"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="order",
+            name="items_total",
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name="order",
+            name="total_amount",
+            field=models.DecimalField(
+                db_index=True, decimal_places=2, default=0, editable=False, max_digits=20
+            ),
+        ),
+    ]
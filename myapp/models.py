@@ -1,7 +1,8 @@
-from decimal import ROUND_HALF_UP, Decimal
-
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
+from . import pricing
+
 CURRENCY_CHOICES = [
     ("USD", "US Dollar"),
     ("RUB", "Russian Ruble"),
@@ -21,12 +22,49 @@ class Item(TimestampedModel):
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES)
+    # Filled by sync_stripe_catalog. stripe_synced_at is the updated_at the Stripe
+    # objects were built from. save() and import_catalog set stripe_dirty; the sync
+    # clears it only while updated_at still equals stripe_synced_at, so an edit made
+    # during the sync is picked up by the next run.
+    stripe_product_id = models.CharField(max_length=255, blank=True, editable=False)
+    stripe_price_id = models.CharField(max_length=255, blank=True, editable=False)
+    stripe_unit_amount = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    stripe_account = models.CharField(max_length=16, blank=True, editable=False)
+    stripe_synced_at = models.DateTimeField(null=True, blank=True, editable=False)
+    stripe_dirty = models.BooleanField(default=True, editable=False)
+    # Weighted name (A) + description (B) tsvector, written by a Postgres trigger
+    # (migration 0011) so bulk imports keep it current too. Stays NULL on SQLite.
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Part of the Checkout Session fingerprint; bumped when a payment completes
+    # (checkout_cache.invalidate) so the next buy gets a fresh session.
+    checkout_generation = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
-        ordering = ["-created_at"]
+        ordering = ["-created_at", "-id"]
+        indexes = [
+            # Keyset pagination of /api/items/, with and without a currency filter.
+            models.Index(fields=["-created_at", "-id"], name="item_created_id_idx"),
+            models.Index(
+                fields=["currency", "-created_at", "-id"], name="item_currency_created_id_idx"
+            ),
+            # sync_stripe_catalog: only the pending items are in the index.
+            models.Index(
+                fields=["currency", "id"],
+                condition=models.Q(stripe_dirty=True),
+                name="item_stripe_dirty_idx",
+            ),
+            models.Index(fields=["currency", "stripe_account"], name="item_currency_account_idx"),
+        ]
         verbose_name = "Item"
         verbose_name_plural = "Items"
 
+    def save(self, *args, **kwargs):
+        self.stripe_dirty = True
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "stripe_dirty" not in update_fields:
+            kwargs["update_fields"] = {*update_fields, "stripe_dirty"}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Item - {self.id} - {self.name} - {self.currency}"
 
@@ -52,28 +90,179 @@ class Tax(models.Model):
 
 
 class Order(TimestampedModel):
-    items = models.ManyToManyField(Item)
+    PAYMENT_UNPAID = "unpaid"
+    PAYMENT_PROCESSING = "processing"
+    PAYMENT_PAID = "paid"
+    PAYMENT_FAILED = "failed"
+    PAYMENT_STATUS_CHOICES = [
+        (PAYMENT_UNPAID, "Unpaid"),
+        (PAYMENT_PROCESSING, "Processing"),
+        (PAYMENT_PAID, "Paid"),
+        (PAYMENT_FAILED, "Failed"),
+    ]
+
+    items = models.ManyToManyField(Item, through="OrderLine")
     discount = models.ForeignKey(Discount, on_delete=models.SET_NULL, null=True, blank=True)
     tax = models.ForeignKey(Tax, on_delete=models.SET_NULL, null=True, blank=True)
     currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES)
+    # Sums of unit_price (10 digits) x quantity over all lines, plus tax: room for
+    # what the lines can actually add up to, not just a single price.
+    items_total = models.DecimalField(max_digits=20, decimal_places=2, default=0, editable=False)
+    total_amount = models.DecimalField(
+        max_digits=20, decimal_places=2, default=0, editable=False, db_index=True
+    )
+    payment_status = models.CharField(
+        max_length=16, choices=PAYMENT_STATUS_CHOICES, default=PAYMENT_UNPAID, db_index=True
+    )
+    checkout_generation = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
-        ordering = ["-created_at"]
+        ordering = ["-created_at", "-id"]
+        indexes = [
+            models.Index(fields=["-created_at", "-id"], name="order_created_id_idx"),
+        ]
         verbose_name = "Order"
         verbose_name_plural = "Orders"
 
+    def calculate_total_amount(self):
+        return pricing.order_total(
+            self.items_total,
+            self.discount.percent if self.discount else 0,
+            self.tax.percent if self.tax else 0,
+        )
+
+    def save(self, *args, **kwargs):
+        self.total_amount = self.calculate_total_amount()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "total_amount" not in update_fields:
+            kwargs["update_fields"] = {*update_fields, "total_amount"}
+        super().save(*args, **kwargs)
+
     def total_price(self):
-        items_total = sum(Decimal(item.price) for item in self.items.all())
+        return self.total_amount
 
-        discount_percent = Decimal(self.discount.percent) if self.discount else Decimal("0")
-        discount_amount = items_total * discount_percent / Decimal("100")
-        subtotal_after_discount = items_total - discount_amount
+    def __str__(self):
+        return f"Order - {self.id} - {self.currency}"
 
-        tax_percent = Decimal(self.tax.percent) if self.tax else Decimal("0")
-        tax_amount = subtotal_after_discount * tax_percent / Decimal("100")
 
-        total = subtotal_after_discount + tax_amount
-        return total.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+class OrderLine(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="lines")
+    item = models.ForeignKey(Item, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    # Snapshot of item.price when the line was added; filled in on save or after
+    # order.items.add().
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        constraints = [
+            models.UniqueConstraint(fields=["order", "item"], name="unique_order_line_item"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.unit_price is None:
+            self.unit_price = self.item.price
+        super().save(*args, **kwargs)
+
+    def line_total(self):
+        return self.unit_price * self.quantity
 
     def __str__(self):
-        return f"Order - {self.id} - {self.currency}"
+        return f"{self.quantity} x {self.item.name}"
+
+
+class StripeCoupon(TimestampedModel):
+    discount = models.ForeignKey(Discount, on_delete=models.CASCADE, related_name="stripe_coupons")
+    percent = models.DecimalField(max_digits=5, decimal_places=2)
+    account = models.CharField(max_length=16)
+    stripe_id = models.CharField(max_length=255)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["discount", "percent", "account"], name="unique_stripe_coupon"
+            )
+        ]
+
+    def __str__(self):
+        return f"StripeCoupon - {self.discount_id} - {self.percent}% - {self.stripe_id}"
+
+
+class StripeTaxRate(TimestampedModel):
+    tax = models.ForeignKey(Tax, on_delete=models.CASCADE, related_name="stripe_tax_rates")
+    percent = models.DecimalField(max_digits=5, decimal_places=2)
+    account = models.CharField(max_length=16)
+    country = models.CharField(max_length=2)
+    stripe_id = models.CharField(max_length=255)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["tax", "percent", "account", "country"], name="unique_stripe_tax_rate"
+            )
+        ]
+
+    def __str__(self):
+        return f"StripeTaxRate - {self.tax_id} - {self.percent}% - {self.stripe_id}"
+
+
+class StripeEvent(TimestampedModel):
+    STATUS_PENDING = "pending"
+    STATUS_PROCESSED = "processed"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_PROCESSED, "Processed"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=255)
+    payload = models.JSONField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [models.Index(fields=["status", "id"], name="stripe_event_queue_idx")]
+
+    def __str__(self):
+        return f"StripeEvent - {self.event_id} - {self.type} - {self.status}"
+
+
+class PaymentIntentRecord(TimestampedModel):
+    STATUS_OPEN = "open"
+    STATUS_SUCCEEDED = "succeeded"
+    STATUS_CANCELED = "canceled"
+    STATUS_CLOSED = "closed"
+    STATUS_CHOICES = [
+        (STATUS_OPEN, "Open"),
+        (STATUS_SUCCEEDED, "Succeeded"),
+        (STATUS_CANCELED, "Canceled"),
+        (STATUS_CLOSED, "Closed"),
+    ]
+
+    session_key = models.CharField(max_length=40)
+    kind = models.CharField(max_length=16)
+    object_id = models.PositiveBigIntegerField()
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES)
+    account = models.CharField(max_length=16)
+    fingerprint = models.CharField(max_length=64)
+    amount = models.PositiveBigIntegerField()
+    stripe_id = models.CharField(max_length=255, unique=True)
+    client_secret = models.CharField(max_length=255)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_OPEN)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["session_key", "kind", "object_id", "account"],
+                name="unique_payment_intent_per_session",
+            )
+        ]
+        indexes = [models.Index(fields=["status", "updated_at"], name="payment_intent_sweep_idx")]
+
+    def __str__(self):
+        return f"PaymentIntentRecord - {self.kind} {self.object_id} - {self.stripe_id}"
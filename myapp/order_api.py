@@ -0,0 +1,154 @@
+"""Order creation for the JSON API, many orders per transaction.
+
+A payload is ``{"currency", "discount", "tax", "lines": [{"item", "quantity"}]}``
+with discount/tax/item given by id. All items referenced by a batch are
+loaded with one query, which also gives the currency check and the unit price
+snapshots. Totals are priced in Python with ``pricing`` and the orders and
+their lines are then written with one ``bulk_create`` each.
+"""
+
+from django.db import transaction
+
+from . import pricing
+from .models import CURRENCY_CHOICES, Discount, Item, Order, OrderLine, Tax
+
+MAX_BATCH = 1000
+CURRENCIES = {code for code, _ in CURRENCY_CHOICES}
+
+
+class OrderPayloadError(Exception):
+    """Raised with ``errors``: ``{payload index: [messages]}``."""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def _positive_int(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+def _parse(payload):
+    """Return ``(currency, discount id, tax id, [(item id, quantity)], errors)``."""
+    if not isinstance(payload, dict):
+        return None, None, None, [], ["Order must be an object."]
+
+    errors = []
+    currency = payload.get("currency")
+    if currency not in CURRENCIES:
+        errors.append(f"Unsupported currency: {currency}.")
+
+    refs = {}
+    for field in ("discount", "tax"):
+        value = payload.get(field)
+        if value is not None and not _positive_int(value):
+            errors.append(f"{field} must be an id or null.")
+            value = None
+        refs[field] = value
+
+    lines = []
+    raw_lines = payload.get("lines")
+    if not isinstance(raw_lines, list) or not raw_lines:
+        errors.append("lines must be a non-empty list.")
+        raw_lines = []
+    seen = set()
+    for line in raw_lines:
+        item_id = line.get("item") if isinstance(line, dict) else None
+        quantity = line.get("quantity", 1) if isinstance(line, dict) else None
+        if not _positive_int(item_id) or not _positive_int(quantity):
+            errors.append("Each line needs an item id and a positive quantity.")
+            continue
+        if item_id in seen:
+            errors.append(f"Item {item_id} is listed twice.")
+            continue
+        seen.add(item_id)
+        lines.append((item_id, quantity))
+
+    return currency, refs["discount"], refs["tax"], lines, errors
+
+
+def create_orders(payloads):
+    """Validate and insert ``payloads``; returns the created ``Order`` objects.
+
+    Nothing is written unless every payload is valid.
+    """
+    if len(payloads) > MAX_BATCH:
+        raise OrderPayloadError({"orders": [f"At most {MAX_BATCH} orders per request."]})
+
+    parsed = [_parse(payload) for payload in payloads]
+
+    item_ids = {item_id for *_, lines, _ in parsed for item_id, _ in lines}
+    discount_ids = {discount for _, discount, *_ in parsed if discount}
+    tax_ids = {tax for _, _, tax, *_ in parsed if tax}
+
+    items = {
+        pk: (currency, price)
+        for pk, currency, price in Item.objects.filter(pk__in=item_ids).values_list(
+            "pk", "currency", "price"
+        )
+    }
+    discounts = Discount.objects.in_bulk(discount_ids) if discount_ids else {}
+    taxes = Tax.objects.in_bulk(tax_ids) if tax_ids else {}
+
+    errors = {}
+    orders = []
+    lines = []
+    for index, (currency, discount_id, tax_id, order_lines, order_errors) in enumerate(parsed):
+        if discount_id and discount_id not in discounts:
+            order_errors.append(f"Discount {discount_id} does not exist.")
+        if tax_id and tax_id not in taxes:
+            order_errors.append(f"Tax {tax_id} does not exist.")
+        for item_id, _ in order_lines:
+            if item_id not in items:
+                order_errors.append(f"Item {item_id} does not exist.")
+            elif currency in CURRENCIES and items[item_id][0] != currency:
+                order_errors.append(
+                    f"Item {item_id} is priced in {items[item_id][0]}, not {currency}."
+                )
+        if order_errors:
+            errors[index] = order_errors
+            continue
+
+        discount = discounts.get(discount_id)
+        tax = taxes.get(tax_id)
+        items_minor = sum(
+            pricing.to_minor(items[item_id][1]) * quantity for item_id, quantity in order_lines
+        )
+        prices = pricing.breakdown(
+            items_minor, discount.percent if discount else 0, tax.percent if tax else 0
+        )
+        order = Order(
+            currency=currency,
+            discount=discount,
+            tax=tax,
+            items_total=pricing.from_minor(prices["items_total"]),
+            total_amount=pricing.from_minor(prices["total_amount"]),
+        )
+        orders.append(order)
+        lines.append(
+            [
+                OrderLine(item_id=item_id, quantity=quantity, unit_price=items[item_id][1])
+                for item_id, quantity in order_lines
+            ]
+        )
+
+    if errors:
+        raise OrderPayloadError(errors)
+
+    with transaction.atomic():
+        # bulk_create skips Order.save() and the line signals; totals are set above.
+        Order.objects.bulk_create(orders)
+        for order, order_lines in zip(orders, lines):
+            for line in order_lines:
+                line.order = order
+        OrderLine.objects.bulk_create([line for order_lines in lines for line in order_lines])
+    return orders
+
+
+def serialize(order):
+    return {
+        "id": order.pk,
+        "currency": order.currency,
+        "items_total": str(order.items_total),
+        "total_amount": str(order.total_amount),
+    }
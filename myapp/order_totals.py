@@ -0,0 +1,58 @@
+from django.db.models import OuterRef, Subquery
+
+from . import pricing
+from .models import Item, Order, OrderLine
+
+BATCH_SIZE = 500
+
+
+def chunked(ids, size):
+    chunk = []
+    for value in ids:
+        chunk.append(value)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def snapshot_unit_prices(**lookup):
+    """Fill missing ``OrderLine.unit_price`` values from the current item price.
+
+    Lines created with ``bulk_create`` (including ``order.items.add()``) skip
+    ``OrderLine.save()``.
+    """
+    OrderLine.objects.filter(unit_price__isnull=True, **lookup).update(
+        unit_price=Subquery(Item.objects.filter(pk=OuterRef("item_id")).values("price")[:1])
+    )
+
+
+def stale_orders(order_ids):
+    """Return ``Order`` instances whose stored totals differ from their lines.
+
+    ``pricing.price_orders`` prices the whole batch of ids with one aggregate
+    query; a second query reads the stored totals to compare.
+    """
+    orders = Order.objects.filter(pk__in=order_ids)
+    prices = pricing.price_orders(orders)
+
+    stale = []
+    for order_id, items_total, total_amount in orders.values_list(
+        "id", "items_total", "total_amount"
+    ):
+        computed = pricing.from_minor(prices[order_id]["items_total"])
+        computed_total = pricing.from_minor(prices[order_id]["total_amount"])
+        if computed != items_total or computed_total != total_amount:
+            stale.append(Order(id=order_id, items_total=computed, total_amount=computed_total))
+    return stale
+
+
+def refresh_order_totals(order_ids, batch_size=BATCH_SIZE):
+    refreshed = 0
+    for chunk in chunked(order_ids, batch_size):
+        stale = stale_orders(chunk)
+        if stale:
+            Order.objects.bulk_update(stale, ["items_total", "total_amount"])
+            refreshed += len(stale)
+    return refreshed
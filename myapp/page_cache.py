@@ -0,0 +1,76 @@
+"""Rendered item pages, cached per item and revalidated with ETag/Last-Modified.
+
+Each hit costs the single primary-key lookup of the item. The cache
+entry and the ETag are versioned by ``updated_at`` and the currency's public
+key, so workers whose local cache missed an invalidation still never serve a
+stale page. The version also covers the hashed URLs of the static assets the
+page links to, so a deploy that changes them renders the page anew. ``Item``
+signals drop the entries in the current process.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.template.loader import render_to_string
+from django.templatetags.static import static
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .models import Item
+
+CACHE_KEY_PREFIX = "item-page"
+
+ITEM_DETAIL = "items/item_detail.html"
+PAYMENT_SUCCESS_INTENT = "intent/items/payment_success_item_intent.html"
+TEMPLATES = (ITEM_DETAIL, PAYMENT_SUCCESS_INTENT)
+ASSETS = ("myapp/js/checkout.js",)
+
+
+def _cache():
+    return caches[settings.PAGE_CACHE_ALIAS]
+
+
+def _cache_key(template_name, item_id):
+    return f"{CACHE_KEY_PREFIX}:{template_name}:{item_id}"
+
+
+def page_version(template_name, item_id, updated_at, public_key):
+    assets = "|".join(static(path) for path in ASSETS)
+    payload = f"{template_name}|{item_id}|{updated_at.isoformat()}|{public_key or ''}|{assets}"
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def render_item_page(request, item_id, template_name, with_public_key=False):
+    item = get_object_or_404(Item, pk=item_id)
+
+    public_key = settings.STRIPE_KEYS[item.currency]["public"] if with_public_key else None
+    version = page_version(template_name, item.pk, item.updated_at, public_key)
+    etag = f'"{version}"'
+    last_modified = int(item.updated_at.timestamp())
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        key = _cache_key(template_name, item_id)
+        entry = _cache().get(key)
+        if entry and entry["version"] == version:
+            content = entry["content"]
+        else:
+            context = {"item": item}
+            if with_public_key:
+                context["stripe_public_key"] = public_key
+            content = render_to_string(template_name, context, request)
+            _cache().set(key, {"version": version, "content": content}, settings.PAGE_CACHE_TTL)
+        response = HttpResponse(content)
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    # Browsers must revalidate so price changes show up immediately.
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def invalidate_item(item_id):
+    _cache().delete_many([_cache_key(template_name, item_id) for template_name in TEMPLATES])
@@ -0,0 +1,210 @@
+"""PaymentIntents reused per browser session and content.
+
+Each (session, item/order, Stripe account) keeps one open PaymentIntent. A
+repeat view with the same content renders the stored client secret without
+calling Stripe. A changed amount updates the intent in place. Intents left
+open past ``PAYMENT_INTENT_MAX_AGE`` are canceled by
+``sweep_payment_intents``.
+"""
+
+import time
+from datetime import timedelta
+
+import stripe
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import checkout_cache, stripe_clients
+from .models import PaymentIntentRecord
+
+SWEEP_BATCH_SIZE = 100
+
+
+def session_key(request):
+    if request.session.session_key is None:
+        request.session.save()
+        # Make SessionMiddleware send the cookie for the new key.
+        request.session.modified = True
+    return request.session.session_key
+
+
+async def asession_key(request):
+    if request.session.session_key is None:
+        await request.session.asave()
+        request.session.modified = True
+    return request.session.session_key
+
+
+def _fingerprint(kind, object_id, currency, amount, content):
+    return checkout_cache.content_fingerprint(
+        currency,
+        stripe_clients.get_account(currency),
+        {"kind": kind, "id": object_id, "amount": amount, "content": content},
+    )
+
+
+def _lookup(key, kind, object_id, currency):
+    return {
+        "session_key": key,
+        "kind": kind,
+        "object_id": object_id,
+        "account": stripe_clients.get_account(currency),
+    }
+
+
+def _create_args(key, kind, currency, amount, metadata, fingerprint):
+    params = {"amount": amount, "currency": currency.lower(), "metadata": metadata}
+    window = int(time.time()) // 60
+    options = {
+        "idempotency_key": checkout_cache.idempotency_key(
+            f"intent-{kind}-{key}", fingerprint, window
+        )
+    }
+    return params, options
+
+
+def _record_defaults(currency, amount, fingerprint, intent):
+    return {
+        "currency": currency,
+        "fingerprint": fingerprint,
+        "amount": amount,
+        "stripe_id": intent.id,
+        "client_secret": intent.client_secret,
+        "status": PaymentIntentRecord.STATUS_OPEN,
+    }
+
+
+def _store(lookup, defaults):
+    """Save the new intent under ``lookup``; returns the client secret to render.
+
+    Two requests from one session can both miss and both create an intent.
+    The second insert then fails on the (session, object, account) constraint
+    inside its savepoint, and the row the first one stored is kept.
+    """
+    try:
+        with transaction.atomic():
+            record, _ = PaymentIntentRecord.objects.update_or_create(**lookup, defaults=defaults)
+    except IntegrityError:
+        record = PaymentIntentRecord.objects.get(**lookup)
+    return record.client_secret
+
+
+def get_client_secret(request, client, kind, object_id, currency, amount, metadata, content=None):
+    """Return the client secret of this session's open intent, creating it on a miss.
+
+    ``amount`` is in minor units. ``content`` is anything besides the amount
+    that should force a fresh fingerprint (order lines, percents).
+    """
+    key = session_key(request)
+    lookup = _lookup(key, kind, object_id, currency)
+    fingerprint = _fingerprint(kind, object_id, currency, amount, content)
+
+    record = PaymentIntentRecord.objects.filter(
+        **lookup, status=PaymentIntentRecord.STATUS_OPEN
+    ).first()
+    if record and record.fingerprint == fingerprint:
+        return record.client_secret
+
+    if record:
+        try:
+            if record.amount != amount:
+                client.payment_intents.update(record.stripe_id, {"amount": amount})
+        except stripe.InvalidRequestError:
+            # Already confirmed or canceled on Stripe's side; start a new one.
+            pass
+        else:
+            record.amount = amount
+            record.fingerprint = fingerprint
+            record.save(update_fields=["amount", "fingerprint", "updated_at"])
+            return record.client_secret
+
+    params, options = _create_args(key, kind, currency, amount, metadata, fingerprint)
+    intent = client.payment_intents.create(params, options)
+    return _store(lookup, _record_defaults(currency, amount, fingerprint, intent))
+
+
+async def aget_client_secret(
+    request, client, kind, object_id, currency, amount, metadata, content=None
+):
+    """Async variant of ``get_client_secret``."""
+    key = await asession_key(request)
+    lookup = _lookup(key, kind, object_id, currency)
+    fingerprint = _fingerprint(kind, object_id, currency, amount, content)
+
+    record = await PaymentIntentRecord.objects.filter(
+        **lookup, status=PaymentIntentRecord.STATUS_OPEN
+    ).afirst()
+    if record and record.fingerprint == fingerprint:
+        return record.client_secret
+
+    if record:
+        try:
+            if record.amount != amount:
+                await client.payment_intents.update_async(record.stripe_id, {"amount": amount})
+        except stripe.InvalidRequestError:
+            pass
+        else:
+            record.amount = amount
+            record.fingerprint = fingerprint
+            await record.asave(update_fields=["amount", "fingerprint", "updated_at"])
+            return record.client_secret
+
+    params, options = _create_args(key, kind, currency, amount, metadata, fingerprint)
+    intent = await client.payment_intents.create_async(params, options)
+    return await sync_to_async(_store)(
+        lookup, _record_defaults(currency, amount, fingerprint, intent)
+    )
+
+
+def mark(stripe_ids, status):
+    if stripe_ids:
+        PaymentIntentRecord.objects.filter(stripe_id__in=stripe_ids).update(
+            status=status, updated_at=timezone.now()
+        )
+
+
+def sweep_stale(max_age=None, batch_size=SWEEP_BATCH_SIZE):
+    """Cancel open intents untouched for ``max_age`` seconds, a batch at a time.
+
+    Returns ``(canceled, closed)``. Intents Stripe refuses to cancel (already
+    succeeded or canceled) are closed locally. Network errors leave the record
+    open for the next sweep.
+    """
+    max_age = settings.PAYMENT_INTENT_MAX_AGE if max_age is None else max_age
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    canceled = closed = 0
+    last_pk = 0
+
+    while True:
+        batch = list(
+            PaymentIntentRecord.objects.filter(
+                status=PaymentIntentRecord.STATUS_OPEN, updated_at__lt=cutoff, pk__gt=last_pk
+            ).order_by("pk")[:batch_size]
+        )
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+
+        changed = []
+        for record in batch:
+            client = stripe_clients.get_client(record.currency)
+            if client is None:
+                continue
+            try:
+                client.payment_intents.cancel(record.stripe_id)
+            except stripe.InvalidRequestError:
+                record.status = PaymentIntentRecord.STATUS_CLOSED
+                closed += 1
+            except stripe.StripeError:
+                continue
+            else:
+                record.status = PaymentIntentRecord.STATUS_CANCELED
+                canceled += 1
+            record.updated_at = timezone.now()
+            changed.append(record)
+
+        PaymentIntentRecord.objects.bulk_update(changed, ["status", "updated_at"])
+
+    return canceled, closed
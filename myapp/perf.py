@@ -0,0 +1,195 @@
+"""Per-view request timings, exported as Prometheus histograms.
+
+``PerfMiddleware`` times every request by URL name. A ``PERF_SAMPLE_RATE``
+share of requests also gets a breakdown: DB queries (an ``execute_wrapper``
+added to each connection as it opens), Stripe API calls (``TimedHTTPXClient``)
+and template rendering (``TimedDjangoTemplates``). The breakdown is returned in
+a ``Server-Timing`` header. An unsampled request costs a ``random()`` call, two
+clock reads and one histogram update. The components find the current sample
+through a context variable, which ``sync_to_async`` carries into the thread
+that runs sync views and ORM calls under ASGI. Connections are per thread, so
+the wrapper cannot be scoped to the request in the middleware.
+
+The histograms are ``prometheus_client`` metrics. Each gunicorn/uvicorn worker
+keeps its own, and a scrape reaches one random worker. So in production
+``PROMETHEUS_MULTIPROC_DIR`` is set: every worker writes its values to files
+there, and ``/metrics`` sums the files of all workers, including those already
+recycled. ``gunicorn.conf.py`` empties the directory at start and marks exited
+workers dead.
+"""
+
+import os
+import random
+import time
+from contextvars import ContextVar
+
+import stripe
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template.exceptions import TemplateDoesNotExist
+from prometheus_client import CollectorRegistry, Histogram, generate_latest, multiprocess
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_current = ContextVar("perf_sample", default=None)
+
+REGISTRY = CollectorRegistry()
+
+
+def _histogram(name, documentation, buckets):
+    return Histogram(name, documentation, ["view"], buckets=buckets, registry=REGISTRY)
+
+
+REQUEST_SECONDS = _histogram(
+    "myapp_request_duration_seconds", "Wall time of every request.", SECONDS_BUCKETS
+)
+DB_SECONDS = _histogram("myapp_request_db_seconds", "DB time per sampled request.", SECONDS_BUCKETS)
+DB_QUERIES = _histogram(
+    "myapp_request_db_queries", "DB queries per sampled request.", COUNT_BUCKETS
+)
+STRIPE_SECONDS = _histogram(
+    "myapp_request_stripe_seconds", "Stripe API time per sampled request.", SECONDS_BUCKETS
+)
+STRIPE_CALLS = _histogram(
+    "myapp_request_stripe_calls", "Stripe API calls per sampled request.", COUNT_BUCKETS
+)
+TEMPLATE_SECONDS = _histogram(
+    "myapp_request_template_seconds", "Template render time per sampled request.", SECONDS_BUCKETS
+)
+HISTOGRAMS = (
+    REQUEST_SECONDS,
+    DB_SECONDS,
+    DB_QUERIES,
+    STRIPE_SECONDS,
+    STRIPE_CALLS,
+    TEMPLATE_SECONDS,
+)
+
+
+class Sample:
+    __slots__ = ("db_queries", "db_seconds", "stripe_calls", "stripe_seconds", "template_seconds")
+
+    def __init__(self):
+        self.db_queries = self.stripe_calls = 0
+        self.db_seconds = self.stripe_seconds = self.template_seconds = 0.0
+
+
+def sampled(rate):
+    return rate >= 1 or random.random() < rate
+
+
+def start():
+    """Start a sample for the current request; returns ``(sample, token)``."""
+    sample = Sample()
+    return sample, _current.set(sample)
+
+
+def finish(token):
+    _current.reset(token)
+
+
+def _time_query(execute, sql, params, many, context):
+    sample = _current.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.db_seconds += time.perf_counter() - started
+        sample.db_queries += 1
+
+
+def trace_queries(sender, connection, **kwargs):
+    """``connection_created`` receiver adding the query timer to ``connection``."""
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+def record(view, seconds, sample=None):
+    REQUEST_SECONDS.labels(view).observe(seconds)
+    if sample is not None:
+        DB_SECONDS.labels(view).observe(sample.db_seconds)
+        DB_QUERIES.labels(view).observe(sample.db_queries)
+        STRIPE_SECONDS.labels(view).observe(sample.stripe_seconds)
+        STRIPE_CALLS.labels(view).observe(sample.stripe_calls)
+        TEMPLATE_SECONDS.labels(view).observe(sample.template_seconds)
+
+
+def server_timing(seconds, sample):
+    return ", ".join(
+        [
+            f"app;dur={seconds * 1000:.1f}",
+            f'db;dur={sample.db_seconds * 1000:.1f};desc="{sample.db_queries} queries"',
+            f'stripe;dur={sample.stripe_seconds * 1000:.1f};desc="{sample.stripe_calls} calls"',
+            f"tpl;dur={sample.template_seconds * 1000:.1f}",
+        ]
+    )
+
+
+def exposition():
+    """Prometheus text of all workers' histograms, or of this process's without a multiproc dir."""
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def reset():
+    for histogram in HISTOGRAMS:
+        histogram.clear()
+
+
+def _add_stripe_call(started):
+    sample = _current.get()
+    if sample is not None:
+        sample.stripe_seconds += time.perf_counter() - started
+        sample.stripe_calls += 1
+
+
+class TimedHTTPXClient(stripe.HTTPXClient):
+    """Counts each Stripe API call, retries included, into the current sample."""
+
+    def request_with_retries(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().request_with_retries(*args, **kwargs)
+        finally:
+            _add_stripe_call(started)
+
+    async def request_with_retries_async(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().request_with_retries_async(*args, **kwargs)
+        finally:
+            _add_stripe_call(started)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        sample = _current.get()
+        if sample is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            sample.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """``DjangoTemplates`` whose top-level renders count into the current sample.
+
+    Included and extended templates render inside their parent, so they are
+    not counted twice.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -0,0 +1,117 @@
+"""Order and item pricing in integer minor units (cents, kopecks).
+
+Amounts are converted to minor units once, every percentage is applied with
+integer arithmetic and the total is rounded half up a single time, so the
+stored ``Order.total_amount``, the page breakdown and the amounts sent to
+Stripe always agree. ``price_orders`` prices a whole batch with one aggregate
+query; ``order_totals.stale_orders`` uses it to find orders with outdated totals.
+"""
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
+
+# Both shop currencies (USD, RUB) have two decimal places, as do percentages,
+# which makes the latter basis points.
+MINOR_UNITS = 100
+BASIS_POINTS = 10000
+
+CENT = Decimal("0.01")
+
+
+def _scaled(value):
+    if not isinstance(value, Decimal):
+        value = Decimal(value)
+    return int(value.scaleb(2).to_integral_value(ROUND_HALF_UP))
+
+
+def to_minor(amount):
+    """Convert a money amount (Decimal, int or str) to integer minor units."""
+    return _scaled(amount)
+
+
+def from_minor(minor):
+    return (Decimal(minor) / MINOR_UNITS).quantize(CENT)
+
+
+def to_basis_points(percent):
+    return _scaled(percent or 0)
+
+
+def _div_round_half_up(numerator, denominator):
+    quotient, remainder = divmod(abs(numerator), denominator)
+    if remainder * 2 >= denominator:
+        quotient += 1
+    return quotient if numerator >= 0 else -quotient
+
+
+def breakdown(items_minor, discount_percent=0, tax_percent=0):
+    """Price an order from its line sum in minor units.
+
+    The discount applies to the line sum and the tax to what is left. The
+    total is rounded once from the exact value; the discount is rounded on its
+    own and the tax is whatever makes the three parts add up to the total.
+    """
+    discount_bp = to_basis_points(discount_percent)
+    tax_bp = to_basis_points(tax_percent)
+
+    total = _div_round_half_up(
+        items_minor * (BASIS_POINTS - discount_bp) * (BASIS_POINTS + tax_bp),
+        BASIS_POINTS * BASIS_POINTS,
+    )
+    discount = _div_round_half_up(items_minor * discount_bp, BASIS_POINTS)
+    return {
+        "items_total": items_minor,
+        "discount_amount": discount,
+        "tax_amount": total - (items_minor - discount),
+        "total_amount": total,
+    }
+
+
+def order_total(items_total, discount_percent=0, tax_percent=0):
+    """``Decimal`` total for a ``Decimal`` line sum, as stored on ``Order``."""
+    return from_minor(
+        breakdown(to_minor(items_total), discount_percent, tax_percent)["total_amount"]
+    )
+
+
+def order_breakdown(order):
+    """Template context for an order page; amounts are Decimals plus ``amount`` in minor units."""
+    discount_percent = order.discount.percent if order.discount else 0
+    tax_percent = order.tax.percent if order.tax else 0
+    prices = breakdown(to_minor(order.items_total), discount_percent, tax_percent)
+    return {
+        "items_total": from_minor(prices["items_total"]),
+        "discount_percent": discount_percent,
+        "discount_amount": from_minor(prices["discount_amount"]),
+        "tax_percent": tax_percent,
+        "tax_amount": from_minor(prices["tax_amount"]),
+        "total_amount": from_minor(prices["total_amount"]),
+        "amount": prices["total_amount"],
+    }
+
+
+def with_lines_total(orders):
+    """Annotate a queryset of orders with ``lines_total``, the sum of its lines."""
+    return orders.order_by().annotate(
+        lines_total=Coalesce(
+            Sum(F("lines__unit_price") * F("lines__quantity")),
+            Value(Decimal("0")),
+            output_field=DecimalField(max_digits=20, decimal_places=2),
+        )
+    )
+
+
+def price_orders(orders):
+    """Price a queryset of orders from their lines with one aggregate query.
+
+    Returns ``{order id: breakdown}`` in minor units.
+    """
+    rows = with_lines_total(orders).values_list(
+        "id", "lines_total", "discount__percent", "tax__percent"
+    )
+    return {
+        order_id: breakdown(to_minor(lines_total), discount_percent, tax_percent)
+        for order_id, lines_total, discount_percent, tax_percent in rows
+    }
@@ -0,0 +1,82 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import page_cache
+from .models import Discount, Item, Order, OrderLine, Tax
+from .order_totals import refresh_order_totals, snapshot_unit_prices, stale_orders
+
+
+def _refresh_instance(order):
+    for stale in stale_orders([order.pk]):
+        Order.objects.filter(pk=order.pk).update(
+            items_total=stale.items_total, total_amount=stale.total_amount
+        )
+        order.items_total = stale.items_total
+        order.total_amount = stale.total_amount
+
+
+@receiver(m2m_changed, sender=Order.items.through)
+def order_items_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == "pre_clear":
+        instance._cleared_order_ids = list(instance.order_set.values_list("id", flat=True))
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if action == "post_add":
+        snapshot_unit_prices(**{"item" if reverse else "order": instance})
+
+    if not reverse:
+        _refresh_instance(instance)
+    elif action == "post_clear":
+        refresh_order_totals(instance.__dict__.pop("_cleared_order_ids", []))
+    else:
+        refresh_order_totals(pk_set)
+
+
+@receiver(post_save, sender=OrderLine)
+def order_line_saved(sender, instance, **kwargs):
+    refresh_order_totals([instance.order_id])
+
+
+@receiver(post_delete, sender=OrderLine)
+def order_line_deleted(sender, instance, origin=None, **kwargs):
+    # Cascades from Item/Order deletes and items.remove()/clear() are refreshed
+    # in bulk by their own handlers.
+    if isinstance(origin, OrderLine):
+        refresh_order_totals([instance.order_id])
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def item_changed(sender, instance, **kwargs):
+    page_cache.invalidate_item(instance.pk)
+
+
+@receiver(post_save, sender=Discount)
+def discount_saved(sender, instance, created, **kwargs):
+    if not created:
+        refresh_order_totals(Order.objects.filter(discount=instance).values_list("id", flat=True))
+
+
+@receiver(post_save, sender=Tax)
+def tax_saved(sender, instance, created, **kwargs):
+    if not created:
+        refresh_order_totals(Order.objects.filter(tax=instance).values_list("id", flat=True))
+
+
+@receiver(pre_delete, sender=Item)
+@receiver(pre_delete, sender=Discount)
+@receiver(pre_delete, sender=Tax)
+def remember_affected_orders(sender, instance, **kwargs):
+    lookup = {Item: "items", Discount: "discount", Tax: "tax"}[sender]
+    instance._affected_order_ids = list(
+        Order.objects.filter(**{lookup: instance}).values_list("id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=Discount)
+@receiver(post_delete, sender=Tax)
+def refresh_affected_orders(sender, instance, **kwargs):
+    refresh_order_totals(instance.__dict__.pop("_affected_order_ids", []))
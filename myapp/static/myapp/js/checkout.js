@@ -0,0 +1,27 @@
+// "Buy" button of the item and order pages: creates a Checkout Session through
+// data-buy-url and redirects to it.
+(() => {
+    const button = document.getElementById("buy-button");
+    const stripe = Stripe(button.dataset.stripeKey);
+
+    button.addEventListener("click", () => {
+        fetch(button.dataset.buyUrl)
+            .then((response) => response.json())
+            .then((data) => {
+                if (data.error) {
+                    alert(data.error);
+                    return;
+                }
+                return stripe.redirectToCheckout({ sessionId: data.sessionId });
+            })
+            .then((result) => {
+                if (result && result.error) {
+                    alert(result.error.message);
+                }
+            })
+            .catch((err) => {
+                console.error(err);
+                alert("Ошибка при создании сессии оплаты");
+            });
+    });
+})();
@@ -0,0 +1,61 @@
+// Card form of the intent pages. The form's data attributes carry the Stripe key
+// and the URLs. In lazy mode the page renders without a PaymentIntent; it is
+// created or reused through data-secret-url once the buyer focuses or types into
+// the card field, or submits the form, so a mere page view never reaches Stripe.
+(() => {
+    const form = document.getElementById("payment-form");
+    const button = form.querySelector("button");
+    const errors = document.getElementById("card-errors");
+    const stripe = Stripe(form.dataset.stripeKey);
+    const card = stripe.elements().create("card");
+
+    const inlineSecret = JSON.parse(document.getElementById("client-secret").textContent);
+    let clientSecret = inlineSecret ? Promise.resolve(inlineSecret) : null;
+
+    function fetchClientSecret() {
+        clientSecret = fetch(form.dataset.secretUrl)
+            .then((response) => response.json())
+            .then((data) => {
+                if (!data.clientSecret) {
+                    throw new Error(data.error || form.dataset.unavailableMessage);
+                }
+                return data.clientSecret;
+            });
+        clientSecret.catch(() => {
+            clientSecret = null;
+        });
+        return clientSecret;
+    }
+
+    // "ready" fires on every page load; focus and change only once someone pays.
+    const prefetch = () => clientSecret || fetchClientSecret();
+    card.on("focus", prefetch);
+    card.on("change", prefetch);
+    card.mount("#card-element");
+
+    form.addEventListener("submit", async (event) => {
+        event.preventDefault();
+        button.disabled = true;
+        errors.textContent = "";
+
+        let secret;
+        try {
+            secret = await (clientSecret || fetchClientSecret());
+        } catch (e) {
+            errors.textContent = e.message;
+            button.disabled = false;
+            return;
+        }
+
+        const { error, paymentIntent } = await stripe.confirmCardPayment(secret, {
+            payment_method: { card: card },
+        });
+
+        if (error) {
+            errors.textContent = error.message;
+            button.disabled = false;
+        } else if (paymentIntent.status === "succeeded") {
+            window.location.href = form.dataset.successUrl;
+        }
+    });
+})();
@@ -0,0 +1,53 @@
+"""Static files storage with content-hashed names and precompressed copies.
+
+``collectstatic`` stores every file under a name carrying a hash of its content
+(``ManifestStaticFilesStorage``), so browsers may cache it forever. Then
+``.gz`` and ``.br`` copies of each hashed text asset are written next to it.
+nginx serves the ``.gz`` copies with ``gzip_static`` and the ``.br`` copies
+with ``brotli_static`` where the ngx_brotli module is built in, so no response
+is compressed per request. A copy is kept only when it is smaller than the
+original, and copies that already exist are not rewritten, since a hashed
+name never changes content.
+"""
+
+import gzip
+
+import brotli
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".map", ".svg", ".txt", ".json", ".xml", ".html")
+MIN_SIZE = 256
+
+COMPRESSORS = (
+    (".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0)),
+    (".br", lambda data: brotli.compress(data, quality=11)),
+)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if not dry_run:
+            for hashed_name in sorted(set(self.hashed_files.values())):
+                self.compress(hashed_name)
+
+    def compress(self, name):
+        """Write the ``.gz``/``.br`` copies of ``name``; returns the names written."""
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+            return []
+        with self.open(name) as original:
+            data = original.read()
+        if len(data) < MIN_SIZE:
+            return []
+
+        written = []
+        for suffix, compress in COMPRESSORS:
+            compressed_name = name + suffix
+            if self.exists(compressed_name):
+                continue
+            compressed = compress(data)
+            if len(compressed) < len(data):
+                self._save(compressed_name, ContentFile(compressed))
+                written.append(compressed_name)
+        return written
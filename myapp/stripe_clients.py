@@ -0,0 +1,68 @@
+"""Per-currency Stripe clients.
+
+Every Stripe account gets its own ``StripeClient`` with a dedicated pooled
+keep-alive HTTP client, built once at startup. Views never touch the global
+``stripe.api_key``, so threaded and async workers can serve USD and RUB
+requests concurrently without racing on process-wide state. The HTTP client
+also applies the account's circuit breaker and the request's deadline budget
+(see ``stripe_guard``).
+"""
+
+import hashlib
+import threading
+
+import httpx
+import stripe
+from django.conf import settings
+
+from . import stripe_guard
+
+_lock = threading.Lock()
+_clients = {}
+_accounts = {}
+
+
+def account_fingerprint(secret_key):
+    return hashlib.sha256((secret_key or "").encode()).hexdigest()[:16]
+
+
+def _build_http_client(account):
+    return stripe_guard.GuardedHTTPXClient(
+        account,
+        timeout=httpx.Timeout(
+            settings.STRIPE_READ_TIMEOUT, connect=settings.STRIPE_CONNECT_TIMEOUT
+        ),
+        allow_sync_methods=True,
+    )
+
+
+def _build_client(secret_key):
+    return stripe.StripeClient(
+        secret_key,
+        base_addresses={"api": settings.STRIPE_API_BASE},
+        max_network_retries=settings.STRIPE_MAX_NETWORK_RETRIES,
+        http_client=_build_http_client(account_fingerprint(secret_key)),
+    )
+
+
+def build_clients():
+    global _clients, _accounts
+
+    clients = {}
+    accounts = {}
+    for currency, keys in settings.STRIPE_KEYS.items():
+        if not keys.get("secret"):
+            continue
+        clients[currency] = _build_client(keys["secret"])
+        accounts[currency] = account_fingerprint(keys["secret"])
+
+    with _lock:
+        _clients, _accounts = clients, accounts
+
+
+def get_client(currency):
+    return _clients.get(currency)
+
+
+def get_account(currency):
+    return _accounts.get(currency) or account_fingerprint(None)
@@ -0,0 +1,176 @@
+"""Stripe webhook events: verification, the DB-backed queue and fulfilment.
+
+The webhook view only verifies the signature and inserts the event row, so its
+latency does not depend on fulfilment. ``process_stripe_events`` drains the
+queue in batches and applies the payment state to orders.
+"""
+
+import json
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import checkout_cache, payment_intents
+from .models import Order, PaymentIntentRecord, StripeEvent
+
+CHECKOUT_COMPLETED = "checkout.session.completed"
+CHECKOUT_ASYNC_SUCCEEDED = "checkout.session.async_payment_succeeded"
+CHECKOUT_ASYNC_FAILED = "checkout.session.async_payment_failed"
+CHECKOUT_EXPIRED = "checkout.session.expired"
+INTENT_SUCCEEDED = "payment_intent.succeeded"
+INTENT_FAILED = "payment_intent.payment_failed"
+INTENT_CANCELED = "payment_intent.canceled"
+
+HANDLED_TYPES = {
+    CHECKOUT_COMPLETED,
+    CHECKOUT_ASYNC_SUCCEEDED,
+    CHECKOUT_ASYNC_FAILED,
+    CHECKOUT_EXPIRED,
+    INTENT_SUCCEEDED,
+    INTENT_FAILED,
+    INTENT_CANCELED,
+}
+
+INTENT_RECORD_STATUSES = {
+    INTENT_SUCCEEDED: PaymentIntentRecord.STATUS_SUCCEEDED,
+    INTENT_CANCELED: PaymentIntentRecord.STATUS_CANCELED,
+}
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+
+
+def webhook_secrets():
+    return [keys["webhook"] for keys in settings.STRIPE_KEYS.values() if keys.get("webhook")]
+
+
+def verify_event(payload, signature):
+    """Return the decoded event if ``signature`` matches any account's secret."""
+    for secret in webhook_secrets():
+        try:
+            stripe.WebhookSignature.verify_header(
+                payload, signature, secret, settings.STRIPE_WEBHOOK_TOLERANCE
+            )
+        except stripe.SignatureVerificationError:
+            continue
+        return json.loads(payload)
+    raise stripe.SignatureVerificationError("No matching webhook secret", signature, payload)
+
+
+def enqueue(event):
+    """Store a handled event with a single insert; duplicates are dropped by the DB."""
+    if event.get("type") not in HANDLED_TYPES:
+        return False
+    StripeEvent.objects.bulk_create(
+        [StripeEvent(event_id=event["id"], type=event["type"], payload=event)],
+        ignore_conflicts=True,
+    )
+    return True
+
+
+def _order_status(event_type, obj):
+    if event_type == CHECKOUT_COMPLETED:
+        if obj.get("payment_status") in ("paid", "no_payment_required"):
+            return Order.PAYMENT_PAID
+        return Order.PAYMENT_PROCESSING
+    if event_type in (CHECKOUT_ASYNC_SUCCEEDED, INTENT_SUCCEEDED):
+        return Order.PAYMENT_PAID
+    if event_type in (CHECKOUT_ASYNC_FAILED, INTENT_FAILED):
+        return Order.PAYMENT_FAILED
+    return None
+
+
+def _apply(events):
+    """Apply a batch of events.
+
+    Returns ``{status: {order ids}}`` and ``{status: {intent ids}}`` to write.
+    """
+    updates = {}
+    intent_updates = {}
+    for event in events:
+        obj = event.payload.get("data", {}).get("object", {})
+        metadata = obj.get("metadata") or {}
+
+        if event.type in INTENT_RECORD_STATUSES and obj.get("id"):
+            intent_updates.setdefault(INTENT_RECORD_STATUSES[event.type], set()).add(obj["id"])
+
+        # Bumps checkout_generation in the DB: the web workers' caches are out of reach here.
+        if obj.get("object") == "checkout.session":
+            if metadata.get("order_id"):
+                checkout_cache.invalidate("order", int(metadata["order_id"]))
+            if metadata.get("item_id"):
+                checkout_cache.invalidate("item", int(metadata["item_id"]))
+
+        status = _order_status(event.type, obj)
+        if status and metadata.get("order_id"):
+            order_id = int(metadata["order_id"])
+            # Stripe does not order events: as in the DB, nothing downgrades a paid order.
+            if order_id in updates.get(Order.PAYMENT_PAID, ()) and status != Order.PAYMENT_PAID:
+                continue
+            for ids in updates.values():
+                ids.discard(order_id)
+            updates.setdefault(status, set()).add(order_id)
+    return updates, intent_updates
+
+
+def _write_order_statuses(updates):
+    for status, order_ids in updates.items():
+        orders = Order.objects.filter(pk__in=order_ids)
+        if status != Order.PAYMENT_PAID:
+            # A late failure or "processing" event never downgrades a paid order.
+            orders = orders.exclude(payment_status=Order.PAYMENT_PAID)
+        orders.update(payment_status=status, updated_at=timezone.now())
+
+
+def _fulfil(events):
+    with transaction.atomic():
+        updates, intent_updates = _apply(events)
+        _write_order_statuses(updates)
+        for status, stripe_ids in intent_updates.items():
+            payment_intents.mark(stripe_ids, status)
+
+
+def process_batch(batch_size=BATCH_SIZE):
+    """Claim and fulfil up to ``batch_size`` pending events; returns how many.
+
+    The batch is applied in one go; if that fails, events are retried one by one
+    so a single bad event cannot hold back the rest.
+    """
+    with transaction.atomic():
+        events = list(
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(status=StripeEvent.STATUS_PENDING)
+            .order_by("id")[:batch_size]
+        )
+        if not events:
+            return 0
+
+        errors = {}
+        try:
+            _fulfil(events)
+        except Exception:
+            for event in events:
+                try:
+                    _fulfil([event])
+                except Exception as e:
+                    errors[event.pk] = str(e)
+
+        now = timezone.now()
+        for event in events:
+            event.attempts += 1
+            event.updated_at = now
+            if event.pk in errors:
+                event.last_error = errors[event.pk]
+                if event.attempts >= MAX_ATTEMPTS:
+                    event.status = StripeEvent.STATUS_FAILED
+            else:
+                event.status = StripeEvent.STATUS_PROCESSED
+                event.processed_at = now
+                event.last_error = ""
+
+        StripeEvent.objects.bulk_update(
+            events, ["status", "attempts", "last_error", "processed_at", "updated_at"]
+        )
+    return len(events)
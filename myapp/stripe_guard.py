@@ -0,0 +1,250 @@
+"""Deadline budget and per-account circuit breaker for Stripe calls.
+
+Payment views run under ``budget``, which gives all Stripe calls of the
+request ``STRIPE_REQUEST_BUDGET`` seconds in total. Every HTTP attempt gets
+the remaining time as its timeout, and no attempt starts once the budget is
+spent. Each Stripe account has a ``CircuitBreaker`` whose state lives in the
+``STRIPE_BREAKER_CACHE_ALIAS`` cache, so every worker sharing that cache sees
+the same state. ``STRIPE_BREAKER_THRESHOLD`` failures (connection errors,
+timeouts, 5xx) within ``STRIPE_BREAKER_WINDOW`` seconds open it. While open,
+calls fail at once. After ``STRIPE_BREAKER_COOLDOWN`` seconds one call is let
+through as a probe: success closes the breaker, failure opens it again.
+
+A refusal by the local budget says nothing about Stripe, so it never counts as
+a breaker failure. Neither does a retry the budget could not cover: it is not
+attempted, and the breaker sees the error of the attempt that was made.
+
+Both refusals raise ``StripeUnavailable``, a ``stripe.APIConnectionError``, so
+commands that already skip transient Stripe errors keep doing so. ``budget``
+turns it, and the other transient errors, into a 503 JSON response with
+``Retry-After``. A worker is then held for at most the budget while Stripe is
+slow, and for no time at all once the breaker has opened.
+"""
+
+import functools
+import time
+from contextvars import ContextVar
+
+import httpx
+import stripe
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+from . import perf
+
+CACHE_KEY_PREFIX = "stripe-breaker"
+
+# Errors that mean Stripe (or the way to it) is down rather than the request bad.
+UNAVAILABLE_ERRORS = (stripe.APIConnectionError, stripe.APIError)
+
+_deadline = ContextVar("stripe_deadline", default=None)
+
+
+class StripeUnavailable(stripe.APIConnectionError):
+    def __init__(self, message, retry_after):
+        super().__init__(message, should_retry=False)
+        self.retry_after = retry_after
+
+
+def remaining():
+    """Seconds left in the current request's budget, or None outside a budget."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def _check_budget():
+    left = remaining()
+    if left is not None and left <= 0:
+        raise StripeUnavailable("Stripe request budget exhausted.", retry_after=1)
+    return left
+
+
+def unavailable(exc):
+    retry_after = getattr(exc, "retry_after", 1)
+    response = JsonResponse(
+        {"error": "Payments are temporarily unavailable, please retry shortly."}, status=503
+    )
+    response.headers["Retry-After"] = str(max(1, int(retry_after)))
+    return response
+
+
+def budget(view):
+    """Run ``view`` with a Stripe deadline budget; answer 503 when Stripe is unavailable."""
+
+    def start():
+        return _deadline.set(time.monotonic() + settings.STRIPE_REQUEST_BUDGET)
+
+    if iscoroutinefunction(view):
+
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            token = start()
+            try:
+                return await view(request, *args, **kwargs)
+            except UNAVAILABLE_ERRORS as e:
+                return unavailable(e)
+            finally:
+                _deadline.reset(token)
+
+    else:
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            token = start()
+            try:
+                return view(request, *args, **kwargs)
+            except UNAVAILABLE_ERRORS as e:
+                return unavailable(e)
+            finally:
+                _deadline.reset(token)
+
+    return wrapper
+
+
+class CircuitBreaker:
+    """Closed -> open -> half-open state of one Stripe account, kept in the cache."""
+
+    def __init__(self, account):
+        self.failures_key = f"{CACHE_KEY_PREFIX}:{account}:failures"
+        self.open_key = f"{CACHE_KEY_PREFIX}:{account}:open-until"
+        self.probe_key = f"{CACHE_KEY_PREFIX}:{account}:probe"
+
+    @property
+    def cache(self):
+        return caches[settings.STRIPE_BREAKER_CACHE_ALIAS]
+
+    def _refuse(self, open_until, now):
+        raise StripeUnavailable("Stripe circuit breaker is open.", retry_after=open_until - now)
+
+    def _open_args(self):
+        # The key outlives the cooldown: once that has passed the breaker is half-open
+        # until a probe closes it.
+        open_until = time.time() + settings.STRIPE_BREAKER_COOLDOWN
+        return self.open_key, open_until, settings.STRIPE_BREAKER_COOLDOWN * 10
+
+    def before(self):
+        """Raise ``StripeUnavailable`` while open; returns True for a half-open probe."""
+        open_until = self.cache.get(self.open_key)
+        if open_until is None:
+            return False
+        now = time.time()
+        if now < open_until:
+            self._refuse(open_until, now)
+        if not self.cache.add(self.probe_key, 1, timeout=settings.STRIPE_BREAKER_COOLDOWN):
+            self._refuse(now + settings.STRIPE_BREAKER_COOLDOWN, now)
+        return True
+
+    def after(self, ok, probe):
+        if ok:
+            if probe:
+                self.cache.delete_many([self.open_key, self.probe_key, self.failures_key])
+            return
+        if probe or self._count_failure() >= settings.STRIPE_BREAKER_THRESHOLD:
+            self.cache.set(*self._open_args())
+            self.cache.delete_many([self.probe_key, self.failures_key])
+
+    def release(self, probe):
+        """Forget a call refused before it reached Stripe; frees the probe slot."""
+        if probe:
+            self.cache.delete(self.probe_key)
+
+    def _count_failure(self):
+        self.cache.add(self.failures_key, 0, timeout=settings.STRIPE_BREAKER_WINDOW)
+        try:
+            return self.cache.incr(self.failures_key)
+        except ValueError:
+            # Expired between add() and incr().
+            return 1
+
+    async def abefore(self):
+        open_until = await self.cache.aget(self.open_key)
+        if open_until is None:
+            return False
+        now = time.time()
+        if now < open_until:
+            self._refuse(open_until, now)
+        if not await self.cache.aadd(self.probe_key, 1, timeout=settings.STRIPE_BREAKER_COOLDOWN):
+            self._refuse(now + settings.STRIPE_BREAKER_COOLDOWN, now)
+        return True
+
+    async def aafter(self, ok, probe):
+        if ok:
+            if probe:
+                await self.cache.adelete_many([self.open_key, self.probe_key, self.failures_key])
+            return
+        if probe or await self._acount_failure() >= settings.STRIPE_BREAKER_THRESHOLD:
+            await self.cache.aset(*self._open_args())
+            await self.cache.adelete_many([self.probe_key, self.failures_key])
+
+    async def arelease(self, probe):
+        if probe:
+            await self.cache.adelete(self.probe_key)
+
+    async def _acount_failure(self):
+        await self.cache.aadd(self.failures_key, 0, timeout=settings.STRIPE_BREAKER_WINDOW)
+        try:
+            return await self.cache.aincr(self.failures_key)
+        except ValueError:
+            return 1
+
+
+def _succeeded(response):
+    return response[1] < 500
+
+
+class GuardedHTTPXClient(perf.TimedHTTPXClient):
+    """HTTP client for one Stripe account that honours its breaker and the budget."""
+
+    def __init__(self, account, **kwargs):
+        super().__init__(**kwargs)
+        self.breaker = CircuitBreaker(account)
+
+    def _get_request_args_kwargs(self, method, url, headers, post_data):
+        args, kwargs = super()._get_request_args_kwargs(method, url, headers, post_data)
+        left = _check_budget()
+        if left is not None:
+            timeout = kwargs.get("timeout") or httpx.Timeout(left)
+            kwargs["timeout"] = httpx.Timeout(
+                min(timeout.read or left, left),
+                connect=min(timeout.connect or left, left),
+            )
+        return args, kwargs
+
+    def _should_retry(self, response, api_connection_error, num_retries, max_network_retries):
+        # Stop before a retry whose backoff alone would spend the rest of the budget.
+        left = remaining()
+        if left is not None and left <= min(self.INITIAL_DELAY * 2**num_retries, self.MAX_DELAY):
+            return False
+        return super()._should_retry(
+            response, api_connection_error, num_retries, max_network_retries
+        )
+
+    def request_with_retries(self, *args, **kwargs):
+        _check_budget()
+        probe = self.breaker.before()
+        try:
+            response = super().request_with_retries(*args, **kwargs)
+        except StripeUnavailable:
+            self.breaker.release(probe)
+            raise
+        except stripe.APIConnectionError:
+            self.breaker.after(False, probe)
+            raise
+        self.breaker.after(_succeeded(response), probe)
+        return response
+
+    async def request_with_retries_async(self, *args, **kwargs):
+        _check_budget()
+        probe = await self.breaker.abefore()
+        try:
+            response = await super().request_with_retries_async(*args, **kwargs)
+        except StripeUnavailable:
+            await self.breaker.arelease(probe)
+            raise
+        except stripe.APIConnectionError:
+            await self.breaker.aafter(False, probe)
+            raise
+        await self.breaker.aafter(_succeeded(response), probe)
+        return response
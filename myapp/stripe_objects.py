@@ -0,0 +1,279 @@
+import asyncio
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from decimal import Decimal
+
+from . import stripe_clients
+from .models import StripeCoupon, StripeTaxRate
+
+CURRENCY_COUNTRIES = {
+    "USD": "US",
+    "RUB": "RU",
+}
+
+COUPON_FIELDS = ("discount_id", "percent", "account", "stripe_id")
+TAX_RATE_FIELDS = ("tax_id", "percent", "account", "country", "stripe_id")
+
+# Threads for Stripe creates that run alongside the request thread.
+POOL_WORKERS = 8
+
+# Where a coupon/tax rate id is cached and how to create it on Stripe.
+Spec = namedtuple("Spec", ["model", "mapping", "service", "key", "lookup", "params", "options"])
+
+_lock = threading.Lock()
+_coupons = None
+_tax_rates = None
+_pool = None
+
+
+def _normalize_percent(percent):
+    return Decimal(percent).quantize(Decimal("0.01"))
+
+
+def _load(coupon_rows, tax_rate_rows):
+    global _coupons, _tax_rates
+
+    with _lock:
+        if _coupons is None:
+            _coupons = {tuple(row[:-1]): row[-1] for row in coupon_rows()}
+        if _tax_rates is None:
+            _tax_rates = {tuple(row[:-1]): row[-1] for row in tax_rate_rows()}
+        return _coupons, _tax_rates
+
+
+def _warm():
+    if _coupons is not None and _tax_rates is not None:
+        return _coupons, _tax_rates
+    return _load(
+        lambda: StripeCoupon.objects.values_list(*COUPON_FIELDS),
+        lambda: StripeTaxRate.objects.values_list(*TAX_RATE_FIELDS),
+    )
+
+
+async def _awarm():
+    if _coupons is not None and _tax_rates is not None:
+        return _coupons, _tax_rates
+    coupon_rows = [row async for row in StripeCoupon.objects.values_list(*COUPON_FIELDS)]
+    tax_rate_rows = [row async for row in StripeTaxRate.objects.values_list(*TAX_RATE_FIELDS)]
+    return _load(lambda: coupon_rows, lambda: tax_rate_rows)
+
+
+def reset():
+    global _coupons, _tax_rates
+
+    with _lock:
+        _coupons = None
+        _tax_rates = None
+
+
+def _remember(mapping, key, stripe_id):
+    with _lock:
+        mapping[key] = stripe_id
+    return stripe_id
+
+
+def _coupon_lookup(discount, currency):
+    percent = _normalize_percent(discount.percent)
+    account = stripe_clients.get_account(currency)
+    lookup = {"discount_id": discount.id, "percent": percent, "account": account}
+    params = {"percent_off": float(percent), "duration": "once", "name": discount.name}
+    options = {"idempotency_key": f"coupon-{discount.id}-{percent}-{account}"}
+    return tuple(lookup.values()), lookup, params, options
+
+
+def _tax_rate_lookup(tax, currency):
+    percent = _normalize_percent(tax.percent)
+    account = stripe_clients.get_account(currency)
+    country = CURRENCY_COUNTRIES[currency]
+    lookup = {"tax_id": tax.id, "percent": percent, "account": account, "country": country}
+    params = {
+        "display_name": tax.name,
+        "inclusive": False,
+        "percentage": float(percent),
+        "country": country,
+    }
+    options = {"idempotency_key": f"tax-rate-{tax.id}-{percent}-{account}-{country}"}
+    return tuple(lookup.values()), lookup, params, options
+
+
+def _coupon_spec(discount, currency, coupons):
+    return Spec(StripeCoupon, coupons, "coupons", *_coupon_lookup(discount, currency))
+
+
+def _tax_rate_spec(tax, currency, tax_rates):
+    return Spec(StripeTaxRate, tax_rates, "tax_rates", *_tax_rate_lookup(tax, currency))
+
+
+def _order_specs(order, currency, coupons, tax_rates):
+    coupon = tax_rate = None
+    if order.discount and order.discount.percent > 0:
+        coupon = _coupon_spec(order.discount, currency, coupons)
+    if order.tax and order.tax.percent > 0:
+        tax_rate = _tax_rate_spec(order.tax, currency, tax_rates)
+    return [coupon, tax_rate]
+
+
+def _known(spec):
+    """The Stripe id mapped for ``spec`` in memory or the DB, or None."""
+    if spec.key in spec.mapping:
+        return spec.mapping[spec.key]
+    mapping = spec.model.objects.filter(**spec.lookup).first()
+    if mapping is None:
+        return None
+    return _remember(spec.mapping, spec.key, mapping.stripe_id)
+
+
+async def _aknown(spec):
+    if spec.key in spec.mapping:
+        return spec.mapping[spec.key]
+    mapping = await spec.model.objects.filter(**spec.lookup).afirst()
+    if mapping is None:
+        return None
+    return _remember(spec.mapping, spec.key, mapping.stripe_id)
+
+
+def _store(spec, stripe_id):
+    mapping, _ = spec.model.objects.get_or_create(**spec.lookup, defaults={"stripe_id": stripe_id})
+    return _remember(spec.mapping, spec.key, mapping.stripe_id)
+
+
+async def _astore(spec, stripe_id):
+    mapping, _ = await spec.model.objects.aget_or_create(
+        **spec.lookup, defaults={"stripe_id": stripe_id}
+    )
+    return _remember(spec.mapping, spec.key, mapping.stripe_id)
+
+
+def _create(client, spec):
+    return getattr(client, spec.service).create(spec.params, spec.options).id
+
+
+async def _acreate(client, spec):
+    created = await getattr(client, spec.service).create_async(spec.params, spec.options)
+    return created.id
+
+
+def _get_id(spec, currency):
+    stripe_id = _known(spec)
+    if stripe_id is None:
+        stripe_id = _store(spec, _create(stripe_clients.get_client(currency), spec))
+    return stripe_id
+
+
+async def _aget_id(spec, currency):
+    stripe_id = await _aknown(spec)
+    if stripe_id is None:
+        stripe_id = await _astore(spec, await _acreate(stripe_clients.get_client(currency), spec))
+    return stripe_id
+
+
+def get_coupon_id(discount, currency):
+    coupons, _ = _warm()
+    return _get_id(_coupon_spec(discount, currency, coupons), currency)
+
+
+async def aget_coupon_id(discount, currency):
+    coupons, _ = await _awarm()
+    return await _aget_id(_coupon_spec(discount, currency, coupons), currency)
+
+
+def get_tax_rate_id(tax, currency):
+    _, tax_rates = _warm()
+    return _get_id(_tax_rate_spec(tax, currency, tax_rates), currency)
+
+
+async def aget_tax_rate_id(tax, currency):
+    _, tax_rates = await _awarm()
+    return await _aget_id(_tax_rate_spec(tax, currency, tax_rates), currency)
+
+
+def _executor():
+    global _pool
+
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=POOL_WORKERS, thread_name_prefix="stripe")
+        return _pool
+
+
+def _call(func, *args):
+    try:
+        return func(*args)
+    except Exception as e:
+        return e
+
+
+def _raise_first(results):
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+def get_order_adjustment_ids(order, currency):
+    """Return ``(coupon id, tax rate id)`` for ``order``, None where it has none.
+
+    Known ids come from memory or the DB. Missing objects are created on
+    Stripe concurrently: the last one in this thread, the others on a small
+    pool, each with this request's context (Stripe budget, perf sample). Only
+    this thread touches the DB. When one create fails, the objects that were
+    created are still recorded, so a retry reuses them instead of orphaning
+    them. The first error is then raised.
+    """
+    specs = _order_specs(order, currency, *_warm())
+    ids = [_known(spec) if spec else None for spec in specs]
+    pending = [index for index, spec in enumerate(specs) if spec and ids[index] is None]
+    if not pending:
+        return tuple(ids)
+
+    client = stripe_clients.get_client(currency)
+    *parallel, last = pending
+    futures = [
+        _executor().submit(copy_context().run, _call, _create, client, specs[index])
+        for index in parallel
+    ]
+    last_result = _call(_create, client, specs[last])
+    results = [future.result() for future in futures] + [last_result]
+
+    for index, result in zip(pending, results):
+        if not isinstance(result, BaseException):
+            ids[index] = _store(specs[index], result)
+    _raise_first(results)
+    return tuple(ids)
+
+
+async def aget_order_adjustment_ids(order, currency):
+    """Async variant of ``get_order_adjustment_ids``; creates with ``asyncio.gather``."""
+    specs = _order_specs(order, currency, *await _awarm())
+    ids = [await _aknown(spec) if spec else None for spec in specs]
+    pending = [index for index, spec in enumerate(specs) if spec and ids[index] is None]
+    if not pending:
+        return tuple(ids)
+
+    client = stripe_clients.get_client(currency)
+    results = await asyncio.gather(
+        *(_acreate(client, specs[index]) for index in pending), return_exceptions=True
+    )
+
+    for index, result in zip(pending, results):
+        if not isinstance(result, BaseException):
+            ids[index] = await _astore(specs[index], result)
+    _raise_first(results)
+    return tuple(ids)
+
+
+def invalidate_discount(discount_id):
+    StripeCoupon.objects.filter(discount_id=discount_id).delete()
+    with _lock:
+        if _coupons is not None:
+            for key in [key for key in _coupons if key[0] == discount_id]:
+                del _coupons[key]
+
+
+def invalidate_tax(tax_id):
+    StripeTaxRate.objects.filter(tax_id=tax_id).delete()
+    with _lock:
+        if _tax_rates is not None:
+            for key in [key for key in _tax_rates if key[0] == tax_id]:
+                del _tax_rates[key]
@@ -0,0 +1,184 @@
+"""A tiny offline stand-in for the Stripe API used by benchmarks and tests.
+
+Point ``STRIPE_API_BASE`` at a running stub and the views talk to it instead of
+api.stripe.com. Every call sleeps for ``latency`` seconds to mimic the network
+round trip, so server setups can be compared without real Stripe traffic.
+
+    python -m myapp.stripe_stub --port 12111 --latency 0.3
+"""
+
+import argparse
+import itertools
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+RESOURCES = {
+    "checkout/sessions": ("cs_test", "checkout.session"),
+    "coupons": ("coupon", "coupon"),
+    "tax_rates": ("txr", "tax_rate"),
+    "payment_intents": ("pi", "payment_intent"),
+    "products": ("prod", "product"),
+    "prices": ("price", "price"),
+}
+
+
+class StripeStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_params(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode() if length else ""
+        if not body:
+            body = urlsplit(self.path).query
+        return dict(parse_qsl(body, keep_blank_values=True))
+
+    def _route(self):
+        path = urlsplit(self.path).path.removeprefix("/v1/").strip("/")
+        for resource in RESOURCES:
+            if path == resource or path.startswith(resource + "/"):
+                rest = path[len(resource) :].strip("/")
+                parts = rest.split("/") if rest else []
+                return resource, parts
+        return None, []
+
+    def _respond(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Request-Id", f"req_stub_{next(self.server.counter)}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method):
+        self.server.record(method, self.path)
+        params = self._read_params()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.error_status:
+            return self._respond(
+                self.server.error_status,
+                {"error": {"type": "api_error", "message": "Stub failure"}},
+            )
+
+        resource, parts = self._route()
+        if resource is None:
+            return self._respond(
+                404, {"error": {"type": "invalid_request_error", "message": "Unknown path"}}
+            )
+
+        if not parts:
+            if method != "POST":
+                return self._respond(200, {"object": "list", "data": [], "has_more": False})
+            return self._respond(200, self.server.create(resource, params))
+
+        obj = self.server.objects.get(parts[0])
+        if obj is None:
+            return self._respond(
+                404, {"error": {"type": "invalid_request_error", "message": "No such object"}}
+            )
+        if method == "DELETE":
+            self.server.objects.pop(parts[0], None)
+            return self._respond(200, {"id": obj["id"], "object": obj["object"], "deleted": True})
+        if method == "POST":
+            if len(parts) > 1 and parts[1] == "cancel":
+                params["status"] = "canceled"
+            obj.update({key: value for key, value in params.items() if "[" not in key})
+        return self._respond(200, obj)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+class StripeStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        super().__init__((host, port), StripeStubHandler)
+        self.latency = latency
+        self.error_status = None
+        self.counter = itertools.count(1)
+        self.objects = {}
+        self.requests = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def handle_error(self, request, client_address):
+        # Clients that gave up on a slow response (timeouts) are expected.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record(self, method, path):
+        with self._lock:
+            self.requests.append((method, urlsplit(path).path))
+
+    def create(self, resource, params):
+        prefix, object_name = RESOURCES[resource]
+        object_id = f"{prefix}_{next(self.counter)}"
+        obj = {key: value for key, value in params.items() if "[" not in key}
+        obj.update({"id": object_id, "object": object_name, "livemode": False})
+        if object_name == "payment_intent":
+            obj["client_secret"] = f"{object_id}_secret_stub"
+            obj.setdefault("status", "requires_payment_method")
+            obj["amount"] = int(obj.get("amount", 0))
+        if object_name == "checkout.session":
+            obj["url"] = f"{self.url}/pay/{object_id}"
+            obj["status"] = "open"
+        with self._lock:
+            self.objects[object_id] = obj
+        return obj
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an offline Stripe API stub.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12111)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per call.")
+    args = parser.parse_args()
+
+    server = StripeStubServer(args.host, args.port, args.latency)
+    print(f"Stripe stub listening on {server.url} (latency {args.latency}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,117 @@
 # Create your tests here.
+import gzip
+import hashlib
+import hmac
 import json
-from unittest.mock import MagicMock, patch
-
+import os
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+from urllib.parse import urlencode
+
+import brotli
+import fakeredis
+import stripe
+from asgiref.sync import async_to_sync
 from django.conf import settings
-from django.test import Client, RequestFactory, TestCase
-from django.urls import reverse
-
-from .models import Discount, Item, Order, Tax
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import CacheHandler, caches
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections
+from django.http import Http404, HttpResponse, QueryDict
+from django.template import engines
+from django.templatetags.static import static
+from django.test import (
+    AsyncRequestFactory,
+    Client,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from hypothesis import assume, given
+from hypothesis import settings as hypothesis_settings
+from hypothesis import strategies as st
+from hypothesis.extra.django import TestCase as HypothesisTestCase
+
+from . import (
+    catalog_sync,
+    checkout,
+    checkout_cache,
+    db_routing,
+    loadtest,
+    order_api,
+    order_totals,
+    payment_intents,
+    perf,
+    pricing,
+    search,
+    storage,
+    stripe_clients,
+    stripe_events,
+    stripe_guard,
+    stripe_objects,
+    views_api,
+    views_async,
+)
+from .middleware import ReplicaRoutingMiddleware
+from .models import (
+    Discount,
+    Item,
+    Order,
+    OrderLine,
+    PaymentIntentRecord,
+    StripeCoupon,
+    StripeEvent,
+    StripeTaxRate,
+    Tax,
+)
+from .stripe_events import (
+    CHECKOUT_ASYNC_SUCCEEDED,
+    CHECKOUT_COMPLETED,
+    INTENT_FAILED,
+    INTENT_SUCCEEDED,
+)
+from .stripe_stub import StripeStubServer
 from .views import buy_item
 
 
+def patch_stripe_client(test_case):
+    client = MagicMock()
+    for service in (
+        client.checkout.sessions,
+        client.coupons,
+        client.tax_rates,
+        client.payment_intents,
+    ):
+        service.create_async = AsyncMock()
+
+    patcher = patch(
+        "myapp.stripe_clients.get_client",
+        side_effect=lambda currency: client if currency in settings.STRIPE_KEYS else None,
+    )
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+    return client
+
+
 class ItemDetailViewTest(TestCase):
     def setUp(self):
+        caches[settings.PAGE_CACHE_ALIAS].clear()
         self.item = Item.objects.create(name="Test Item", price=10.00, currency="USD")
         self.client = Client()
 
@@ -35,6 +135,8 @@ class ItemDetailViewTest(TestCase):
 
 class BuyItemViewTest(TestCase):
     def setUp(self):
+        self.stripe_client = patch_stripe_client(self)
+        caches[settings.CHECKOUT_SESSION_CACHE_ALIAS].clear()
         self.factory = RequestFactory()
         self.item = Item.objects.create(
             name="Test Item",
@@ -42,13 +144,14 @@ class BuyItemViewTest(TestCase):
             currency="USD",
         )
 
-    @patch("stripe.checkout.Session.create")
-    def test_buy_item_success(self, mock_stripe_create):
+    def test_buy_item_success(self):
+        mock_stripe_create = self.stripe_client.checkout.sessions.create
         mock_session = MagicMock()
         mock_session.id = "sess_12345"
         mock_stripe_create.return_value = mock_session
 
         request = self.factory.get(f"/buy/item/{self.item.id}/")
+        request.session = SessionStore()
         response = buy_item(request, self.item.id)
 
         self.assertEqual(response.status_code, 200)
@@ -60,6 +163,7 @@ class BuyItemViewTest(TestCase):
         self.item.currency = "EUR"
         self.item.save()
         request = self.factory.get(f"/buy/item/{self.item.id}/")
+        request.session = SessionStore()
         response = buy_item(request, self.item.id)
 
         self.assertEqual(response.status_code, 400)
@@ -67,11 +171,12 @@ class BuyItemViewTest(TestCase):
         self.assertIn("error", data)
         self.assertIn("Unsupported currency", data["error"])
 
-    @patch("stripe.checkout.Session.create")
-    def test_buy_item_stripe_exception(self, mock_stripe_create):
+    def test_buy_item_stripe_exception(self):
+        mock_stripe_create = self.stripe_client.checkout.sessions.create
         mock_stripe_create.side_effect = Exception("Stripe error")
 
         request = self.factory.get(f"/buy/item/{self.item.id}/")
+        request.session = SessionStore()
         response = buy_item(request, self.item.id)
 
         self.assertEqual(response.status_code, 400)
@@ -79,6 +184,143 @@ class BuyItemViewTest(TestCase):
         self.assertIn("error", data)
         self.assertEqual(data["error"], "Stripe error")
 
+    def test_buy_item_reuses_cached_session(self):
+        mock_stripe_create = self.stripe_client.checkout.sessions.create
+        mock_stripe_create.return_value = MagicMock(id="sess_12345")
+        url = reverse("buy_item", args=[self.item.id])
+
+        for _ in range(3):
+            self.assertEqual(self.client.get(url).json()["sessionId"], "sess_12345")
+
+        mock_stripe_create.assert_called_once()
+        params, options = mock_stripe_create.call_args.args
+        self.assertEqual(
+            options["idempotency_key"].split("-")[:3],
+            ["checkout", "item", self.client.session.session_key],
+        )
+        self.assertIn("expires_at", params)
+
+    def test_buy_item_new_session_after_content_change(self):
+        mock_stripe_create = self.stripe_client.checkout.sessions.create
+        mock_stripe_create.side_effect = [MagicMock(id="sess_1"), MagicMock(id="sess_2")]
+        url = reverse("buy_item", args=[self.item.id])
+
+        self.client.get(url)
+        self.item.price = 12.0
+        self.item.save()
+        response = self.client.get(url)
+
+        self.assertEqual(response.json()["sessionId"], "sess_2")
+        self.assertEqual(mock_stripe_create.call_count, 2)
+        first_key = mock_stripe_create.call_args_list[0].args[1]["idempotency_key"]
+        second_key = mock_stripe_create.call_args_list[1].args[1]["idempotency_key"]
+        self.assertNotEqual(first_key, second_key)
+
+    def test_completed_checkout_invalidates_cached_session(self):
+        mock_stripe_create = self.stripe_client.checkout.sessions.create
+        mock_stripe_create.side_effect = [MagicMock(id="sess_1"), MagicMock(id="sess_2")]
+        url = reverse("buy_item", args=[self.item.id])
+
+        self.client.get(url)
+        # What the webhook worker does for checkout.session.completed.
+        checkout_cache.invalidate("item", self.item.id)
+        response = self.client.get(url)
+
+        self.assertEqual(response.json()["sessionId"], "sess_2")
+        # A repeated key inside the reuse window would make Stripe replay the paid session.
+        first_key = mock_stripe_create.call_args_list[0].args[1]["idempotency_key"]
+        second_key = mock_stripe_create.call_args_list[1].args[1]["idempotency_key"]
+        self.assertNotEqual(first_key, second_key)
+
+    def test_payment_success_pages_do_not_write(self):
+        order = Order.objects.create(currency="USD")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("payment_success_item", args=[self.item.id]))
+            self.client.get(reverse("payment_success_order", args=[order.id]))
+
+        self.assertTrue(all(q["sql"].startswith("SELECT") for q in queries.captured_queries))
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.checkout_generation, 0)
+
+    def test_buyers_get_their_own_sessions(self):
+        mock_stripe_create = self.stripe_client.checkout.sessions.create
+        mock_stripe_create.side_effect = [MagicMock(id="sess_a"), MagicMock(id="sess_b")]
+        url = reverse("buy_item", args=[self.item.id])
+
+        first = self.client.get(url).json()["sessionId"]
+        second = Client().get(url).json()["sessionId"]
+
+        self.assertEqual((first, second), ("sess_a", "sess_b"))
+        first_key = mock_stripe_create.call_args_list[0].args[1]["idempotency_key"]
+        second_key = mock_stripe_create.call_args_list[1].args[1]["idempotency_key"]
+        self.assertNotEqual(first_key, second_key)
+
+
+class ItemPageCacheTest(TestCase):
+    def setUp(self):
+        caches[settings.PAGE_CACHE_ALIAS].clear()
+        self.item = Item.objects.create(name="Cached Item", price=10, currency="USD")
+        self.url = reverse("item_detail", args=[self.item.id])
+
+    def test_second_hit_served_from_cache(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(1):
+            second = self.client.get(self.url)
+
+        self.assertTemplateNotUsed(second, "items/item_detail.html")
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first["ETag"], second["ETag"])
+        self.assertIn("Last-Modified", second)
+        self.assertIn("no-cache", second["Cache-Control"])
+
+    def test_conditional_get_returns_304(self):
+        etag = self.client.get(self.url)["ETag"]
+        caches[settings.PAGE_CACHE_ALIAS].clear()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertTemplateNotUsed(response, "items/item_detail.html")
+
+    def test_item_save_invalidates_page(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        self.item.price = 25
+        self.item.save()
+        self.assertIsNone(
+            caches[settings.PAGE_CACHE_ALIAS].get(
+                f"item-page:items/item_detail.html:{self.item.id}"
+            )
+        )
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "25.00")
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_stale_entry_from_other_worker_is_not_served(self):
+        self.client.get(self.url)
+        Item.objects.filter(pk=self.item.pk).update(name="Renamed", updated_at=timezone.now())
+
+        self.assertContains(self.client.get(self.url), "Renamed")
+
+    def test_new_static_assets_invalidate_page(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        with override_settings(STATIC_URL="/assets/"):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "/assets/myapp/js/checkout.js")
+
+    def test_payment_success_intent_page_supports_conditional_get(self):
+        url = reverse("payment_success_item_intent", args=[self.item.id])
+        etag = self.client.get(url)["ETag"]
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(reverse("item_detail", args=[999])).status_code, 404)
+
 
 class PaymentSuccessItemViewTest(TestCase):
     def setUp(self):
@@ -131,16 +373,19 @@ class OrderDetailViewTest(TestCase):
 
 class BuyOrderViewTest(TestCase):
     def setUp(self):
+        self.stripe_client = patch_stripe_client(self)
+        caches[settings.CHECKOUT_SESSION_CACHE_ALIAS].clear()
+        stripe_objects.reset()
         self.tax = Tax.objects.create(name="VAT", percent=10)
         self.discount = Discount.objects.create(name="Black Friday", percent=5)
         self.order = Order.objects.create(currency="USD", tax=self.tax, discount=self.discount)
         self.item1 = Item.objects.create(name="Item 1", price=100, currency="USD")
         self.order.items.add(self.item1)
 
-    @patch("stripe.checkout.Session.create")
-    @patch("stripe.Coupon.create")
-    @patch("stripe.TaxRate.create")
-    def test_buy_order_success(self, mock_taxrate_create, mock_coupon_create, mock_session_create):
+    def test_buy_order_success(self):
+        mock_taxrate_create = self.stripe_client.tax_rates.create
+        mock_coupon_create = self.stripe_client.coupons.create
+        mock_session_create = self.stripe_client.checkout.sessions.create
         mock_session = MagicMock()
         mock_session.id = "sess_123"
         mock_session_create.return_value = mock_session
@@ -164,6 +409,22 @@ class BuyOrderViewTest(TestCase):
         mock_coupon_create.assert_called_once()
         mock_taxrate_create.assert_called_once()
 
+    def test_buy_order_sends_one_line_item_per_product(self):
+        mock_session_create = self.stripe_client.checkout.sessions.create
+        mock_session_create.return_value = MagicMock(id="sess_123")
+        self.stripe_client.coupons.create.return_value = MagicMock(id="coupon_123")
+        self.stripe_client.tax_rates.create.return_value = MagicMock(id="txr_123")
+        self.order.lines.update(quantity=500)
+
+        self.client.get(reverse("buy_order", args=[self.order.id]))
+
+        params = mock_session_create.call_args.args[0]
+        self.assertEqual(params["metadata"], {"order_id": str(self.order.id)})
+        line_items = params["line_items"]
+        self.assertEqual(len(line_items), 1)
+        self.assertEqual(line_items[0]["quantity"], 500)
+        self.assertEqual(line_items[0]["price_data"]["unit_amount"], 10000)
+
     def test_buy_order_unsupported_currency(self):
         self.order.currency = "XYZ"
         self.order.save()
@@ -175,9 +436,13 @@ class BuyOrderViewTest(TestCase):
         self.assertIn("error", response.json())
         self.assertIn("Unsupported currency", response.json()["error"])
 
-    @patch("stripe.checkout.Session.create")
-    def test_buy_order_stripe_exception(self, mock_session_create):
+    def test_buy_order_stripe_exception(self):
+        mock_taxrate_create = self.stripe_client.tax_rates.create
+        mock_coupon_create = self.stripe_client.coupons.create
+        mock_session_create = self.stripe_client.checkout.sessions.create
         mock_session_create.side_effect = Exception("Stripe error")
+        mock_coupon_create.return_value = MagicMock(id="coupon_123")
+        mock_taxrate_create.return_value = MagicMock(id="tax_123")
 
         url = reverse("buy_order", args=[self.order.id])
         response = self.client.get(url)
@@ -186,14 +451,100 @@ class BuyOrderViewTest(TestCase):
         self.assertIn("error", response.json())
         self.assertEqual(response.json()["error"], "Stripe error")
 
+    def test_buy_order_reuses_cached_session(self):
+        mock_taxrate_create = self.stripe_client.tax_rates.create
+        mock_coupon_create = self.stripe_client.coupons.create
+        mock_session_create = self.stripe_client.checkout.sessions.create
+        mock_session_create.return_value = MagicMock(id="sess_123")
+        mock_coupon_create.return_value = MagicMock(id="coupon_123")
+        mock_taxrate_create.return_value = MagicMock(id="tax_123")
+
+        url = reverse("buy_order", args=[self.order.id])
+        self.client.get(url)
+        response = self.client.get(url)
+
+        self.assertEqual(response.json()["sessionId"], "sess_123")
+        mock_session_create.assert_called_once()
+        mock_coupon_create.assert_called_once()
+        mock_taxrate_create.assert_called_once()
+
+
+class StripeObjectsTest(TestCase):
+    def setUp(self):
+        self.stripe_client = patch_stripe_client(self)
+        caches[settings.CHECKOUT_SESSION_CACHE_ALIAS].clear()
+        stripe_objects.reset()
+        self.tax = Tax.objects.create(name="VAT", percent=10)
+        self.discount = Discount.objects.create(name="Black Friday", percent=5)
+        self.item = Item.objects.create(name="Item 1", price=100, currency="USD")
+        self.orders = []
+        for _ in range(2):
+            order = Order.objects.create(currency="USD", tax=self.tax, discount=self.discount)
+            order.items.add(self.item)
+            self.orders.append(order)
+
+    def test_coupon_and_tax_rate_reused_across_orders(self):
+        mock_taxrate_create = self.stripe_client.tax_rates.create
+        mock_coupon_create = self.stripe_client.coupons.create
+        mock_session_create = self.stripe_client.checkout.sessions.create
+        mock_session_create.return_value = MagicMock(id="sess_123")
+        mock_coupon_create.return_value = MagicMock(id="coupon_123")
+        mock_taxrate_create.return_value = MagicMock(id="txr_123")
+
+        for order in self.orders:
+            self.client.get(reverse("buy_order", args=[order.id]))
+
+        mock_coupon_create.assert_called_once()
+        mock_taxrate_create.assert_called_once()
+        self.assertEqual(mock_session_create.call_count, 2)
+        params = mock_session_create.call_args.args[0]
+        self.assertEqual(params["discounts"], [{"coupon": "coupon_123"}])
+        self.assertEqual(params["line_items"][0]["tax_rates"], ["txr_123"])
+        self.assertEqual(StripeCoupon.objects.get().stripe_id, "coupon_123")
+        self.assertEqual(StripeTaxRate.objects.get().stripe_id, "txr_123")
+
+    def test_mapping_loaded_from_database(self):
+        mock_coupon_create = self.stripe_client.coupons.create
+        StripeCoupon.objects.create(
+            discount=self.discount, percent=5, account="unused", stripe_id="coupon_other"
+        )
+        StripeCoupon.objects.create(
+            discount=self.discount,
+            percent=5,
+            account=stripe_clients.get_account("USD"),
+            stripe_id="coupon_db",
+        )
 
+        self.assertEqual(stripe_objects.get_coupon_id(self.discount, "USD"), "coupon_db")
+        mock_coupon_create.assert_not_called()
+
+    def test_admin_percent_change_invalidates_coupon(self):
+        mock_coupon_create = self.stripe_client.coupons.create
+        mock_coupon_create.side_effect = [MagicMock(id="coupon_5"), MagicMock(id="coupon_7")]
+        User.objects.create_superuser("admin", "admin@example.com", "admin")
+        self.client.login(username="admin", password="admin")
+
+        self.assertEqual(stripe_objects.get_coupon_id(self.discount, "USD"), "coupon_5")
+        self.client.post(
+            reverse("admin:myapp_discount_change", args=[self.discount.id]),
+            {"name": self.discount.name, "percent": "7"},
+        )
+        self.discount.refresh_from_db()
+
+        self.assertFalse(StripeCoupon.objects.filter(stripe_id="coupon_5").exists())
+        self.assertEqual(stripe_objects.get_coupon_id(self.discount, "USD"), "coupon_7")
+
+
+@override_settings(INTENT_SECRET_MODE="inline")
 class ItemDetailIntentViewTest(TestCase):
     def setUp(self):
+        self.stripe_client = patch_stripe_client(self)
         self.item = Item.objects.create(name="Test Item", price=10.50, currency="USD")
 
-    @patch("stripe.PaymentIntent.create")
-    def test_item_detail_intent_success(self, mock_payment_intent_create):
+    def test_item_detail_intent_success(self):
+        mock_payment_intent_create = self.stripe_client.payment_intents.create
         mock_intent = MagicMock()
+        mock_intent.id = "pi_item"
         mock_intent.client_secret = "test_client_secret"
         mock_payment_intent_create.return_value = mock_intent
 
@@ -210,15 +561,21 @@ class ItemDetailIntentViewTest(TestCase):
         )
         self.assertEqual(response.context["client_secret"], "test_client_secret")
 
-        mock_payment_intent_create.assert_called_once_with(
-            amount=int(self.item.price * 100),
-            currency=self.item.currency.lower(),
-            metadata={"item_id": str(self.item.id)},
+        mock_payment_intent_create.assert_called_once()
+        self.assertEqual(
+            mock_payment_intent_create.call_args.args[0],
+            {
+                "amount": int(self.item.price * 100),
+                "currency": self.item.currency.lower(),
+                "metadata": {"item_id": str(self.item.id)},
+            },
         )
+        self.assertIn("idempotency_key", mock_payment_intent_create.call_args.args[1])
 
 
 class PaymentSuccessItemIntentViewTest(TestCase):
     def setUp(self):
+        caches[settings.PAGE_CACHE_ALIAS].clear()
         self.item = Item.objects.create(name="Test Item", price=10.50, currency="USD")
 
     def test_payment_success_item_intent_view(self):
@@ -231,8 +588,10 @@ class PaymentSuccessItemIntentViewTest(TestCase):
         self.assertEqual(response.context["item"], self.item)
 
 
+@override_settings(INTENT_SECRET_MODE="inline")
 class OrderDetailIntentViewTest(TestCase):
     def setUp(self):
+        self.stripe_client = patch_stripe_client(self)
         self.discount = Discount.objects.create(name="Test Discount", percent=10)
         self.tax = Tax.objects.create(name="Test Tax", percent=5)
         self.order = Order.objects.create(currency="USD", discount=self.discount, tax=self.tax)
@@ -240,8 +599,9 @@ class OrderDetailIntentViewTest(TestCase):
         self.item2 = Item.objects.create(name="Item 2", price=200, currency="USD")
         self.order.items.add(self.item1, self.item2)
 
-    @patch("stripe.PaymentIntent.create")
-    def test_order_detail_intent_view(self, mock_payment_intent_create):
+    def test_order_detail_intent_view(self):
+        mock_payment_intent_create = self.stripe_client.payment_intents.create
+        mock_payment_intent_create.return_value.id = "pi_order"
         mock_payment_intent_create.return_value.client_secret = "test_secret"
 
         url = reverse("order_detail_intent", args=[self.order.id])
@@ -284,10 +644,14 @@ class OrderDetailIntentViewTest(TestCase):
 
         self.assertEqual(context["currency"], self.order.currency)
 
-        mock_payment_intent_create.assert_called_once_with(
-            amount=int(expected_total_amount * 100),
-            currency=self.order.currency.lower(),
-            metadata={"order_id": str(self.order.id)},
+        mock_payment_intent_create.assert_called_once()
+        self.assertEqual(
+            mock_payment_intent_create.call_args.args[0],
+            {
+                "amount": int(expected_total_amount * 100),
+                "currency": self.order.currency.lower(),
+                "metadata": {"order_id": str(self.order.id)},
+            },
         )
 
 
@@ -303,3 +667,1656 @@ class PaymentSuccessOrderIntentViewTest(TestCase):
         self.assertTemplateUsed(response, "intent/orders/payment_success_order_intent.html")
         self.assertIn("order", response.context)
         self.assertEqual(response.context["order"], self.order)
+
+
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        self.stripe_client = patch_stripe_client(self)
+        caches[settings.CHECKOUT_SESSION_CACHE_ALIAS].clear()
+        stripe_objects.reset()
+        self.factory = AsyncRequestFactory()
+        self.tax = Tax.objects.create(name="VAT", percent=10)
+        self.discount = Discount.objects.create(name="Black Friday", percent=5)
+        self.item = Item.objects.create(name="Item 1", price=100, currency="USD")
+        self.order = Order.objects.create(currency="USD", tax=self.tax, discount=self.discount)
+        self.order.items.add(self.item)
+
+    async def test_buy_item_async(self):
+        mock_session_create = self.stripe_client.checkout.sessions.create_async
+        mock_session_create.return_value = MagicMock(id="sess_async")
+
+        session = SessionStore()
+        for _ in range(2):
+            request = self.factory.get(f"/buy/{self.item.id}/")
+            request.session = session
+            response = await views_async.buy_item(request, self.item.id)
+            self.assertEqual(json.loads(response.content)["sessionId"], "sess_async")
+
+        mock_session_create.assert_awaited_once()
+
+    async def test_buy_order_async(self):
+        mock_taxrate_create = self.stripe_client.tax_rates.create_async
+        mock_coupon_create = self.stripe_client.coupons.create_async
+        mock_session_create = self.stripe_client.checkout.sessions.create_async
+        mock_session_create.return_value = MagicMock(id="sess_async")
+        mock_coupon_create.return_value = MagicMock(id="coupon_async")
+        mock_taxrate_create.return_value = MagicMock(id="txr_async")
+
+        request = self.factory.get(f"/buy/order/{self.order.id}/")
+        request.session = SessionStore()
+        response = await views_async.buy_order(request, self.order.id)
+
+        self.assertEqual(json.loads(response.content)["sessionId"], "sess_async")
+        params = mock_session_create.call_args.args[0]
+        self.assertEqual(params["discounts"], [{"coupon": "coupon_async"}])
+        self.assertEqual(params["line_items"][0]["tax_rates"], ["txr_async"])
+        self.assertTrue(await StripeCoupon.objects.filter(stripe_id="coupon_async").aexists())
+
+    async def test_buy_item_async_404(self):
+        request = self.factory.get("/buy/9999/")
+        with self.assertRaises(Http404):
+            await views_async.buy_item(request, 9999)
+
+    @override_settings(INTENT_SECRET_MODE="inline")
+    async def test_order_detail_intent_async(self):
+        mock_payment_intent_create = self.stripe_client.payment_intents.create_async
+        mock_payment_intent_create.return_value = MagicMock(
+            id="pi_async", client_secret="secret_async"
+        )
+
+        request = self.factory.get(f"/intent/order/{self.order.id}/")
+        request.session = SessionStore()
+        response = await views_async.order_detail_intent(request, self.order.id)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"secret_async", response.content)
+        self.assertEqual(mock_payment_intent_create.call_args.args[0]["amount"], 10450)
+
+
+class StripeClientsTest(TestCase):
+    def tearDown(self):
+        stripe_clients.build_clients()
+
+    @override_settings(
+        STRIPE_KEYS={
+            "USD": {"secret": "sk_test_usd", "public": "pk_test_usd"},
+            "RUB": {"secret": "sk_test_rub", "public": "pk_test_rub"},
+            "EUR": {"secret": None, "public": None},
+        }
+    )
+    def test_registry_builds_one_client_per_account(self):
+        stripe.api_key = None
+        stripe_clients.build_clients()
+
+        usd_client = stripe_clients.get_client("USD")
+        rub_client = stripe_clients.get_client("RUB")
+
+        self.assertIsNotNone(usd_client)
+        self.assertIsNotNone(rub_client)
+        self.assertIsNot(usd_client, rub_client)
+        self.assertIsNone(stripe_clients.get_client("EUR"))
+        self.assertNotEqual(stripe_clients.get_account("USD"), stripe_clients.get_account("RUB"))
+        self.assertIsNone(stripe.api_key)
+
+
+class OrderTotalsTest(TestCase):
+    def setUp(self):
+        self.tax = Tax.objects.create(name="VAT", percent=10)
+        self.discount = Discount.objects.create(name="Black Friday", percent=5)
+        self.order = Order.objects.create(currency="USD", tax=self.tax, discount=self.discount)
+        self.item1 = Item.objects.create(name="Item 1", price=100, currency="USD")
+        self.item2 = Item.objects.create(name="Item 2", price="50.55", currency="USD")
+
+    def assertTotals(self, items_total, total_amount):
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.items_total, Decimal(items_total))
+        self.assertEqual(self.order.total_amount, Decimal(total_amount))
+
+    def test_totals_follow_item_changes(self):
+        self.order.items.add(self.item1, self.item2)
+        self.assertEqual(self.order.total_amount, Decimal("157.32"))
+        self.assertTotals("150.55", "157.32")
+
+        self.order.items.remove(self.item2)
+        self.assertTotals("100.00", "104.50")
+
+        self.item1.price = 200
+        self.item1.save()
+        self.assertTotals("100.00", "104.50")
+
+        self.item1.order_set.clear()
+        self.assertTotals("0.00", "0.00")
+
+    def test_totals_follow_discount_tax_and_deletes(self):
+        self.order.items.add(self.item1, self.item2)
+
+        self.discount.percent = 0
+        self.discount.save()
+        self.assertTotals("150.55", "165.61")
+
+        self.tax.delete()
+        self.assertTotals("150.55", "150.55")
+
+        self.item2.delete()
+        self.assertTotals("100.00", "100.00")
+
+    def test_totals_follow_line_quantities(self):
+        self.order.items.add(self.item1, through_defaults={"quantity": 3})
+        self.assertEqual(self.order.lines.get().unit_price, Decimal("100.00"))
+        self.assertTotals("300.00", "313.50")
+
+        line = OrderLine.objects.create(order=self.order, item=self.item2, quantity=2)
+        line.refresh_from_db()
+        self.assertEqual(line.unit_price, Decimal("50.55"))
+        self.assertTotals("401.10", "419.15")
+
+        line.quantity = 1
+        line.save()
+        self.assertTotals("350.55", "366.32")
+
+        line.delete()
+        self.assertTotals("300.00", "313.50")
+
+    def test_order_save_recomputes_total(self):
+        self.order.items.add(self.item1)
+        self.order.discount = None
+        self.order.save(update_fields=["discount"])
+        self.assertTotals("100.00", "110.00")
+
+    def test_order_total_price_matches_detail_page(self):
+        self.order.items.add(self.item1, self.item2)
+        response = self.client.get(reverse("order_detail", args=[self.order.id]))
+        self.assertContains(response, "157.32")
+
+    def test_recompute_command_verifies_and_backfills(self):
+        self.order.items.add(self.item1, self.item2)
+        Order.objects.filter(pk=self.order.pk).update(items_total=0, total_amount=0)
+
+        with self.assertRaises(CommandError):
+            call_command("recompute_order_totals", "--verify", stdout=StringIO())
+
+        call_command("recompute_order_totals", stdout=StringIO())
+        self.assertTotals("150.55", "157.32")
+        call_command("recompute_order_totals", "--verify", stdout=StringIO())
+
+
+class OrderAdminTest(TestCase):
+    def setUp(self):
+        User.objects.create_superuser("admin", "admin@example.com", "admin")
+        self.client.login(username="admin", password="admin")
+        self.tax = Tax.objects.create(name="VAT", percent=10)
+        self.discount = Discount.objects.create(name="Black Friday", percent=5)
+        self.items = [
+            Item.objects.create(name=f"Item {i}", price=price, currency="USD")
+            for i, price in enumerate([10, 20, 1000])
+        ]
+
+    def create_orders(self, count):
+        for i in range(count):
+            order = Order.objects.create(currency="USD", tax=self.tax, discount=self.discount)
+            order.items.add(*self.items[: i % 3 + 1])
+
+    def changelist_queries(self, count):
+        Order.objects.all().delete()
+        self.create_orders(count)
+        url = reverse("admin:myapp_order_changelist")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_query_count_does_not_grow_with_rows(self):
+        self.assertEqual(self.changelist_queries(5), self.changelist_queries(50))
+
+    def test_change_form_rejects_line_in_other_currency(self):
+        rub_item = Item.objects.create(name="RUB item", price=10, currency="RUB")
+        response = self.client.post(
+            reverse("admin:myapp_order_add"),
+            {
+                "currency": "USD",
+                "lines-TOTAL_FORMS": "1",
+                "lines-INITIAL_FORMS": "0",
+                "lines-0-item": rub_item.id,
+                "lines-0-quantity": "2",
+            },
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Order.objects.exists())
+
+    def test_change_form_saves_lines(self):
+        response = self.client.post(
+            reverse("admin:myapp_order_add"),
+            {
+                "currency": "USD",
+                "discount": self.discount.id,
+                "lines-TOTAL_FORMS": "1",
+                "lines-INITIAL_FORMS": "0",
+                "lines-0-item": self.items[1].id,
+                "lines-0-quantity": "2",
+            },
+        )
+
+        self.assertEqual(response.status_code, 302)
+        order = Order.objects.get()
+        self.assertEqual(order.items_total, Decimal("40.00"))
+        self.assertEqual(order.total_amount, Decimal("38.00"))
+
+    def test_changelist_sorts_and_filters_by_total(self):
+        self.create_orders(3)
+        url = reverse("admin:myapp_order_changelist")
+
+        response = self.client.get(url, {"o": "3"})
+        totals = [order.total_amount for order in response.context["cl"].result_list]
+        self.assertEqual(totals, sorted(totals))
+
+        response = self.client.get(url, {"total": "USD:gte1000"})
+        result = response.context["cl"].result_list
+        self.assertEqual([order.total_amount for order in result], [Decimal("1076.35")])
+
+        response = self.client.get(url, {"total": "USD:lt100"})
+        result = response.context["cl"].result_list
+        self.assertEqual(
+            {order.total_amount for order in result}, {Decimal("10.45"), Decimal("31.35")}
+        )
+
+    def test_total_filter_buckets_each_currency_separately(self):
+        self.create_orders(3)
+        rub_item = Item.objects.create(name="RUB item", price=2000, currency="RUB")
+        rub_order = Order.objects.create(currency="RUB")
+        rub_order.items.add(rub_item)
+        url = reverse("admin:myapp_order_changelist")
+
+        response = self.client.get(url, {"total": "USD:gte1000"})
+        self.assertNotIn(rub_order, response.context["cl"].result_list)
+
+        response = self.client.get(url, {"total": "RUB:lt10000"})
+        self.assertEqual(list(response.context["cl"].result_list), [rub_order])
+        self.assertContains(response, "RUB 10000 to 50000")
+
+
+class CatalogImportExportTest(TestCase):
+    def setUp(self):
+        self.tax = Tax.objects.create(name="VAT", percent=10)
+        self.discount = Discount.objects.create(name="Black Friday", percent=5)
+        self.item1 = Item.objects.create(name="Item 1", price=100, currency="USD")
+        self.item2 = Item.objects.create(name="Item 2", price="2.50", currency="USD")
+        self.order = Order.objects.create(currency="USD", tax=self.tax, discount=self.discount)
+        self.order.items.add(self.item1)
+        self.order.items.add(self.item2, through_defaults={"quantity": 4})
+
+    def export(self, model, fmt, tmpdir):
+        path = f"{tmpdir}/{model}.{fmt}"
+        call_command("export_catalog", model, path, stderr=StringIO())
+        return path
+
+    def test_round_trip_recreates_catalog_and_orders(self):
+        for fmt in ("jsonl", "csv"):
+            with self.subTest(fmt=fmt), tempfile.TemporaryDirectory() as tmpdir:
+                paths = [self.export(m, fmt, tmpdir) for m in ("tax", "discount", "item", "order")]
+                Order.objects.all().delete()
+                Item.objects.all().delete()
+                Discount.objects.all().delete()
+                Tax.objects.all().delete()
+
+                for model, path in zip(("tax", "discount", "item", "order"), paths):
+                    call_command(
+                        "import_catalog", model, path, "--batch-size", "1", stdout=StringIO()
+                    )
+
+                order = Order.objects.get(pk=self.order.pk)
+                self.assertEqual(order.discount_id, self.discount.pk)
+                self.assertEqual(
+                    list(order.lines.values_list("item_id", "quantity", "unit_price")),
+                    [(self.item1.pk, 1, Decimal("100.00")), (self.item2.pk, 4, Decimal("2.50"))],
+                )
+                self.assertEqual(order.items_total, Decimal("110.00"))
+                self.assertEqual(order.total_amount, Decimal("114.95"))
+
+    def test_import_updates_existing_rows_and_order_totals(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = f"{tmpdir}/discounts.jsonl"
+            with open(path, "w") as stream:
+                stream.write(json.dumps({"id": self.discount.pk, "name": "Sale", "percent": "0"}))
+                stream.write("\n")
+                stream.write(json.dumps({"name": "New", "percent": "15"}) + "\n")
+
+            out = StringIO()
+            call_command("import_catalog", "discount", path, stdout=out)
+
+        self.assertIn("1 created, 1 updated", out.getvalue())
+        self.assertEqual(Discount.objects.get(pk=self.discount.pk).name, "Sale")
+        self.assertTrue(Discount.objects.filter(name="New", percent=15).exists())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, Decimal("121.00"))
+
+    def test_import_creates_order_lines_in_one_insert_per_batch(self):
+        rows = [
+            {"currency": "USD", "discount": None, "tax": None, "lines": [{"item": self.item1.pk}]},
+            {
+                "currency": "USD",
+                "discount": None,
+                "tax": None,
+                "lines": [{"item": self.item1.pk}, {"item": self.item2.pk, "quantity": 2}],
+            },
+        ]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = f"{tmpdir}/orders.jsonl"
+            with open(path, "w") as stream:
+                stream.writelines(json.dumps(row) + "\n" for row in rows)
+
+            with CaptureQueriesContext(connection) as queries:
+                call_command("import_catalog", "order", path, stdout=StringIO())
+
+        inserts = [q for q in queries if q["sql"].startswith('INSERT INTO "myapp_orderline"')]
+        self.assertEqual(len(inserts), 1)
+        totals = Order.objects.exclude(pk=self.order.pk).order_by("pk")
+        self.assertEqual([o.total_amount for o in totals], [Decimal("100.00"), Decimal("105.00")])
+
+    def test_import_reports_bad_rows(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = f"{tmpdir}/items.csv"
+            with open(path, "w") as stream:
+                stream.write("id,name,description,price,currency\n,Broken,,not-a-price,USD\n")
+
+            with self.assertRaises(CommandError):
+                call_command("import_catalog", "item", path, stdout=StringIO())
+
+
+@override_settings(
+    STRIPE_KEYS={
+        "USD": {"secret": "sk_test_usd", "public": "pk_test_usd", "webhook": "whsec_usd"},
+        "RUB": {"secret": "sk_test_rub", "public": "pk_test_rub", "webhook": "whsec_rub"},
+    }
+)
+class StripeWebhookTest(TestCase):
+    def setUp(self):
+        caches[settings.CHECKOUT_SESSION_CACHE_ALIAS].clear()
+        self.item = Item.objects.create(name="Item 1", price=100, currency="USD")
+        self.order = Order.objects.create(currency="USD")
+        self.order.items.add(self.item)
+
+    def post_event(self, event_type, obj, event_id="evt_1", secret="whsec_rub"):
+        payload = json.dumps({"id": event_id, "type": event_type, "data": {"object": obj}})
+        timestamp = int(time.time())
+        signature = hmac.new(
+            secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256
+        ).hexdigest()
+        return self.client.post(
+            reverse("stripe_webhook"),
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}",
+        )
+
+    def session(self, payment_status="paid"):
+        return {
+            "object": "checkout.session",
+            "payment_status": payment_status,
+            "metadata": {"order_id": str(self.order.id)},
+        }
+
+    def test_rejects_bad_signature(self):
+        response = self.post_event(CHECKOUT_COMPLETED, self.session(), secret="whsec_other")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_enqueues_each_event_once(self):
+        response = self.post_event(CHECKOUT_COMPLETED, self.session())
+        self.post_event("customer.created", {"object": "customer"}, event_id="evt_2")
+        with self.assertNumQueries(1):
+            stripe_events.enqueue({"id": "evt_1", "type": CHECKOUT_COMPLETED, "data": {}})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StripeEvent.objects.get().status, StripeEvent.STATUS_PENDING)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, Order.PAYMENT_UNPAID)
+
+    def test_worker_marks_order_paid_and_drops_cached_session(self):
+        self.post_event(CHECKOUT_COMPLETED, self.session())
+
+        call_command("process_stripe_events", "--once", stdout=StringIO())
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, Order.PAYMENT_PAID)
+        self.assertEqual(self.order.checkout_generation, 1)
+        event = StripeEvent.objects.get()
+        self.assertEqual(event.status, StripeEvent.STATUS_PROCESSED)
+        self.assertIsNotNone(event.processed_at)
+
+    def test_worker_with_its_own_cache_still_rotates_web_sessions(self):
+        stripe_client = patch_stripe_client(self)
+        create = stripe_client.checkout.sessions.create
+        create.side_effect = [MagicMock(id="sess_before"), MagicMock(id="sess_after")]
+        url = reverse("buy_order", args=[self.order.id])
+        self.assertEqual(self.client.get(url).json()["sessionId"], "sess_before")
+
+        # The worker runs in another container, so it never sees the web's LocMem cache.
+        worker_caches = {
+            **settings.CACHES,
+            settings.CHECKOUT_SESSION_CACHE_ALIAS: {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "checkout-sessions-worker",
+            },
+        }
+        self.post_event(CHECKOUT_COMPLETED, self.session())
+        with override_settings(CACHES=worker_caches):
+            call_command("process_stripe_events", "--once", stdout=StringIO())
+
+        self.assertEqual(self.client.get(url).json()["sessionId"], "sess_after")
+        keys = [call.args[1]["idempotency_key"] for call in create.call_args_list]
+        self.assertNotEqual(keys[0], keys[1])
+
+    def test_late_failure_does_not_downgrade_paid_order(self):
+        self.post_event(CHECKOUT_COMPLETED, self.session("unpaid"), event_id="evt_1")
+        self.post_event(CHECKOUT_ASYNC_SUCCEEDED, self.session(), event_id="evt_2")
+        call_command("process_stripe_events", "--once", stdout=StringIO())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, Order.PAYMENT_PAID)
+
+        intent = {"object": "payment_intent", "metadata": {"order_id": str(self.order.id)}}
+        self.post_event(INTENT_FAILED, intent, event_id="evt_3")
+        call_command("process_stripe_events", "--once", stdout=StringIO())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, Order.PAYMENT_PAID)
+
+    def test_paid_wins_over_a_later_event_in_the_same_batch(self):
+        self.post_event(CHECKOUT_ASYNC_SUCCEEDED, self.session(), event_id="evt_1")
+        self.post_event(CHECKOUT_COMPLETED, self.session("unpaid"), event_id="evt_2")
+
+        self.assertEqual(stripe_events.process_batch(), 2)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, Order.PAYMENT_PAID)
+
+    def test_bad_event_does_not_block_batch(self):
+        bad = {"object": "payment_intent", "metadata": {"order_id": "not-a-number"}}
+        self.post_event(INTENT_FAILED, bad, event_id="evt_bad")
+        self.post_event(CHECKOUT_COMPLETED, self.session(), event_id="evt_good")
+
+        call_command("process_stripe_events", "--once", stdout=StringIO())
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, Order.PAYMENT_PAID)
+        bad_event = StripeEvent.objects.get(event_id="evt_bad")
+        self.assertEqual(bad_event.attempts, 1)
+        self.assertNotEqual(bad_event.last_error, "")
+
+
+class LoadTestHarnessTest(TestCase):
+    def setUp(self):
+        self.item = Item.objects.create(name="Item 1", price=100, currency="USD")
+        self.order = Order.objects.create(currency="USD")
+        self.order.items.add(self.item)
+
+    def test_generated_workload_covers_routes(self):
+        specs = loadtest.generate_workload(200, seed=1)
+
+        self.assertEqual(len(specs), 200)
+        self.assertEqual(specs, loadtest.generate_workload(200, seed=1))
+        routes = {loadtest.route_name(spec["path"]) for spec in specs}
+        self.assertTrue({"item_detail", "buy_item", "order_detail", "buy_order"} <= routes)
+
+    def test_wsgi_call_counts_queries_per_request(self):
+        loadtest.start_query_counting()
+        self.addCleanup(loadtest.stop_query_counting)
+        recorder = loadtest.Recorder()
+
+        for path in [f"/item/{self.item.id}/", f"/order/{self.order.id}/", "/item/999/"]:
+            counter = [0]
+            token = loadtest._query_counter.set(counter)
+            status = loadtest.call_wsgi(WSGIHandler(), {"method": "GET", "path": path})
+            loadtest._query_counter.reset(token)
+            recorder.add(loadtest.route_name(path), status, 0.01, counter[0])
+
+        summary = loadtest.summarize(recorder.samples, elapsed=1.0)
+        self.assertEqual(summary["item_detail"]["requests"], 2)
+        self.assertEqual(summary["item_detail"]["errors"], 1)
+        self.assertEqual(summary["item_detail"]["queries"], 1)
+        self.assertGreater(summary["order_detail"]["queries"], 1)
+
+    def test_percentile_uses_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(loadtest.percentile(values, 50), 50)
+        self.assertEqual(loadtest.percentile(values, 99), 99)
+        self.assertEqual(loadtest.percentile([7], 95), 7)
+        self.assertEqual(loadtest.percentile([], 95), 0.0)
+
+    def test_trace_middleware_records_replayable_requests(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = f"{tmpdir}/trace.jsonl"
+            with override_settings(LOADTEST_TRACE_FILE=path):
+                Client().get(f"/item/{self.item.id}/?ref=test")
+                Client().post(reverse("stripe_webhook"), "{}", content_type="application/json")
+
+            specs = loadtest.load_trace(path)
+
+        self.assertEqual(specs[0], {"method": "GET", "path": f"/item/{self.item.id}/?ref=test"})
+        self.assertEqual(specs[1]["method"], "POST")
+        self.assertEqual(specs[1]["body"], "{}")
+        self.assertEqual(specs[1]["content_type"], "application/json")
+
+    def test_trace_middleware_keeps_credentials_out_of_the_trace(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = f"{tmpdir}/trace.jsonl"
+            with override_settings(LOADTEST_TRACE_FILE=path):
+                Client().post(reverse("admin:login"), {"username": "admin", "password": "s3cret"})
+                Client().post(
+                    reverse("index"),
+                    {"email": "a@example.com", "password": "s3cret", "csrfmiddlewaretoken": "tok"},
+                )
+
+            specs = loadtest.load_trace(path)
+
+        self.assertEqual(len(specs), 1)
+        self.assertEqual(specs[0]["path"], reverse("index"))
+        self.assertEqual(
+            QueryDict(specs[0]["body"]).dict(),
+            {"email": "a@example.com", "password": "redacted", "csrfmiddlewaretoken": "redacted"},
+        )
+
+
+@override_settings(INTENT_SECRET_MODE="inline")
+class PaymentIntentReuseTest(TestCase):
+    def setUp(self):
+        self.stripe_client = patch_stripe_client(self)
+        self.stripe_client.payment_intents.create.side_effect = [
+            MagicMock(id="pi_1", client_secret="secret_1"),
+            MagicMock(id="pi_2", client_secret="secret_2"),
+        ]
+        self.item = Item.objects.create(name="Item 1", price=100, currency="USD")
+        self.url = reverse("item_detail_intent", args=[self.item.id])
+
+    def test_repeat_view_reuses_intent(self):
+        first = self.client.get(self.url)
+        second = self.client.get(self.url)
+
+        self.assertEqual(first.context["client_secret"], "secret_1")
+        self.assertEqual(second.context["client_secret"], "secret_1")
+        self.stripe_client.payment_intents.create.assert_called_once()
+        self.stripe_client.payment_intents.update.assert_not_called()
+
+        other = Client().get(self.url)
+        self.assertEqual(other.context["client_secret"], "secret_2")
+        self.assertEqual(PaymentIntentRecord.objects.count(), 2)
+
+    def test_price_change_updates_intent_in_place(self):
+        self.client.get(self.url)
+        self.item.price = 120
+        self.item.save()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.context["client_secret"], "secret_1")
+        self.stripe_client.payment_intents.update.assert_called_once_with("pi_1", {"amount": 12000})
+        self.assertEqual(PaymentIntentRecord.objects.get().amount, 12000)
+
+    def test_finished_intent_is_replaced(self):
+        self.client.get(self.url)
+        self.item.price = 120
+        self.item.save()
+        self.stripe_client.payment_intents.update.side_effect = stripe.InvalidRequestError(
+            "already succeeded", None
+        )
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.context["client_secret"], "secret_2")
+        self.assertEqual(PaymentIntentRecord.objects.get().stripe_id, "pi_2")
+
+    def test_concurrent_insert_keeps_the_stored_intent(self):
+        request = RequestFactory().get(self.url)
+        request.session = SessionStore()
+        winner = PaymentIntentRecord(
+            session_key=payment_intents.session_key(request),
+            kind="item",
+            object_id=self.item.id,
+            account=stripe_clients.get_account("USD"),
+            currency="USD",
+            amount=10000,
+            fingerprint="other-request",
+            stripe_id="pi_0",
+            client_secret="secret_0",
+        )
+
+        def create_while_other_request_stores(params, options):
+            winner.save()
+            return MagicMock(id="pi_1", client_secret="secret_1")
+
+        self.stripe_client.payment_intents.create.side_effect = create_while_other_request_stores
+        with patch.object(
+            PaymentIntentRecord.objects, "update_or_create", side_effect=IntegrityError
+        ):
+            secret = payment_intents.get_client_secret(
+                request, self.stripe_client, "item", self.item.id, "USD", 10000, {}
+            )
+
+        self.assertEqual(secret, "secret_0")
+        self.assertEqual(PaymentIntentRecord.objects.get().stripe_id, "pi_0")
+
+    def test_sweeper_cancels_stale_intents(self):
+        self.client.get(self.url)
+        Client().get(self.url)
+        PaymentIntentRecord.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        self.stripe_client.payment_intents.cancel.side_effect = [
+            None,
+            stripe.InvalidRequestError("already succeeded", None),
+        ]
+
+        out = StringIO()
+        call_command("sweep_payment_intents", "--max-age", "3600", stdout=out)
+
+        self.assertIn("Canceled 1 intents, closed 1", out.getvalue())
+        statuses = dict(PaymentIntentRecord.objects.values_list("stripe_id", "status"))
+        self.assertEqual(
+            statuses,
+            {
+                "pi_1": PaymentIntentRecord.STATUS_CANCELED,
+                "pi_2": PaymentIntentRecord.STATUS_CLOSED,
+            },
+        )
+        self.assertEqual(payment_intents.sweep_stale(3600), (0, 0))
+
+    def test_succeeded_event_closes_record(self):
+        self.client.get(self.url)
+        event = StripeEvent.objects.create(
+            event_id="evt_1",
+            type=INTENT_SUCCEEDED,
+            payload={"data": {"object": {"object": "payment_intent", "id": "pi_1"}}},
+        )
+
+        stripe_events.process_batch()
+
+        event.refresh_from_db()
+        self.assertEqual(event.status, StripeEvent.STATUS_PROCESSED)
+        record = PaymentIntentRecord.objects.get()
+        self.assertEqual(record.status, PaymentIntentRecord.STATUS_SUCCEEDED)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["client_secret"], "secret_2")
+
+
+class LazyIntentSecretTest(TestCase):
+    def setUp(self):
+        self.stripe_client = patch_stripe_client(self)
+        self.stripe_client.payment_intents.create.return_value = MagicMock(
+            id="pi_1", client_secret="secret_1"
+        )
+        self.item = Item.objects.create(name="Item 1", price=100, currency="USD")
+        self.order = Order.objects.create(currency="USD")
+        self.order.items.add(self.item)
+
+    def test_pages_render_without_stripe(self):
+        item_page = self.client.get(reverse("item_detail_intent", args=[self.item.id]))
+        order_page = self.client.get(reverse("order_detail_intent", args=[self.order.id]))
+
+        self.assertIsNone(item_page.context["client_secret"])
+        self.assertContains(item_page, reverse("item_intent_secret", args=[self.item.id]))
+        self.assertContains(order_page, reverse("order_intent_secret", args=[self.order.id]))
+        self.stripe_client.payment_intents.create.assert_not_called()
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, item_page.cookies)
+
+    def test_secret_endpoint_creates_then_reuses_intent(self):
+        url = reverse("item_intent_secret", args=[self.item.id])
+
+        first = self.client.get(url)
+        second = self.client.get(url)
+
+        self.assertEqual(first.json(), {"clientSecret": "secret_1"})
+        self.assertEqual(second.json(), {"clientSecret": "secret_1"})
+        self.assertIn("no-store", first["Cache-Control"])
+        self.stripe_client.payment_intents.create.assert_called_once()
+
+    def test_order_secret_endpoint_uses_order_total(self):
+        response = self.client.get(reverse("order_intent_secret", args=[self.order.id]))
+
+        self.assertEqual(response.json(), {"clientSecret": "secret_1"})
+        params = self.stripe_client.payment_intents.create.call_args.args[0]
+        self.assertEqual(params["amount"], 10000)
+        self.assertEqual(params["metadata"], {"order_id": str(self.order.id)})
+
+    def test_secret_endpoint_rejects_unsupported_currency(self):
+        item = Item.objects.create(name="Item 2", price=100, currency="EUR")
+
+        response = self.client.get(reverse("item_intent_secret", args=[item.id]))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.json())
+
+    async def test_async_secret_endpoint(self):
+        self.stripe_client.payment_intents.create_async.return_value = MagicMock(
+            id="pi_async", client_secret="secret_async"
+        )
+        request = AsyncRequestFactory().get(f"/intent/item/{self.item.id}/secret/")
+        request.session = SessionStore()
+
+        response = await views_async.item_intent_secret(request, self.item.id)
+
+        self.assertEqual(json.loads(response.content), {"clientSecret": "secret_async"})
+
+    def test_secret_endpoints_answer_stripe_errors_with_json(self):
+        self.stripe_client.payment_intents.create.side_effect = stripe.CardError(
+            "Amount too large", "amount", "amount_too_large"
+        )
+
+        for url in (
+            reverse("item_intent_secret", args=[self.item.id]),
+            reverse("order_intent_secret", args=[self.order.id]),
+        ):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 400, url)
+            self.assertEqual(response.json(), {"error": "Amount too large"})
+
+    async def test_async_secret_endpoint_answers_stripe_errors_with_json(self):
+        self.stripe_client.payment_intents.create_async.side_effect = stripe.InvalidRequestError(
+            "Invalid currency", "currency"
+        )
+        request = AsyncRequestFactory().get(f"/intent/order/{self.order.id}/secret/")
+        request.session = SessionStore()
+
+        response = await views_async.order_intent_secret(request, self.order.id)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content), {"error": "Invalid currency"})
+
+
+money = st.decimals(min_value=0, max_value=Decimal("99999999.99"), places=2)
+percents = st.decimals(min_value=0, max_value=100, places=2)
+
+
+def reference_total(items_total, discount_percent, tax_percent):
+    subtotal = items_total - items_total * discount_percent / 100
+    total = subtotal + subtotal * tax_percent / 100
+    return total.quantize(Decimal("0.01"), rounding="ROUND_HALF_UP")
+
+
+class PricingPropertiesTest(SimpleTestCase):
+    @given(money)
+    def test_minor_units_round_trip(self, amount):
+        self.assertEqual(pricing.from_minor(pricing.to_minor(amount)), amount)
+
+    @given(money, percents, percents)
+    def test_total_matches_decimal_arithmetic(self, items_total, discount_percent, tax_percent):
+        self.assertEqual(
+            pricing.order_total(items_total, discount_percent, tax_percent),
+            reference_total(items_total, discount_percent, tax_percent),
+        )
+
+    @given(st.integers(min_value=0, max_value=10**12), percents, percents)
+    def test_breakdown_adds_up(self, items_minor, discount_percent, tax_percent):
+        prices = pricing.breakdown(items_minor, discount_percent, tax_percent)
+
+        self.assertEqual(
+            prices["items_total"] - prices["discount_amount"] + prices["tax_amount"],
+            prices["total_amount"],
+        )
+        self.assertTrue(0 <= prices["discount_amount"] <= items_minor)
+        self.assertGreaterEqual(prices["tax_amount"], 0)
+
+    @given(st.integers(min_value=0, max_value=10**12), percents, percents)
+    def test_total_grows_with_items(self, items_minor, discount_percent, tax_percent):
+        smaller = pricing.breakdown(items_minor, discount_percent, tax_percent)
+        larger = pricing.breakdown(items_minor + 1, discount_percent, tax_percent)
+        self.assertLessEqual(smaller["total_amount"], larger["total_amount"])
+
+
+class PriceOrdersTest(HypothesisTestCase):
+    @hypothesis_settings(max_examples=25, deadline=None)
+    @given(
+        st.lists(
+            st.lists(st.tuples(money, st.integers(min_value=1, max_value=50)), max_size=4),
+            min_size=1,
+            max_size=5,
+        ),
+        percents,
+        percents,
+    )
+    def test_batch_matches_stored_totals(self, orders_lines, discount_percent, tax_percent):
+        # SQLite stores any decimal; keep to totals numeric(20, 2) holds on Postgres.
+        limit = Decimal(10) ** (Order._meta.get_field("total_amount").max_digits - 2)
+        worst = max(sum(price * quantity for price, quantity in lines) for lines in orders_lines)
+        assume(worst * (1 + tax_percent / 100) < limit)
+        discount = Discount.objects.create(name="D", percent=discount_percent)
+        tax = Tax.objects.create(name="T", percent=tax_percent)
+        orders = []
+        for lines in orders_lines:
+            order = Order.objects.create(currency="USD", discount=discount, tax=tax)
+            for price, quantity in lines:
+                item = Item.objects.create(name="Item", price=price, currency="USD")
+                OrderLine.objects.create(order=order, item=item, quantity=quantity)
+            orders.append(order)
+
+        with self.assertNumQueries(1):
+            prices = pricing.price_orders(Order.objects.filter(pk__in=[o.pk for o in orders]))
+
+        for order, lines in zip(orders, orders_lines):
+            order.refresh_from_db()
+            items_total = sum((price * quantity for price, quantity in lines), Decimal("0"))
+            self.assertEqual(prices[order.pk]["items_total"], pricing.to_minor(items_total))
+            self.assertEqual(
+                pricing.from_minor(prices[order.pk]["total_amount"]), order.total_amount
+            )
+            self.assertEqual(
+                pricing.order_breakdown(order)["amount"], prices[order.pk]["total_amount"]
+            )
+
+
+class StripeCatalogSyncTest(TestCase):
+    def setUp(self):
+        self.stripe_client = patch_stripe_client(self)
+        self.stripe_client.products.create.side_effect = lambda params, options: MagicMock(
+            id=f"prod_{params['metadata']['item_id']}",
+            default_price=f"price_{params['metadata']['item_id']}",
+        )
+        self.stripe_client.prices.create.return_value = MagicMock(id="price_new")
+        self.item = Item.objects.create(name="Item 1", price=100, currency="USD")
+        self.other = Item.objects.create(name="Item 2", price="20.50", currency="USD")
+        self.backoff = catalog_sync.Backoff(sleep=lambda seconds: None)
+
+    def test_sync_creates_products_then_only_touches_changed_items(self):
+        self.assertEqual(catalog_sync.sync_catalog(backoff=self.backoff), (2, 0))
+
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.stripe_product_id, f"prod_{self.item.id}")
+        self.assertEqual(self.item.stripe_price_id, f"price_{self.item.id}")
+        self.assertEqual(self.item.stripe_unit_amount, 10000)
+        self.assertEqual(self.item.stripe_synced_at, self.item.updated_at)
+        params = self.stripe_client.products.create.call_args_list[0].args[0]
+        self.assertEqual(params["default_price_data"], {"currency": "usd", "unit_amount": 10000})
+
+        self.assertEqual(catalog_sync.sync_catalog(backoff=self.backoff), (0, 0))
+        self.assertEqual(self.stripe_client.products.create.call_count, 2)
+
+        self.item.price = 120
+        self.item.save()
+        self.assertEqual(catalog_sync.sync_catalog(backoff=self.backoff), (1, 0))
+
+        self.stripe_client.prices.create.assert_called_once()
+        self.assertEqual(
+            self.stripe_client.prices.create.call_args.args[0],
+            {"currency": "usd", "unit_amount": 12000, "product": f"prod_{self.item.id}"},
+        )
+        update_params = self.stripe_client.products.update.call_args.args[1]
+        self.assertEqual(update_params["default_price"], "price_new")
+        self.stripe_client.prices.update.assert_called_once_with(
+            f"price_{self.item.id}", {"active": False}
+        )
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.stripe_price_id, "price_new")
+        self.assertFalse(self.item.stripe_dirty)
+
+    def test_edit_during_sync_and_account_change_stay_pending(self):
+        bulk_update = Item.objects.bulk_update
+
+        def bulk_update_after_an_edit(objs, fields):
+            Item.objects.filter(pk=self.other.pk).update(updated_at=timezone.now())
+            return bulk_update(objs, fields)
+
+        with patch.object(Item.objects, "bulk_update", side_effect=bulk_update_after_an_edit):
+            self.assertEqual(catalog_sync.sync_catalog(backoff=self.backoff), (2, 0))
+        self.assertEqual(
+            list(catalog_sync.unsynced_items("USD").values_list("pk", flat=True)), [self.other.pk]
+        )
+
+        Item.objects.update(stripe_dirty=False)
+        Item.objects.filter(pk=self.item.pk).update(stripe_account="old")
+        account = stripe_clients.get_account("USD")
+        self.assertEqual(catalog_sync.flag_moved_items("USD", account), 1)
+        self.assertEqual(
+            list(catalog_sync.unsynced_items("USD").values_list("pk", flat=True)), [self.item.pk]
+        )
+
+    def test_rate_limit_backs_off_and_retries(self):
+        create = self.stripe_client.products.create
+        create.side_effect = [
+            stripe.RateLimitError("Too many requests"),
+            MagicMock(id="prod_1", default_price="price_1"),
+            MagicMock(id="prod_2", default_price="price_2"),
+        ]
+        delays = []
+        backoff = catalog_sync.Backoff(base=0.01, sleep=delays.append)
+
+        synced, failed = catalog_sync.sync_catalog(workers=1, backoff=backoff)
+
+        self.assertEqual((synced, failed), (2, 0))
+        self.assertEqual(create.call_count, 3)
+        self.assertTrue(delays)
+        self.assertTrue(all(0 < delay <= 0.01 for delay in delays))
+
+    def test_checkout_sends_price_id_for_synced_items_only(self):
+        catalog_sync.sync_catalog(backoff=self.backoff)
+        self.item.refresh_from_db()
+        request = RequestFactory().get("/")
+
+        params = checkout.item_session_params(request, self.item)
+        self.assertEqual(params["line_items"], [{"price": f"price_{self.item.id}", "quantity": 1}])
+
+        self.item.price = 150
+        self.item.save()
+        params = checkout.item_session_params(request, self.item)
+        self.assertEqual(params["line_items"][0]["price_data"]["unit_amount"], 15000)
+
+    def test_command_reports_failures(self):
+        self.stripe_client.products.create.side_effect = stripe.InvalidRequestError("bad", None)
+        out = StringIO()
+
+        call_command("sync_stripe_catalog", stdout=out, stderr=StringIO())
+
+        self.assertIn("Synced 0 items, 2 failed.", out.getvalue())
+        self.assertFalse(Item.objects.exclude(stripe_synced_at=None).exists())
+
+
+@override_settings(REPLICA_DATABASES=["replica1"])
+class ReplicaRoutingTest(TransactionTestCase):
+    databases = {"default", "replica1"}
+
+    def setUp(self):
+        caches[settings.PAGE_CACHE_ALIAS].clear()
+        self.router = db_routing.ReplicaRouter()
+        self.item = Item.objects.create(name="Item 1", price=100, currency="USD")
+
+    def route(self, method, path, write=False, cookies=None):
+        """Run a request through the middleware; returns (read aliases, response)."""
+        request = RequestFactory().generic(method, path)
+        request.COOKIES.update(cookies or {})
+        request.resolver_match = resolve(path)
+        reads = {}
+
+        def view(request):
+            middleware.process_view(request, None, (), {})
+            reads["item"] = self.router.db_for_read(Item)
+            reads["session"] = self.router.db_for_read(SessionStore().model)
+            if write:
+                self.router.db_for_write(Item)
+                reads["after_write"] = self.router.db_for_read(Item)
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(view)
+        return reads, middleware(request)
+
+    def test_read_only_views_use_replicas(self):
+        for path in (
+            reverse("item_detail", args=[self.item.id]),
+            reverse("payment_success_item_intent", args=[self.item.id]),
+            reverse("admin:myapp_order_changelist"),
+        ):
+            reads, response = self.route("GET", path)
+            self.assertEqual(reads["item"], "replica1", path)
+            self.assertEqual(reads["session"], "default")
+            self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_other_views_and_methods_use_primary(self):
+        reads, _ = self.route("GET", reverse("index"))
+        self.assertEqual(reads["item"], "default")
+        reads, _ = self.route("POST", reverse("item_detail", args=[self.item.id]))
+        self.assertEqual(reads["item"], "default")
+        self.assertEqual(self.router.db_for_read(Item), "default")
+
+    def test_write_pins_request_and_browser_to_primary(self):
+        path = reverse("order_detail", args=[1])
+        reads, response = self.route("GET", path, write=True)
+
+        self.assertEqual(reads["item"], "replica1")
+        self.assertEqual(reads["after_write"], "default")
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+        reads, _ = self.route("GET", path, cookies={settings.REPLICA_PIN_COOKIE: "1"})
+        self.assertEqual(reads["item"], "default")
+
+    def test_checkout_views_pin_without_writing(self):
+        _, response = self.route("GET", reverse("buy_item", args=[self.item.id]))
+
+        cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie["max-age"], settings.REPLICA_PIN_SECONDS)
+
+    def test_queries_reach_the_replica_until_a_write_pins_the_browser(self):
+        User.objects.create_superuser("admin", "admin@example.com", "password")
+        url = reverse("item_detail", args=[self.item.id])
+        with (
+            CaptureQueriesContext(connections["default"]) as primary,
+            CaptureQueriesContext(connections["replica1"]) as replica,
+        ):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertTrue(any("myapp_item" in q["sql"] for q in replica.captured_queries))
+        self.assertFalse(any("myapp_item" in q["sql"] for q in primary.captured_queries))
+
+        response = self.client.post(
+            reverse("admin:login"), {"username": "admin", "password": "password"}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+        caches[settings.PAGE_CACHE_ALIAS].clear()
+        with (
+            CaptureQueriesContext(connections["default"]) as primary,
+            CaptureQueriesContext(connections["replica1"]) as replica,
+        ):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertTrue(any("myapp_item" in q["sql"] for q in primary.captured_queries))
+        self.assertEqual(replica.captured_queries, [])
+
+    def test_replicas_are_never_migrated(self):
+        self.assertFalse(self.router.allow_migrate("replica1", "myapp"))
+        self.assertTrue(self.router.allow_migrate("default", "myapp"))
+
+
+@override_settings(ORDERS_API_TOKEN="secret-token")
+class OrderApiTest(TestCase):
+    def setUp(self):
+        self.tax = Tax.objects.create(name="VAT", percent=10)
+        self.discount = Discount.objects.create(name="Black Friday", percent=5)
+        self.item1 = Item.objects.create(name="Item 1", price=100, currency="USD")
+        self.item2 = Item.objects.create(name="Item 2", price="50.55", currency="USD")
+        self.rub_item = Item.objects.create(name="Item 3", price=300, currency="RUB")
+
+    def post(self, name, payload, token="secret-token"):
+        return self.client.post(
+            reverse(name),
+            json.dumps(payload),
+            content_type="application/json",
+            HTTP_AUTHORIZATION=f"Bearer {token}",
+        )
+
+    def order_payload(self, **overrides):
+        return {
+            "currency": "USD",
+            "discount": self.discount.id,
+            "tax": self.tax.id,
+            "lines": [{"item": self.item1.id, "quantity": 3}, {"item": self.item2.id}],
+            **overrides,
+        }
+
+    def test_create_order_returns_totals(self):
+        response = self.post("api_create_order", self.order_payload())
+
+        self.assertEqual(response.status_code, 201)
+        data = response.json()["orders"][0]
+        self.assertEqual(data["items_total"], "350.55")
+        self.assertEqual(data["total_amount"], "366.32")
+        order = Order.objects.get(pk=data["id"])
+        self.assertEqual(
+            list(order.lines.values_list("item_id", "quantity", "unit_price")),
+            [(self.item1.id, 3, Decimal("100.00")), (self.item2.id, 1, Decimal("50.55"))],
+        )
+        self.assertEqual(order_totals.stale_orders([order.pk]), [])
+
+    def test_bulk_create_uses_constant_queries(self):
+        payloads = [self.order_payload() for _ in range(20)]
+        payloads.append({"currency": "RUB", "lines": [{"item": self.rub_item.id}]})
+
+        # Items, discounts, taxes, then both inserts inside a savepoint.
+        with self.assertNumQueries(7):
+            orders = order_api.create_orders(payloads)
+
+        self.assertEqual(len(orders), 21)
+        self.assertEqual(OrderLine.objects.count(), 41)
+        self.assertEqual(orders[-1].total_amount, Decimal("300.00"))
+
+        response = self.post("api_create_orders_bulk", {"orders": payloads[:2]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()["orders"]), 2)
+
+    def test_invalid_batch_writes_nothing(self):
+        payloads = [
+            self.order_payload(),
+            self.order_payload(lines=[{"item": self.rub_item.id}]),
+            self.order_payload(tax=9999, lines=[{"item": self.item1.id}] * 2),
+        ]
+
+        response = self.post("api_create_orders_bulk", {"orders": payloads})
+
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()["errors"]
+        self.assertEqual(set(errors), {"1", "2"})
+        self.assertIn("priced in RUB", errors["1"][0])
+        self.assertEqual(len(errors["2"]), 2)
+        self.assertFalse(Order.objects.exists())
+
+        response = self.post("api_create_order", self.order_payload(currency="EUR"))
+        self.assertEqual(response.status_code, 400)
+        self.assertIsInstance(response.json()["errors"], list)
+
+    def test_requires_token(self):
+        response = self.post("api_create_order", self.order_payload(), token="wrong")
+        self.assertEqual(response.status_code, 403)
+
+        with override_settings(ORDERS_API_TOKEN=None):
+            response = self.post("api_create_order", self.order_payload())
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Order.objects.exists())
+
+
+class ItemListApiTest(TestCase):
+    def setUp(self):
+        created_at = timezone.now()
+        self.items = [
+            Item.objects.create(name=f"Item {i}", price=10 + i, currency="USD" if i % 3 else "RUB")
+            for i in range(12)
+        ]
+        # Several items share a created_at so the id tie-breaker is exercised.
+        Item.objects.filter(pk__in=[item.pk for item in self.items[:6]]).update(
+            created_at=created_at
+        )
+        self.url = reverse("api_list_items")
+
+    def walk(self, **params):
+        ids = []
+        url = f"{self.url}?{urlencode(params)}"
+        while url:
+            data = self.client.get(url).json()
+            ids.extend(row["id"] for row in data["results"])
+            url = data["next"]
+        return ids
+
+    def test_cursor_pages_cover_catalog_in_order(self):
+        expected = list(Item.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+
+        self.assertEqual(self.walk(limit=5), expected)
+        self.assertEqual(self.walk(limit=200), expected)
+        usd = list(
+            Item.objects.filter(currency="USD")
+            .order_by("-created_at", "-id")
+            .values_list("id", flat=True)
+        )
+        self.assertEqual(self.walk(limit=3, currency="USD"), usd)
+
+    def test_deep_page_is_one_query(self):
+        first = self.client.get(self.url, {"limit": 10}).json()
+        cursor = first["next"].split("cursor=")[1]
+
+        request = RequestFactory().get(self.url, {"limit": 10, "cursor": cursor})
+        with self.assertNumQueries(1):
+            response = views_api.list_items(request)
+
+        self.assertEqual(len(json.loads(response.content)["results"]), 2)
+
+    def test_sparse_fields(self):
+        data = self.client.get(self.url, {"fields": "name,price", "limit": 1}).json()
+
+        self.assertEqual(data["results"], [{"name": "Item 11", "price": "21.00"}])
+
+    def test_rejects_bad_parameters(self):
+        for params in (
+            {"fields": "name,secret"},
+            {"limit": 0},
+            {"limit": "many"},
+            {"currency": "EUR"},
+            {"cursor": "not-a-cursor"},
+        ):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 400, params)
+
+
+class ItemSearchTest(TestCase):
+    def setUp(self):
+        self.cap = Item.objects.create(name="Red cap", price=10, currency="USD")
+        self.shirt = Item.objects.create(
+            name="Shirt", description="Red cotton, matches the cap", price=20, currency="USD"
+        )
+        self.mug = Item.objects.create(name="Mug", description="Blue", price=5, currency="RUB")
+        self.url = reverse("api_search_items")
+
+    def test_terms_and_prefix_query(self):
+        self.assertEqual(search.terms("Red  red CAP's!"), ["red", "cap", "s"])
+        self.assertEqual(search.prefix_query(["red", "cap"]), "'red':* & 'cap':*")
+        self.assertEqual(search.terms("'; drop table --"), ["drop", "table"])
+
+    def test_every_word_must_match_and_name_ranks_first(self):
+        results = list(search.search_items(Item.objects.all(), "red ca"))
+
+        self.assertEqual(results, [self.cap, self.shirt])
+        self.assertGreater(results[0].rank, results[1].rank)
+        self.assertFalse(search.search_items(Item.objects.all(), "red mug").exists())
+        self.assertFalse(search.search_items(Item.objects.all(), "?!").exists())
+
+    def test_search_endpoint(self):
+        data = self.client.get(self.url, {"q": "red", "fields": "id,name"}).json()
+
+        self.assertEqual([row["id"] for row in data["results"]], [self.cap.pk, self.shirt.pk])
+        self.assertEqual(set(data["results"][0]), {"id", "name", "rank"})
+
+        data = self.client.get(self.url, {"q": "blue", "currency": "USD"}).json()
+        self.assertEqual(data["results"], [])
+        data = self.client.get(self.url, {"q": "red", "limit": 1}).json()
+        self.assertEqual(len(data["results"]), 1)
+
+    def test_search_endpoint_rejects_bad_parameters(self):
+        for params in ({}, {"q": " "}, {"q": "red", "limit": 0}, {"q": "red", "fields": "x"}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_admin_search_uses_item_search(self):
+        admin_user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(admin_user)
+
+        response = self.client.get(reverse("admin:myapp_item_changelist"), {"q": "cotton red"})
+
+        self.assertEqual(list(response.context["cl"].result_list), [self.shirt])
+
+
+@override_settings(PERF_SAMPLE_RATE=1.0, METRICS_TOKEN="metrics-token")
+class PerfMetricsTest(TestCase):
+    def setUp(self):
+        perf.reset()
+        self.addCleanup(perf.reset)
+        self.item = Item.objects.create(name="Cap", price=10, currency="USD")
+
+    def metrics(self):
+        response = self.client.get(
+            reverse("metrics"), headers={"Authorization": "Bearer metrics-token"}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_sampled_request_gets_server_timing_and_histograms(self):
+        response = self.client.get(reverse("item_detail", args=[self.item.pk]))
+
+        timing = dict(part.split(";", 1) for part in response.headers["Server-Timing"].split(", "))
+        self.assertEqual(set(timing), {"app", "db", "stripe", "tpl"})
+        self.assertRegex(timing["db"], r'^dur=[\d.]+;desc="[1-9]\d* queries"$')
+        self.assertEqual(timing["stripe"], 'dur=0.0;desc="0 calls"')
+
+        body = self.metrics()
+        self.assertIn('myapp_request_duration_seconds_count{view="item_detail"} 1.0', body)
+        self.assertIn('myapp_request_template_seconds_count{view="item_detail"} 1.0', body)
+        self.assertIn('myapp_request_stripe_calls_bucket{le="0.0",view="item_detail"} 1.0', body)
+        self.assertIn('myapp_request_db_queries_bucket{le="0.0",view="item_detail"} 0.0', body)
+
+    @override_settings(PERF_SAMPLE_RATE=0.0)
+    def test_unsampled_request_only_records_wall_time(self):
+        response = self.client.get(reverse("item_detail", args=[self.item.pk]))
+
+        self.assertNotIn("Server-Timing", response.headers)
+        body = self.metrics()
+        self.assertIn('myapp_request_duration_seconds_count{view="item_detail"} 1.0', body)
+        self.assertNotIn('myapp_request_db_seconds_count{view="item_detail"}', body)
+
+    def test_metrics_needs_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+        with override_settings(METRICS_TOKEN=None):
+            response = self.client.get(reverse("metrics"), headers={"Authorization": "Bearer None"})
+        self.assertEqual(response.status_code, 403)
+
+    def test_metrics_sum_every_worker_process(self):
+        multiproc_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, multiproc_dir)
+        env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": multiproc_dir}
+        for seconds in ("0.02", "3"):
+            subprocess.run(
+                [sys.executable, "-c", f"from myapp import perf; perf.record('a\"b', {seconds})"],
+                cwd=settings.BASE_DIR,
+                env=env,
+                check=True,
+            )
+
+        with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": multiproc_dir}):
+            body = self.metrics()
+
+        self.assertIn('myapp_request_duration_seconds_bucket{le="0.025",view="a\\"b"} 1.0', body)
+        self.assertIn('myapp_request_duration_seconds_bucket{le="+Inf",view="a\\"b"} 2.0', body)
+        self.assertIn('myapp_request_duration_seconds_sum{view="a\\"b"} 3.02', body)
+
+    def test_stripe_calls_are_counted_into_the_sample(self):
+        client = perf.TimedHTTPXClient(allow_sync_methods=True)
+        sample, token = perf.start()
+        try:
+            with (
+                patch.object(stripe.HTTPXClient, "request_with_retries", return_value="ok"),
+                patch.object(
+                    stripe.HTTPXClient, "request_with_retries_async", AsyncMock(return_value="ok")
+                ),
+            ):
+                self.assertEqual(client.request_with_retries("get", "/v1/x", {}), "ok")
+                self.assertEqual(
+                    async_to_sync(client.request_with_retries_async)("get", "/v1/x", {}), "ok"
+                )
+        finally:
+            perf.finish(token)
+
+        self.assertEqual(sample.stripe_calls, 2)
+        self.assertIsInstance(stripe_clients._build_http_client("acct"), perf.TimedHTTPXClient)
+
+    def test_template_backend_times_renders(self):
+        self.assertIsInstance(engines["django"], perf.TimedDjangoTemplates)
+        sample, token = perf.start()
+        try:
+            engines["django"].from_string("{{ x }}").render({"x": 1})
+        finally:
+            perf.finish(token)
+
+        self.assertGreater(sample.template_seconds, 0)
+
+
+@override_settings(
+    STRIPE_KEYS={"USD": {"secret": "sk_test_guard", "public": "pk_test_guard"}},
+    STRIPE_MAX_NETWORK_RETRIES=0,
+    STRIPE_REQUEST_BUDGET=0.3,
+    STRIPE_BREAKER_THRESHOLD=2,
+    STRIPE_BREAKER_COOLDOWN=30,
+)
+class StripeGuardStubTest(TestCase):
+    def setUp(self):
+        self.stub = StripeStubServer(latency=1.0).start()
+        self.addCleanup(self.stub.stop)
+        settings_override = override_settings(STRIPE_API_BASE=self.stub.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        stripe_clients.build_clients()
+        self.addCleanup(stripe_clients.build_clients)
+        for alias in (settings.STRIPE_BREAKER_CACHE_ALIAS, settings.CHECKOUT_SESSION_CACHE_ALIAS):
+            caches[alias].clear()
+            self.addCleanup(caches[alias].clear)
+
+        self.item = Item.objects.create(name="Cap", price=10, currency="USD")
+        self.url = reverse("buy_item", args=[self.item.pk])
+        self.breaker = stripe_guard.CircuitBreaker(stripe_clients.get_account("USD"))
+
+    def timed_get(self, url):
+        started = time.monotonic()
+        response = self.client.get(url)
+        return response, time.monotonic() - started
+
+    def test_slow_stripe_fails_fast_then_opens_the_breaker(self):
+        for _ in range(2):
+            response, elapsed = self.timed_get(self.url)
+            self.assertEqual(response.status_code, 503)
+            self.assertLess(elapsed, 0.9)
+        self.assertEqual(len(self.stub.requests), 2)
+        self.assertIn("temporarily unavailable", response.json()["error"])
+
+        response, elapsed = self.timed_get(self.url)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertLess(elapsed, 0.1)
+        self.assertGreater(int(response.headers["Retry-After"]), 20)
+        self.assertEqual(len(self.stub.requests), 2)
+
+        # Pages that do not call Stripe keep working.
+        response = self.client.get(reverse("item_detail", args=[self.item.pk]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_half_open_probe_closes_or_reopens_the_breaker(self):
+        self.stub.latency = 0
+        cache = caches[settings.STRIPE_BREAKER_CACHE_ALIAS]
+        cache.set(self.breaker.open_key, time.time() - 1)
+
+        self.stub.error_status = 500
+        self.assertEqual(self.client.get(self.url).status_code, 503)
+        self.assertGreater(cache.get(self.breaker.open_key), time.time())
+        self.assertEqual(self.client.get(self.url).status_code, 503)
+        self.assertEqual(len(self.stub.requests), 1)
+
+        cache.set(self.breaker.open_key, time.time() - 1)
+        self.stub.error_status = None
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["sessionId"].startswith("cs_test_"))
+        self.assertIsNone(cache.get(self.breaker.open_key))
+
+    def test_one_probe_at_a_time(self):
+        caches[settings.STRIPE_BREAKER_CACHE_ALIAS].set(self.breaker.open_key, time.time() - 1)
+
+        self.assertTrue(self.breaker.before())
+        with self.assertRaises(stripe_guard.StripeUnavailable):
+            self.breaker.before()
+
+    def test_local_budget_refusal_is_not_a_breaker_failure(self):
+        cache = caches[settings.STRIPE_BREAKER_CACHE_ALIAS]
+        cache.set(self.breaker.open_key, time.time() - 1)
+        client = stripe_clients.get_client("USD")
+        refused = stripe_guard.StripeUnavailable("Stripe request budget exhausted.", 1)
+
+        with patch.object(stripe.HTTPXClient, "request_with_retries", side_effect=refused):
+            with self.assertRaises(stripe_guard.StripeUnavailable):
+                client.coupons.create({"percent_off": 5})
+
+        self.assertIsNone(cache.get(self.breaker.failures_key))
+        self.assertIsNone(cache.get(self.breaker.probe_key))
+        self.assertLess(cache.get(self.breaker.open_key), time.time())
+
+    def test_retry_the_budget_cannot_cover_is_skipped(self):
+        self.stub.latency = 0
+        self.stub.error_status = 500
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(self.stub.requests), 1)
+        self.assertEqual(
+            caches[settings.STRIPE_BREAKER_CACHE_ALIAS].get(self.breaker.failures_key), 1
+        )
+
+    def test_workers_with_their_own_redis_clients_share_the_breaker(self):
+        server = fakeredis.FakeServer()
+        redis_cache = {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": "redis://redis:6379/0",
+            "OPTIONS": {"connection_class": fakeredis.FakeConnection, "server": server},
+        }
+        account = stripe_clients.get_account("USD")
+        # One cache client (and connection pool) per worker, as in separate processes.
+        workers = [CacheHandler({"default": redis_cache})["default"] for _ in range(2)]
+
+        with override_settings(STRIPE_BREAKER_THRESHOLD=2):
+            for cache in workers:
+                with patch.object(stripe_guard.CircuitBreaker, "cache", cache):
+                    stripe_guard.CircuitBreaker(account).after(False, probe=False)
+
+            with patch.object(stripe_guard.CircuitBreaker, "cache", workers[1]):
+                with self.assertRaises(stripe_guard.StripeUnavailable):
+                    stripe_guard.CircuitBreaker(account).before()
+        self.assertIsNot(workers[0], workers[1])
+
+    async def test_async_views_share_the_budget_and_breaker(self):
+        request = AsyncRequestFactory().get(self.url)
+        request.session = SessionStore()
+
+        started = time.monotonic()
+        response = await views_async.buy_item(request, self.item.pk)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertLess(time.monotonic() - started, 0.9)
+
+        await views_async.buy_item(request, self.item.pk)
+        self.assertIsNotNone(
+            await caches[settings.STRIPE_BREAKER_CACHE_ALIAS].aget(self.breaker.open_key)
+        )
+
+    def test_budget_spans_all_calls_of_a_request(self):
+        self.stub.latency = 0.2
+        client = stripe_clients.get_client("USD")
+
+        @stripe_guard.budget
+        def view(request):
+            for _ in range(3):
+                client.coupons.create({"percent_off": 5})
+            return HttpResponse()
+
+        response = view(RequestFactory().get("/"))
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(self.stub.requests), 2)
+
+
+class OrderAdjustmentsTest(TestCase):
+    def setUp(self):
+        stripe_objects.reset()
+        self.addCleanup(stripe_objects.reset)
+        self.order = Order.objects.create(
+            currency="USD",
+            tax=Tax.objects.create(name="VAT", percent=10),
+            discount=Discount.objects.create(name="Black Friday", percent=5),
+        )
+
+    def test_partial_failure_records_what_was_created(self):
+        client = patch_stripe_client(self)
+        client.coupons.create.return_value = MagicMock(id="coupon_1")
+        client.tax_rates.create.side_effect = stripe.APIConnectionError("down")
+
+        with self.assertRaises(stripe.APIConnectionError):
+            stripe_objects.get_order_adjustment_ids(self.order, "USD")
+        self.assertEqual(StripeCoupon.objects.get().stripe_id, "coupon_1")
+
+        client.tax_rates.create.side_effect = None
+        client.tax_rates.create.return_value = MagicMock(id="txr_1")
+        ids = stripe_objects.get_order_adjustment_ids(self.order, "USD")
+
+        self.assertEqual(ids, ("coupon_1", "txr_1"))
+        client.coupons.create.assert_called_once()
+        self.assertEqual(client.tax_rates.create.call_count, 2)
+
+    def test_known_ids_skip_stripe(self):
+        client = patch_stripe_client(self)
+        self.order.tax = None
+        self.order.save()
+        StripeCoupon.objects.create(
+            discount=self.order.discount,
+            percent=5,
+            account=stripe_clients.get_account("USD"),
+            stripe_id="coupon_db",
+        )
+
+        self.assertEqual(
+            stripe_objects.get_order_adjustment_ids(self.order, "USD"), ("coupon_db", None)
+        )
+        client.coupons.create.assert_not_called()
+
+    async def test_async_partial_failure(self):
+        client = patch_stripe_client(self)
+        client.coupons.create_async.side_effect = stripe.APIConnectionError("down")
+        client.tax_rates.create_async.return_value = MagicMock(id="txr_async")
+
+        with self.assertRaises(stripe.APIConnectionError):
+            await stripe_objects.aget_order_adjustment_ids(self.order, "USD")
+
+        self.assertEqual((await StripeTaxRate.objects.aget()).stripe_id, "txr_async")
+        self.assertFalse(await StripeCoupon.objects.aexists())
+
+    @override_settings(STRIPE_KEYS={"USD": {"secret": "sk_test_parallel", "public": "pk"}})
+    def test_creates_run_concurrently_against_stub(self):
+        with StripeStubServer(latency=0.3) as stub, override_settings(STRIPE_API_BASE=stub.url):
+            stripe_clients.build_clients()
+            self.addCleanup(stripe_clients.build_clients)
+            sample, token = perf.start()
+            started = time.monotonic()
+            try:
+                coupon_id, tax_rate_id = stripe_objects.get_order_adjustment_ids(self.order, "USD")
+            finally:
+                perf.finish(token)
+            elapsed = time.monotonic() - started
+
+        self.assertTrue(coupon_id.startswith("coupon_"))
+        self.assertTrue(tax_rate_id.startswith("txr_"))
+        self.assertLess(elapsed, 0.55)
+        # The pooled call carried the request context along.
+        self.assertEqual(sample.stripe_calls, 2)
+
+
+class GunicornConfigTest(SimpleTestCase):
+    def load(self, **env):
+        env = {"SERVER_MODE": "wsgi", **env}
+        cleared = {name: "" for name in os.environ if name.startswith("GUNICORN_")}
+        with patch.dict(os.environ, {**cleared, **env}), patch("os.sched_getaffinity") as cpus:
+            cpus.return_value = {0, 1, 2, 3}
+            return runpy.run_path(str(settings.BASE_DIR / "gunicorn.conf.py"))
+
+    def test_gthread_is_the_default_wsgi_profile(self):
+        config = self.load()
+        self.assertEqual(config["wsgi_app"], "src.wsgi:application")
+        self.assertEqual(config["worker_class"], "gthread")
+        self.assertEqual((config["workers"], config["threads"]), (5, 4))
+        self.assertTrue(config["preload_app"])
+        self.assertEqual((config["max_requests"], config["max_requests_jitter"]), (2000, 200))
+
+    def test_sync_and_uvicorn_profiles(self):
+        config = self.load(GUNICORN_WORKER_CLASS="sync")
+        self.assertEqual(
+            (config["worker_class"], config["workers"], config["threads"]), ("sync", 9, 1)
+        )
+
+        config = self.load(SERVER_MODE="asgi", GUNICORN_WORKER_CLASS="sync")
+        self.assertEqual(config["wsgi_app"], "src.asgi:application")
+        self.assertEqual(config["worker_class"], "uvicorn_worker.UvicornWorker")
+        self.assertEqual(config["workers"], 4)
+
+    def test_env_overrides(self):
+        config = self.load(
+            GUNICORN_WORKERS="2",
+            GUNICORN_THREADS="16",
+            GUNICORN_MAX_REQUESTS="500",
+            GUNICORN_PRELOAD="0",
+        )
+        self.assertEqual((config["workers"], config["threads"]), (2, 16))
+        self.assertEqual((config["max_requests"], config["max_requests_jitter"]), (500, 50))
+        self.assertFalse(config["preload_app"])
+
+        with self.assertRaises(RuntimeError):
+            self.load(GUNICORN_WORKER_CLASS="eventlet")
+
+    def test_start_empties_the_prometheus_multiproc_dir(self):
+        multiproc_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, multiproc_dir, True)
+        (multiproc_dir / "histogram_1.db").write_bytes(b"stale")
+        config = self.load(PROMETHEUS_MULTIPROC_DIR=str(multiproc_dir))
+
+        with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": str(multiproc_dir)}):
+            config["on_starting"](None)
+            with patch("prometheus_client.multiprocess.mark_process_dead") as mark_dead:
+                config["child_exit"](None, MagicMock(pid=42))
+
+        self.assertEqual(list(multiproc_dir.iterdir()), [])
+        mark_dead.assert_called_once_with(42)
+
+    def test_keepalive_outlasts_nginx_upstream(self):
+        nginx = (settings.BASE_DIR / "nginx.conf").read_text()
+        self.assertIn("keepalive_timeout 60s;", nginx)
+        self.assertGreater(self.load()["keepalive"], 60)
+
+
+class StaticAssetsTest(TestCase):
+    def test_pages_link_shared_assets_instead_of_inlining_them(self):
+        item = Item.objects.create(name="Static Item", price=10, currency="USD")
+        order = Order.objects.create(currency="USD")
+        OrderLine.objects.create(order=order, item=item, quantity=1)
+        pages = {
+            reverse("index"): "myapp/css/site.css",
+            reverse("item_detail", args=[item.id]): "myapp/js/checkout.js",
+            reverse("order_detail", args=[order.id]): "myapp/js/checkout.js",
+        }
+        for url, asset in pages.items():
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, static(asset))
+                self.assertNotContains(response, "<style>")
+                self.assertNotContains(response, "<script>")
+
+    def test_collectstatic_writes_hashed_and_compressed_files(self):
+        with (
+            tempfile.TemporaryDirectory() as root,
+            override_settings(
+                STATIC_ROOT=root,
+                STORAGES={
+                    **settings.STORAGES,
+                    "staticfiles": {
+                        "BACKEND": "myapp.storage.CompressedManifestStaticFilesStorage"
+                    },
+                },
+            ),
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+
+            url = static("myapp/js/intent.js")
+            self.assertRegex(url, r"^/static/myapp/js/intent\.[0-9a-f]{12}\.js$")
+            path = Path(root, url.removeprefix("/static/"))
+            original = path.read_bytes()
+            self.assertEqual(gzip.decompress(Path(f"{path}.gz").read_bytes()), original)
+            self.assertEqual(brotli.decompress(Path(f"{path}.br").read_bytes()), original)
+            self.assertFalse(Path(root, "myapp/js/intent.js.gz").exists())
+
+            # Hashed names never change content, so existing copies are kept.
+            hashed_name = url.removeprefix("/static/")
+            self.assertEqual(
+                storage.CompressedManifestStaticFilesStorage().compress(hashed_name), []
+            )
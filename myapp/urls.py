@@ -1,25 +1,47 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views, views_intent
+from . import views, views_api, views_async, views_intent, views_metrics, views_webhooks
+
+# Under an ASGI server the Stripe-bound views run as coroutines so one worker can
+# keep many payment calls in flight; the sync versions stay for WSGI deployments.
+checkout_views = views_async if settings.ASYNC_VIEWS else views
+intent_views = views_async if settings.ASYNC_VIEWS else views_intent
 
 urlpatterns = [
     path("", views.index, name="index"),
     path("item/<int:id>/", views.item_detail, name="item_detail"),
-    path("buy/<int:id>/", views.buy_item, name="buy_item"),
+    path("buy/<int:id>/", checkout_views.buy_item, name="buy_item"),
     path("success/item/<int:id>/", views.payment_success_item, name="payment_success_item"),
     path("order/<int:id>/", views.order_detail, name="order_detail"),
-    path("buy/order/<int:id>/", views.buy_order, name="buy_order"),
+    path("buy/order/<int:id>/", checkout_views.buy_order, name="buy_order"),
     path("success/order/<int:id>/", views.payment_success_order, name="payment_success_order"),
-    path("intent/item/<int:id>/", views_intent.item_detail_intent, name="item_detail_intent"),
+    path("intent/item/<int:id>/", intent_views.item_detail_intent, name="item_detail_intent"),
+    path(
+        "intent/item/<int:id>/secret/",
+        intent_views.item_intent_secret,
+        name="item_intent_secret",
+    ),
     path(
         "intent/success/item/<int:id>/",
         views_intent.payment_success_item_intent,
         name="payment_success_item_intent",
     ),
-    path("intent/order/<int:id>/", views_intent.order_detail_intent, name="order_detail_intent"),
+    path("intent/order/<int:id>/", intent_views.order_detail_intent, name="order_detail_intent"),
+    path(
+        "intent/order/<int:id>/secret/",
+        intent_views.order_intent_secret,
+        name="order_intent_secret",
+    ),
     path(
         "intent/success/order/<int:id>/",
         views_intent.payment_success_order_intent,
         name="payment_success_order_intent",
     ),
+    path("webhooks/stripe/", views_webhooks.stripe_webhook, name="stripe_webhook"),
+    path("metrics", views_metrics.metrics, name="metrics"),
+    path("api/items/", views_api.list_items, name="api_list_items"),
+    path("api/items/search/", views_api.search_items, name="api_search_items"),
+    path("api/orders/", views_api.create_order, name="api_create_order"),
+    path("api/orders/bulk/", views_api.create_orders_bulk, name="api_create_orders_bulk"),
 ]
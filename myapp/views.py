@@ -1,8 +1,16 @@
-import stripe
 from django.conf import settings
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, render
 
+from . import (
+    checkout,
+    checkout_cache,
+    page_cache,
+    payment_intents,
+    stripe_clients,
+    stripe_guard,
+    stripe_objects,
+)
 from .models import Item, Order
 
 
@@ -11,48 +19,37 @@ def index(request):
 
 
 def item_detail(request, id):
-    item = get_object_or_404(Item, pk=id)
-    currency = item.currency
-
-    return render(
-        request,
-        "items/item_detail.html",
-        {"item": item, "stripe_public_key": settings.STRIPE_KEYS[currency]["public"]},
-    )
+    return page_cache.render_item_page(request, id, page_cache.ITEM_DETAIL, with_public_key=True)
 
 
+@stripe_guard.budget
 def buy_item(request, id):
     item = get_object_or_404(Item, pk=id)
     currency = item.currency
 
-    if currency not in settings.STRIPE_KEYS:
+    client = stripe_clients.get_client(currency)
+    if client is None:
         return JsonResponse({"error": f"Unsupported currency: {currency}"}, status=400)
 
-    stripe.api_key = settings.STRIPE_KEYS[currency]["secret"]
+    params = checkout.item_session_params(request, item)
+    fingerprint = checkout.item_fingerprint(item, params)
+    buyer = payment_intents.session_key(request)
+
+    def create_session(idempotency_key, expires_at):
+        return client.checkout.sessions.create(
+            {**params, "expires_at": expires_at}, {"idempotency_key": idempotency_key}
+        )
 
     try:
-        session = stripe.checkout.Session.create(
-            payment_method_types=["card"],
-            line_items=[
-                {
-                    "price_data": {
-                        "currency": currency.lower(),
-                        "product_data": {
-                            "name": item.name,
-                        },
-                        "unit_amount": int(item.price * 100),
-                    },
-                    "quantity": 1,
-                }
-            ],
-            mode="payment",
-            success_url=request.build_absolute_uri(f"/success/item/{item.id}/"),
-            cancel_url=request.build_absolute_uri(f"/item/{item.id}/"),
+        session_id = checkout_cache.get_or_create_session_id(
+            "item", item.id, buyer, fingerprint, create_session
         )
+    except stripe_guard.UNAVAILABLE_ERRORS as e:
+        return stripe_guard.unavailable(e)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
 
-    return JsonResponse({"sessionId": session.id})
+    return JsonResponse({"sessionId": session_id})
 
 
 def payment_success_item(request, id):
@@ -62,7 +59,7 @@ def payment_success_item(request, id):
 
 def order_detail(request, id):
     order = get_object_or_404(
-        Order.objects.select_related("tax", "discount").prefetch_related("items"), pk=id
+        Order.objects.select_related("tax", "discount").prefetch_related("lines__item"), pk=id
     )
 
     currency = order.currency
@@ -77,67 +74,35 @@ def order_detail(request, id):
     )
 
 
+@stripe_guard.budget
 def buy_order(request, id):
     order = get_object_or_404(
-        Order.objects.select_related("discount", "tax").prefetch_related("items"), pk=id
+        Order.objects.select_related("discount", "tax").prefetch_related("lines__item"), pk=id
     )
     currency = order.currency
 
-    if currency not in settings.STRIPE_KEYS:
+    client = stripe_clients.get_client(currency)
+    if client is None:
         return JsonResponse({"error": f"Unsupported currency: {currency}"}, status=400)
 
-    stripe.api_key = settings.STRIPE_KEYS[currency]["secret"]
-
-    line_items = []
-    for item in order.items.all():
-        line_items.append(
-            {
-                "price_data": {
-                    "currency": currency.lower(),
-                    "product_data": {"name": item.name},
-                    "unit_amount": int(item.price * 100),
-                },
-                "quantity": 1,
-            }
-        )
+    params = checkout.order_session_params(request, order)
+    fingerprint = checkout.order_fingerprint(order, params)
+    buyer = payment_intents.session_key(request)
 
-    discounts = []
-    if order.discount and order.discount.percent > 0:
-        coupon = stripe.Coupon.create(
-            percent_off=float(order.discount.percent), duration="once", name=order.discount.name
+    def create_session(idempotency_key, expires_at):
+        coupon_id, tax_rate_id = stripe_objects.get_order_adjustment_ids(order, currency)
+        checkout.apply_order_adjustments(params, coupon_id, tax_rate_id)
+        return client.checkout.sessions.create(
+            {**params, "expires_at": expires_at}, {"idempotency_key": idempotency_key}
         )
-        discounts.append({"coupon": coupon.id})
-
-    tax_rate_id = None
-    if order.tax and order.tax.percent > 0:
-        currency_country_map = {
-            "USD": "US",
-            "RUB": "RU",
-        }
-        country = currency_country_map[order.currency]
-
-        tax_rate = stripe.TaxRate.create(
-            display_name=order.tax.name,
-            inclusive=False,
-            percentage=float(order.tax.percent),
-            country=country,
-        )
-        tax_rate_id = tax_rate.id
-
-    if tax_rate_id:
-        for item in line_items:
-            item["tax_rates"] = [tax_rate_id]
 
     try:
-        session = stripe.checkout.Session.create(
-            payment_method_types=["card"],
-            line_items=line_items,
-            discounts=discounts,
-            mode="payment",
-            success_url=request.build_absolute_uri(f"/success/order/{order.id}/"),
-            cancel_url=request.build_absolute_uri(f"/order/{order.id}"),
+        session_id = checkout_cache.get_or_create_session_id(
+            "order", order.id, buyer, fingerprint, create_session
         )
-        return JsonResponse({"sessionId": session.id})
+        return JsonResponse({"sessionId": session_id})
+    except stripe_guard.UNAVAILABLE_ERRORS as e:
+        return stripe_guard.unavailable(e)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
 
@@ -0,0 +1,116 @@
+import json
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from . import order_api, pagination, search
+from .models import CURRENCY_CHOICES, Item
+
+ITEM_FIELDS = ("id", "name", "description", "price", "currency", "created_at", "updated_at")
+
+
+def _authorized(request):
+    token = settings.ORDERS_API_TOKEN
+    header = request.headers.get("Authorization", "")
+    return bool(token) and constant_time_compare(header, f"Bearer {token}")
+
+
+def _read_json(request):
+    try:
+        return json.loads(request.body)
+    except ValueError:
+        return None
+
+
+def _created(orders):
+    return JsonResponse({"orders": [order_api.serialize(order) for order in orders]}, status=201)
+
+
+@csrf_exempt
+@require_POST
+def create_order(request):
+    if not _authorized(request):
+        return JsonResponse({"error": "Invalid API token."}, status=403)
+    payload = _read_json(request)
+    if not isinstance(payload, dict):
+        return JsonResponse({"error": "Expected a JSON object."}, status=400)
+
+    try:
+        orders = order_api.create_orders([payload])
+    except order_api.OrderPayloadError as e:
+        return JsonResponse({"errors": e.errors[0]}, status=400)
+    return _created(orders)
+
+
+@csrf_exempt
+@require_POST
+def create_orders_bulk(request):
+    if not _authorized(request):
+        return JsonResponse({"error": "Invalid API token."}, status=403)
+    payload = _read_json(request)
+    if not isinstance(payload, dict) or not isinstance(payload.get("orders"), list):
+        return JsonResponse({"error": 'Expected {"orders": [...]}.'}, status=400)
+
+    try:
+        orders = order_api.create_orders(payload["orders"])
+    except order_api.OrderPayloadError as e:
+        return JsonResponse({"errors": e.errors}, status=400)
+    return _created(orders)
+
+
+def _item_params(request):
+    """Return ``(fields, limit, items)`` from the query string or raise ``ValueError``."""
+    fields = ITEM_FIELDS
+    if request.GET.get("fields"):
+        fields = tuple(dict.fromkeys(request.GET["fields"].split(",")))
+        unknown = set(fields) - set(ITEM_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}.")
+
+    try:
+        limit = int(request.GET.get("limit", pagination.DEFAULT_LIMIT))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= pagination.MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {pagination.MAX_LIMIT}.")
+
+    items = Item.objects.all()
+    currency = request.GET.get("currency")
+    if currency:
+        if currency not in dict(CURRENCY_CHOICES):
+            raise ValueError(f"Unsupported currency: {currency}.")
+        items = items.filter(currency=currency)
+    return fields, limit, items
+
+
+@require_GET
+def list_items(request):
+    try:
+        fields, limit, items = _item_params(request)
+        rows, cursor = pagination.page(items, request.GET.get("cursor"), limit, fields)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    next_url = None
+    if cursor:
+        query = request.GET.copy()
+        query["cursor"] = cursor
+        next_url = f"{request.path}?{query.urlencode()}"
+    return JsonResponse({"results": rows, "next": next_url})
+
+
+@require_GET
+def search_items(request):
+    query = request.GET.get("q", "").strip()
+    try:
+        if not query:
+            raise ValueError("q is required.")
+        fields, limit, items = _item_params(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    rows = search.search_items(items, query).values(*fields, "rank")[:limit]
+    return JsonResponse({"results": list(rows)})
@@ -0,0 +1,192 @@
+import stripe
+from django.conf import settings
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404, render
+from django.views.decorators.cache import never_cache
+
+from . import (
+    checkout,
+    checkout_cache,
+    payment_intents,
+    pricing,
+    stripe_clients,
+    stripe_guard,
+    stripe_objects,
+)
+from .models import Item, Order
+from .views_intent import lazy_secret, order_queryset, unsupported_currency
+
+
+@stripe_guard.budget
+async def buy_item(request, id):
+    item = await aget_object_or_404(Item, pk=id)
+    currency = item.currency
+
+    client = stripe_clients.get_client(currency)
+    if client is None:
+        return JsonResponse({"error": f"Unsupported currency: {currency}"}, status=400)
+
+    params = checkout.item_session_params(request, item)
+    fingerprint = checkout.item_fingerprint(item, params)
+    buyer = await payment_intents.asession_key(request)
+
+    async def create_session(idempotency_key, expires_at):
+        return await client.checkout.sessions.create_async(
+            {**params, "expires_at": expires_at}, {"idempotency_key": idempotency_key}
+        )
+
+    try:
+        session_id = await checkout_cache.aget_or_create_session_id(
+            "item", item.id, buyer, fingerprint, create_session
+        )
+    except stripe_guard.UNAVAILABLE_ERRORS as e:
+        return stripe_guard.unavailable(e)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    return JsonResponse({"sessionId": session_id})
+
+
+@stripe_guard.budget
+async def buy_order(request, id):
+    order = await aget_object_or_404(
+        Order.objects.select_related("discount", "tax").prefetch_related("lines__item"), pk=id
+    )
+    currency = order.currency
+
+    client = stripe_clients.get_client(currency)
+    if client is None:
+        return JsonResponse({"error": f"Unsupported currency: {currency}"}, status=400)
+
+    params = checkout.order_session_params(request, order)
+    fingerprint = checkout.order_fingerprint(order, params)
+    buyer = await payment_intents.asession_key(request)
+
+    async def create_session(idempotency_key, expires_at):
+        coupon_id, tax_rate_id = await stripe_objects.aget_order_adjustment_ids(order, currency)
+        checkout.apply_order_adjustments(params, coupon_id, tax_rate_id)
+        return await client.checkout.sessions.create_async(
+            {**params, "expires_at": expires_at}, {"idempotency_key": idempotency_key}
+        )
+
+    try:
+        session_id = await checkout_cache.aget_or_create_session_id(
+            "order", order.id, buyer, fingerprint, create_session
+        )
+        return JsonResponse({"sessionId": session_id})
+    except stripe_guard.UNAVAILABLE_ERRORS as e:
+        return stripe_guard.unavailable(e)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+
+async def item_client_secret(request, client, item):
+    return await payment_intents.aget_client_secret(
+        request,
+        client,
+        "item",
+        item.id,
+        item.currency,
+        amount=pricing.to_minor(item.price),
+        metadata={"item_id": str(item.id)},
+    )
+
+
+async def order_client_secret(request, client, order, totals):
+    return await payment_intents.aget_client_secret(
+        request,
+        client,
+        "order",
+        order.id,
+        order.currency,
+        amount=totals["amount"],
+        metadata={"order_id": str(order.id)},
+        content=checkout.order_intent_content(order),
+    )
+
+
+@stripe_guard.budget
+async def item_detail_intent(request, id):
+    item = await aget_object_or_404(Item, pk=id)
+    currency = item.currency
+
+    client = stripe_clients.get_client(currency)
+    if client is None:
+        return unsupported_currency(currency)
+
+    client_secret = None if lazy_secret() else await item_client_secret(request, client, item)
+
+    return render(
+        request,
+        "intent/items/item_detail_intent.html",
+        {
+            "item": item,
+            "stripe_public_key": settings.STRIPE_KEYS[currency]["public"],
+            "client_secret": client_secret,
+        },
+    )
+
+
+@never_cache
+@stripe_guard.budget
+async def item_intent_secret(request, id):
+    item = await aget_object_or_404(Item, pk=id)
+
+    client = stripe_clients.get_client(item.currency)
+    if client is None:
+        return unsupported_currency(item.currency)
+
+    try:
+        secret = await item_client_secret(request, client, item)
+    except stripe_guard.UNAVAILABLE_ERRORS as e:
+        return stripe_guard.unavailable(e)
+    except stripe.StripeError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse({"clientSecret": secret})
+
+
+@stripe_guard.budget
+async def order_detail_intent(request, id):
+    order = await aget_object_or_404(order_queryset(), pk=id)
+
+    currency = order.currency
+
+    client = stripe_clients.get_client(currency)
+    if client is None:
+        return unsupported_currency(currency)
+
+    totals = pricing.order_breakdown(order)
+    client_secret = None
+    if not lazy_secret():
+        client_secret = await order_client_secret(request, client, order, totals)
+
+    return render(
+        request,
+        "intent/orders/order_detail_intent.html",
+        {
+            "order": order,
+            "stripe_public_key": settings.STRIPE_KEYS[currency]["public"],
+            "client_secret": client_secret,
+            **totals,
+            "currency": currency,
+        },
+    )
+
+
+@never_cache
+@stripe_guard.budget
+async def order_intent_secret(request, id):
+    order = await aget_object_or_404(order_queryset(), pk=id)
+
+    client = stripe_clients.get_client(order.currency)
+    if client is None:
+        return unsupported_currency(order.currency)
+
+    totals = pricing.order_breakdown(order)
+    try:
+        secret = await order_client_secret(request, client, order, totals)
+    except stripe_guard.UNAVAILABLE_ERRORS as e:
+        return stripe_guard.unavailable(e)
+    except stripe.StripeError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse({"clientSecret": secret})
@@ -1,21 +1,60 @@
 import stripe
 from django.conf import settings
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, render
+from django.views.decorators.cache import never_cache
 
+from . import checkout, page_cache, payment_intents, pricing, stripe_clients, stripe_guard
 from .models import Item, Order
 
 
+def lazy_secret():
+    return settings.INTENT_SECRET_MODE == "lazy"
+
+
+def order_queryset():
+    return Order.objects.select_related("tax", "discount").prefetch_related("lines__item")
+
+
+def unsupported_currency(currency):
+    return JsonResponse({"error": f"Unsupported currency: {currency}"}, status=400)
+
+
+def item_client_secret(request, client, item):
+    return payment_intents.get_client_secret(
+        request,
+        client,
+        "item",
+        item.id,
+        item.currency,
+        amount=pricing.to_minor(item.price),
+        metadata={"item_id": str(item.id)},
+    )
+
+
+def order_client_secret(request, client, order, totals):
+    return payment_intents.get_client_secret(
+        request,
+        client,
+        "order",
+        order.id,
+        order.currency,
+        amount=totals["amount"],
+        metadata={"order_id": str(order.id)},
+        content=checkout.order_intent_content(order),
+    )
+
+
+@stripe_guard.budget
 def item_detail_intent(request, id):
     item = get_object_or_404(Item, pk=id)
     currency = item.currency
 
-    stripe.api_key = settings.STRIPE_KEYS[currency]["secret"]
+    client = stripe_clients.get_client(currency)
+    if client is None:
+        return unsupported_currency(currency)
 
-    intent = stripe.PaymentIntent.create(
-        amount=int(item.price * 100),
-        currency=currency.lower(),
-        metadata={"item_id": str(item.id)},
-    )
+    client_secret = None if lazy_secret() else item_client_secret(request, client, item)
 
     return render(
         request,
@@ -23,44 +62,45 @@ def item_detail_intent(request, id):
         {
             "item": item,
             "stripe_public_key": settings.STRIPE_KEYS[currency]["public"],
-            "client_secret": intent.client_secret,
+            "client_secret": client_secret,
         },
     )
 
 
-def payment_success_item_intent(request, id):
+@never_cache
+@stripe_guard.budget
+def item_intent_secret(request, id):
     item = get_object_or_404(Item, pk=id)
-    return render(request, "intent/items/payment_success_item_intent.html", {"item": item})
-
-
-def order_detail_intent(request, id):
-    order = get_object_or_404(
-        Order.objects.select_related("tax", "discount").prefetch_related("items"), pk=id
-    )
 
-    currency = order.currency
+    client = stripe_clients.get_client(item.currency)
+    if client is None:
+        return unsupported_currency(item.currency)
 
-    items_total = sum(item.price for item in order.items.all())
+    try:
+        secret = item_client_secret(request, client, item)
+    except stripe_guard.UNAVAILABLE_ERRORS as e:
+        return stripe_guard.unavailable(e)
+    except stripe.StripeError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse({"clientSecret": secret})
 
-    discount_percent = order.discount.percent if order.discount else 0
-    discount_amount = items_total * discount_percent / 100
 
-    subtotal_after_discount = items_total - discount_amount
+def payment_success_item_intent(request, id):
+    return page_cache.render_item_page(request, id, page_cache.PAYMENT_SUCCESS_INTENT)
 
-    tax_percent = order.tax.percent if order.tax else 0
-    tax_amount = subtotal_after_discount * tax_percent / 100
 
-    total_amount = subtotal_after_discount + tax_amount
+@stripe_guard.budget
+def order_detail_intent(request, id):
+    order = get_object_or_404(order_queryset(), pk=id)
 
-    amount = int(total_amount * 100)
+    currency = order.currency
 
-    stripe.api_key = settings.STRIPE_KEYS[currency]["secret"]
+    client = stripe_clients.get_client(currency)
+    if client is None:
+        return unsupported_currency(currency)
 
-    intent = stripe.PaymentIntent.create(
-        amount=amount,
-        currency=currency.lower(),
-        metadata={"order_id": str(order.id)},
-    )
+    totals = pricing.order_breakdown(order)
+    client_secret = None if lazy_secret() else order_client_secret(request, client, order, totals)
 
     return render(
         request,
@@ -68,18 +108,32 @@ def order_detail_intent(request, id):
         {
             "order": order,
             "stripe_public_key": settings.STRIPE_KEYS[currency]["public"],
-            "client_secret": intent.client_secret,
-            "items_total": items_total,
-            "discount_percent": discount_percent,
-            "discount_amount": discount_amount,
-            "tax_percent": tax_percent,
-            "tax_amount": tax_amount,
-            "total_amount": total_amount,
+            "client_secret": client_secret,
+            **totals,
             "currency": currency,
         },
     )
 
 
+@never_cache
+@stripe_guard.budget
+def order_intent_secret(request, id):
+    order = get_object_or_404(order_queryset(), pk=id)
+
+    client = stripe_clients.get_client(order.currency)
+    if client is None:
+        return unsupported_currency(order.currency)
+
+    totals = pricing.order_breakdown(order)
+    try:
+        secret = order_client_secret(request, client, order, totals)
+    except stripe_guard.UNAVAILABLE_ERRORS as e:
+        return stripe_guard.unavailable(e)
+    except stripe.StripeError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse({"clientSecret": secret})
+
+
 def payment_success_order_intent(request, id):
     order = get_object_or_404(Order, pk=id)
     return render(request, "intent/orders/payment_success_order_intent.html", {"order": order})
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+
+from . import perf
+
+
+@require_GET
+def metrics(request):
+    token = settings.METRICS_TOKEN
+    header = request.headers.get("Authorization", "")
+    if not token or not constant_time_compare(header, f"Bearer {token}"):
+        return HttpResponse("Invalid metrics token.", status=403, content_type="text/plain")
+    return HttpResponse(perf.exposition(), content_type="text/plain; version=0.0.4")
@@ -0,0 +1,21 @@
+import stripe
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from . import stripe_events
+
+
+@csrf_exempt
+@require_POST
+def stripe_webhook(request):
+    try:
+        event = stripe_events.verify_event(
+            request.body.decode(), request.headers.get("Stripe-Signature", "")
+        )
+    except (stripe.SignatureVerificationError, ValueError):
+        return HttpResponse(status=400)
+
+    # Fulfilment happens in the process_stripe_events worker.
+    stripe_events.enqueue(event)
+    return HttpResponse(status=200)
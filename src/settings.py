@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -19,22 +20,79 @@ load_dotenv()
 
 STRIPE_SECRET_KEY_USD = os.getenv("STRIPE_SECRET_KEY_USD")
 STRIPE_PUBLIC_KEY_USD = os.getenv("STRIPE_PUBLIC_KEY_USD")
+STRIPE_WEBHOOK_SECRET_USD = os.getenv("STRIPE_WEBHOOK_SECRET_USD")
 
 STRIPE_SECRET_KEY_RUB = os.getenv("STRIPE_SECRET_KEY_RUB")
 STRIPE_PUBLIC_KEY_RUB = os.getenv("STRIPE_PUBLIC_KEY_RUB")
+STRIPE_WEBHOOK_SECRET_RUB = os.getenv("STRIPE_WEBHOOK_SECRET_RUB")
 
 
 STRIPE_KEYS = {
     "USD": {
         "secret": STRIPE_SECRET_KEY_USD,
         "public": STRIPE_PUBLIC_KEY_USD,
+        "webhook": STRIPE_WEBHOOK_SECRET_USD,
     },
     "RUB": {
         "secret": STRIPE_SECRET_KEY_RUB,
         "public": STRIPE_PUBLIC_KEY_RUB,
+        "webhook": STRIPE_WEBHOOK_SECRET_RUB,
     },
 }
 
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "https://api.stripe.com")
+STRIPE_CONNECT_TIMEOUT = float(os.getenv("STRIPE_CONNECT_TIMEOUT", 5))
+STRIPE_READ_TIMEOUT = float(os.getenv("STRIPE_READ_TIMEOUT", 30))
+STRIPE_MAX_NETWORK_RETRIES = int(os.getenv("STRIPE_MAX_NETWORK_RETRIES", 2))
+STRIPE_WEBHOOK_TOLERANCE = int(os.getenv("STRIPE_WEBHOOK_TOLERANCE", 300))
+
+# Seconds all Stripe calls of one payment request may take together, retries
+# included (see myapp/stripe_guard.py). Past it the view answers 503.
+STRIPE_REQUEST_BUDGET = float(os.getenv("STRIPE_REQUEST_BUDGET", 8))
+# Per-account circuit breaker: THRESHOLD failures within WINDOW seconds open it
+# for COOLDOWN seconds. Its state lives in Redis (the redis service of
+# docker-compose-services.yml), so every worker and container opens and closes
+# the same breaker. DEBUG runs and the test suite keep it in a per-process
+# LocMem cache instead.
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+STRIPE_BREAKER_CACHE_ALIAS = "stripe"
+STRIPE_BREAKER_CACHE_BACKEND = os.getenv(
+    "STRIPE_BREAKER_CACHE_BACKEND",
+    "django.core.cache.backends.locmem.LocMemCache"
+    if os.getenv("DEBUG") or sys.argv[1:2] == ["test"]
+    else "django.core.cache.backends.redis.RedisCache",
+)
+STRIPE_BREAKER_THRESHOLD = int(os.getenv("STRIPE_BREAKER_THRESHOLD", 5))
+STRIPE_BREAKER_WINDOW = int(os.getenv("STRIPE_BREAKER_WINDOW", 30))
+STRIPE_BREAKER_COOLDOWN = int(os.getenv("STRIPE_BREAKER_COOLDOWN", 30))
+
+# "lazy" renders intent pages from local data and lets the page fetch the client
+# secret from /intent/.../secret/ once the buyer uses the card form; "inline" creates the
+# PaymentIntent while rendering the page.
+INTENT_SECRET_MODE = os.getenv("INTENT_SECRET_MODE", "lazy")
+
+# Bearer token for POST /api/orders/; the API refuses every request while unset.
+ORDERS_API_TOKEN = os.getenv("ORDERS_API_TOKEN")
+
+# Open PaymentIntents untouched this long are canceled by sweep_payment_intents.
+PAYMENT_INTENT_MAX_AGE = int(os.getenv("PAYMENT_INTENT_MAX_AGE", 24 * 3600))
+
+# Checkout Sessions are reused for identical item/order content. Stripe requires
+# expires_at to be 30 minutes to 24 hours after creation, so keep
+# CHECKOUT_SESSION_TTL - CHECKOUT_SESSION_REUSE_WINDOW above 30 minutes.
+CHECKOUT_SESSION_CACHE_ALIAS = "checkout"
+CHECKOUT_SESSION_TTL = int(os.getenv("CHECKOUT_SESSION_TTL", 3600))
+CHECKOUT_SESSION_REUSE_WINDOW = int(os.getenv("CHECKOUT_SESSION_REUSE_WINDOW", 600))
+CHECKOUT_SESSION_EXPIRY_MARGIN = int(os.getenv("CHECKOUT_SESSION_EXPIRY_MARGIN", 300))
+
+# Rendered item pages (see myapp/page_cache.py). Any cache backend works; point
+# PAGE_CACHE_BACKEND/PAGE_CACHE_LOCATION at a shared one to share pages across workers.
+PAGE_CACHE_ALIAS = "pages"
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", 3600))
+PAGE_CACHE_BACKEND = os.getenv(
+    "PAGE_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+)
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -67,6 +125,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "myapp.middleware.PerfMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -74,13 +133,28 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "myapp.middleware.ReplicaRoutingMiddleware",
+    "myapp.middleware.TraceRecordMiddleware",
 ]
 
+# Per-view timing histograms at /metrics (Bearer METRICS_TOKEN, refused while
+# unset). PERF_SAMPLE_RATE of the requests also get DB/Stripe/template timings
+# and a Server-Timing header; the rest cost two clock reads.
+PERF_METRICS = os.getenv("PERF_METRICS", "1") == "1"
+PERF_SAMPLE_RATE = float(os.getenv("PERF_SAMPLE_RATE", 1.0 if DEBUG else 0.01))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Set to a file path to record incoming requests as a JSONL trace for
+# ``manage.py loadtest --trace``.
+LOADTEST_TRACE_FILE = os.getenv("LOADTEST_TRACE_FILE")
+
 ROOT_URLCONF = "src.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates that reports render time to myapp.perf.
+        "BACKEND": "myapp.perf.TimedDjangoTemplates",
+        "NAME": "django",
         "DIRS": [],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -95,6 +169,12 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "src.wsgi.application"
 
+# "wsgi" runs gunicorn sync/gthread workers, "asgi" runs uvicorn workers with the
+# async checkout and intent views (see gunicorn.conf.py).
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi")
+
+ASYNC_VIEWS = SERVER_MODE == "asgi"
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -107,9 +187,103 @@ DATABASES = {
         "PASSWORD": os.getenv("POSTGRES_DB_PASS"),
         "HOST": os.getenv("POSTGRES_DB_HOST"),
         "PORT": os.getenv("POSTGRES_DB_PORT"),
+        # .iterator() in the bulk commands streams through server-side cursors;
+        # turn them off only behind a transaction-pooling proxy such as PgBouncer.
+        "DISABLE_SERVER_SIDE_CURSORS": os.getenv("POSTGRES_DISABLE_SERVER_SIDE_CURSORS") == "1",
+    }
+}
+
+# "pool" keeps a psycopg connection pool per worker process, "persistent" reuses
+# one connection per thread for CONN_MAX_AGE seconds, "off" connects per request.
+POSTGRES_CONNECTIONS = os.getenv("POSTGRES_CONNECTIONS", "pool")
+
+if POSTGRES_CONNECTIONS == "pool":
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.getenv("POSTGRES_POOL_MIN_SIZE", 2)),
+            "max_size": int(os.getenv("POSTGRES_POOL_MAX_SIZE", 10)),
+            "timeout": float(os.getenv("POSTGRES_POOL_TIMEOUT", 10)),
+            "max_idle": float(os.getenv("POSTGRES_POOL_MAX_IDLE", 300)),
+            "max_lifetime": float(os.getenv("POSTGRES_POOL_MAX_LIFETIME", 3600)),
+        }
     }
+elif POSTGRES_CONNECTIONS == "persistent":
+    DATABASES["default"]["CONN_MAX_AGE"] = int(os.getenv("POSTGRES_CONN_MAX_AGE", 60))
+
+if POSTGRES_CONNECTIONS in ("pool", "persistent"):
+    # A reused connection may have been dropped by PostgreSQL or a proxy meanwhile.
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = (
+        os.getenv("POSTGRES_CONN_HEALTH_CHECKS", "1") == "1"
+    )
+
+# Read replicas (comma-separated hosts), same credentials as the primary. Tests
+# mirror them onto the primary's test database.
+REPLICA_DATABASES = []
+for number, host in enumerate(filter(None, os.getenv("POSTGRES_REPLICA_HOSTS", "").split(",")), 1):
+    alias = f"replica{number}"
+    DATABASES[alias] = {**DATABASES["default"], "HOST": host.strip(), "TEST": {"MIRROR": "default"}}
+    REPLICA_DATABASES.append(alias)
+# The routing tests need a replica alias even when none is configured; it stays
+# out of REPLICA_DATABASES so other tests keep reading from the primary.
+if sys.argv[1:2] == ["test"]:
+    DATABASES.setdefault("replica1", {**DATABASES["default"], "TEST": {"MIRROR": "default"}})
+
+DATABASE_ROUTERS = ["myapp.db_routing.ReplicaRouter"]
+
+# GET views whose reads may go to a replica (admin changelists always may).
+REPLICA_VIEWS = [
+    "item_detail",
+    "order_detail",
+    "payment_success_item",
+    "payment_success_order",
+    "payment_success_item_intent",
+    "payment_success_order_intent",
+    "api_search_items",
+]
+# Views that start a checkout. They, and any request that writes, pin the browser
+# to the primary for REPLICA_PIN_SECONDS so the pages after checkout see the write.
+REPLICA_PIN_VIEWS = [
+    "buy_item",
+    "buy_order",
+    "item_detail_intent",
+    "order_detail_intent",
+    "item_intent_secret",
+    "order_intent_secret",
+]
+REPLICA_PIN_COOKIE = "db_primary"
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", 60))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "checkout": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "checkout-sessions",
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.getenv("CHECKOUT_SESSION_CACHE_SIZE", 10000)),
+        },
+    },
+    "pages": {
+        "BACKEND": PAGE_CACHE_BACKEND,
+        "LOCATION": os.getenv("PAGE_CACHE_LOCATION", "item-pages"),
+    },
+    "stripe": {
+        "BACKEND": STRIPE_BREAKER_CACHE_BACKEND,
+        "LOCATION": os.getenv(
+            "STRIPE_BREAKER_CACHE_LOCATION",
+            REDIS_URL if STRIPE_BREAKER_CACHE_BACKEND.endswith("RedisCache") else "stripe-breaker",
+        ),
+    },
 }
 
+if PAGE_CACHE_BACKEND.endswith("LocMemCache"):
+    CACHES["pages"]["OPTIONS"] = {"MAX_ENTRIES": int(os.getenv("PAGE_CACHE_SIZE", 5000))}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -149,6 +323,20 @@ STATIC_URL = "/static/"
 
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 
+# STATIC_MANIFEST=1 (set in the Dockerfile, which runs collectstatic) switches to
+# content-hashed names plus .gz/.br copies for nginx (myapp/storage.py). Without it, or
+# with DEBUG, the plain storage serves a fresh checkout that never ran collectstatic.
+STATIC_MANIFEST = os.getenv("STATIC_MANIFEST") == "1" and not DEBUG
+
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": "myapp.storage.CompressedManifestStaticFilesStorage"
+        if STATIC_MANIFEST
+        else "django.contrib.staticfiles.storage.StaticFilesStorage"
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 